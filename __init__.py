@@ -6,11 +6,10 @@ Módulos:
 - CTCO_plugin: Classe principal do plugin
 - ui_manager: Gerenciamento da interface do usuário
 - algorithms: Implementação dos algoritmos de processamento
+- kde: Núcleo NumPy de densidade (independente do QGIS)
 - utils: Utilitários e funções de validação
 """
 
-from .CTCO_plugin import CTCO
-
 # Metadados do plugin
 PLUGIN_NAME = "CTCO"
 PLUGIN_VERSION = "2.0.0"
@@ -20,4 +19,6 @@ PLUGIN_AUTHOR = "José Otavio Alves"
 # Função de inicialização do plugin
 def classFactory(iface):
     """Função obrigatória para plugins do QGIS"""
+    # Import tardio: processos de trabalho importam `kde` sem carregar o QGIS
+    from .CTCO_plugin import CTCO
     return CTCO(iface)
\ No newline at end of file
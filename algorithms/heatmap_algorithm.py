@@ -18,4 +18,21 @@ class HeatmapAlgorithm:
             layer: Camada de pontos para processar
             config: Dicionário de configuração opcional (raio, pixel, paleta, min/max)
         """
-        HeatmapService.run_heatmap(layer, config)
\ No newline at end of file
+        HeatmapService.run_heatmap(layer, config)
+
+    @staticmethod
+    def run_batch(variants, config=None):
+        """
+        Executa vários heatmaps (filtros e/ou camadas) numa grade comum
+
+        Os pontos de cada camada são lidos uma vez e todas as saídas ficam
+        alinhadas pixel a pixel, prontas para álgebra de rasters.
+
+        Args:
+            variants: Lista de BatchVariant (camada, filtro, nome)
+            config: Dicionário de configuração opcional (raio, pixel, paleta, pasta de saída)
+
+        Returns:
+            list: Camadas raster geradas
+        """
+        return HeatmapService.run_batch(variants, config)
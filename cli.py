@@ -0,0 +1,120 @@
+"""
+Linha de comando: heatmaps em lote a partir de um manifesto JSON ou YAML
+
+Uso (na pasta de plugins, com o Python do QGIS):
+
+    python -m CTCO.cli jobs.yaml --workers 4 --report relatorio.json
+
+Manifesto:
+
+    defaults:                 # parâmetros comuns (campos de HeatmapParameters)
+      radius: 500
+      pixel_size: 10
+    output_dir: saida         # opcional; relativo ao manifesto
+    jobs:
+      - name: janeiro
+        source: dados/ocorrencias.gpkg|layername=pontos
+        filter: "\"mes\" = 1"
+        output: janeiro.tif
+        parameters: {kernel: Triweight}
+
+Caminhos relativos partem da pasta do manifesto. O relatório (JSON) traz um
+registro por job com tempos de abertura, leitura, cálculo e total.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from .services.heatmap_engine import HeatmapEngine
+
+
+def _resolve(path, base):
+    """Caminho relativo ao manifesto; preserva o sufixo de URI OGR (|layername=...)."""
+    head, sep, tail = str(path).partition("|")
+    if not os.path.isabs(head):
+        head = os.path.normpath(os.path.join(base, head))
+    return head + sep + tail
+
+
+def load_manifest(path) -> list:
+    """
+    Lê o manifesto e devolve os jobs prontos para HeatmapEngine.run_many
+
+    Raises:
+        ValueError: Manifesto sem jobs ou job sem fonte/saída
+    """
+    with open(path, "r", encoding="utf-8") as fh:
+        text = fh.read()
+    if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Manifesto YAML requer o pacote PyYAML (ou use JSON)")
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    if not isinstance(manifest, dict) or not manifest.get('jobs'):
+        raise ValueError("Manifesto sem jobs")
+
+    base = os.path.dirname(os.path.abspath(path))
+    output_dir = _resolve(manifest.get('output_dir', "."), base)
+    defaults = dict(manifest.get('defaults') or {})
+    jobs = []
+    for i, entry in enumerate(manifest['jobs']):
+        if not entry.get('source') or not entry.get('output'):
+            raise ValueError(f"Job {i}: informe 'source' e 'output'")
+        jobs.append({
+            'index': i,
+            'name': entry.get('name', ""),
+            'source': _resolve(entry['source'], base),
+            'output': _resolve(entry['output'], output_dir),
+            'filter': entry.get('filter') or None,
+            'parameters': {**defaults, **(entry.get('parameters') or {})},
+        })
+    return jobs
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="ctco-heatmap", description="Heatmaps em lote (sem interface)")
+    parser.add_argument("manifest", help="Manifesto JSON ou YAML")
+    parser.add_argument("--workers", type=int, default=0, help="Processos (0 = todos os núcleos)")
+    parser.add_argument("--report", help="Relatório JSON (padrão: <manifesto>.report.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"[CTCO] Manifesto inválido: {e}", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    reports = HeatmapEngine.run_many(
+        jobs, workers=args.workers,
+        on_report=lambda r: print(f"[CTCO] Job {r['index']} {r['status']}: "
+                                  f"{r.get('output')} em {r.get('total_s', 0):.2f}s", file=sys.stderr),
+    )
+    wall = time.perf_counter() - start
+    failed = sum(1 for r in reports if r['status'] != "ok")
+    summary = {
+        'manifest': os.path.abspath(args.manifest),
+        'jobs': len(reports),
+        'failed': failed,
+        'wall_s': round(wall, 4),
+        'busy_s': round(sum(r.get('total_s', 0.0) for r in reports), 4),
+        'reports': reports,
+    }
+    report_path = args.report or os.path.splitext(args.manifest)[0] + ".report.json"
+    with open(report_path, "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2, ensure_ascii=False)
+    print(f"[CTCO] {len(reports) - failed}/{len(reports)} heatmaps em {wall:.2f}s; "
+          f"relatório em {report_path}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
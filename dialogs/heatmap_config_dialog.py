@@ -19,9 +19,17 @@ from qgis.PyQt.QtWidgets import (
     QFileDialog,
 )
 from qgis.PyQt.QtGui import QFontMetrics
+from qgis.PyQt.QtCore import QTimer, QVariant
+from qgis.core import QgsFieldProxyModel
+from qgis.gui import QgsFieldExpressionWidget
 
+from ..models.temporal_parameters import TIME_UNITS
+from ..services.bandwidth_service import METHOD_LABELS
 from ..services.color_service import ColorService
 
+# Previsões acima disso (segundos) aparecem em destaque
+SLOW_ESTIMATE_S = 60.0
+
 
 class HeatmapConfigDialog(QDialog):
     """Dialogo para configurar parâmetros do heatmap"""
@@ -36,6 +44,38 @@ class HeatmapConfigDialog(QDialog):
         self.radius_input.setRange(1, 10000)
         self.radius_input.setValue(100)
 
+        # Escolha do raio: manual, estimativa por densidade ou seletor estatístico
+        self.bandwidth_input = QComboBox()
+        for key, label in METHOD_LABELS.items():
+            self.bandwidth_input.addItem(label, userData=key)
+        self.bandwidth_input.setToolTip(
+            "Manual: usa o raio informado.\n"
+            "Automático: estimativa pela densidade média de pontos.\n"
+            "Silverman / Scott: regras de referência sobre a dispersão dos pontos.\n"
+            "Vizinho mais próximo: mediana da distância ao 10º vizinho.\n"
+            "Validação cruzada: raio de maior verossimilhança (leave-one-out).\n"
+            "Os seletores usam uma amostra estratificada e respeitam o filtro."
+        )
+        self.btn_estimate = QPushButton("Estimar")
+        self.btn_estimate.setToolTip("Calcula o raio pelo método escolhido e preenche o campo.")
+        self.btn_estimate.clicked.connect(self._estimate_radius)
+        self.bandwidth_label = QLabel("")
+
+        # KDE adaptativo: raio por ponto pela distância ao k-ésimo vizinho
+        self.adaptive_input = QCheckBox("Raio adaptativo")
+        self.adaptive_input.setToolTip(
+            "Cada ponto usa como raio a distância ao seu k-ésimo vizinho, até o raio\n"
+            "informado: áreas densas ficam nítidas e áreas esparsas continuam suaves."
+        )
+        self.adaptive_k_input = QSpinBox()
+        self.adaptive_k_input.setRange(1, 100)
+        self.adaptive_k_input.setValue(10)
+        self.adaptive_k_input.setPrefix("k = ")
+        self.adaptive_k_input.setEnabled(False)
+        self.adaptive_input.toggled.connect(self.adaptive_k_input.setEnabled)
+        # (método, filtro, raio) da última estimativa mostrada no diálogo
+        self._estimated = None
+
         self.pixel_input = QDoubleSpinBox()
         self.pixel_input.setDecimals(3)
         self.pixel_input.setRange(0.01, 1000.0)
@@ -54,10 +94,161 @@ class HeatmapConfigDialog(QDialog):
         default_index = self.palette_names.index("BCYR") if "BCYR" in self.palette_names else 0
         self.palette_input.setCurrentIndex(default_index)
 
+        # Motor de cálculo da densidade
+        self.engine_input = QComboBox()
+        self.engine_input.addItem("Automático (custo previsto)", userData="auto")
+        self.engine_input.addItem("Nativo (NumPy)", userData="native")
+        self.engine_input.addItem("FFT (raio grande / pixel pequeno)", userData="fft")
+        self.engine_input.addItem("Em blocos (memória limitada)", userData="tiled")
+        self.engine_input.addItem("Paralelo (blocos em vários núcleos)", userData="parallel")
+        self.engine_input.addItem("Processing (QGIS)", userData="processing")
+        self.engine_input.setToolTip(
+            "Automático: estima tempo e memória de cada motor (pontos, grade, raio, núcleos)\n"
+            "e usa o mais rápido que cabe no limite de memória; aprende com as execuções.\n"
+            "Nativo: rápido para a maioria dos casos.\n"
+            "FFT: custo depende só do tamanho da grade; indicado para raios grandes.\n"
+            "Em blocos: grava o GeoTIFF bloco a bloco, respeitando o limite de memória.\n"
+            "Paralelo: distribui os blocos entre processos (um por núcleo).\n"
+            "Processing: algoritmo original do QGIS."
+        )
+
+        self.memory_input = QSpinBox()
+        self.memory_input.setRange(64, 65536)
+        self.memory_input.setSingleStep(128)
+        self.memory_input.setValue(512)
+        self.memory_input.setSuffix(" MB")
+        self.memory_input.setToolTip("Memória máxima usada pelo cálculo em blocos.")
+
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(0, max(1, os.cpu_count() or 1))
+        self.workers_input.setValue(0)
+        self.workers_input.setSpecialValueText("Auto")
+        self.workers_input.setToolTip("Processos do motor paralelo (Auto = todos os núcleos).")
+
+        # Previsão antes de rodar: grade, GeoTIFF, carimbo e tempo do motor (modelo de custo)
+        self.cost_label = QLabel("")
+        self.cost_label.setWordWrap(True)
+        self.btn_fit_memory = QPushButton("Ajustar pixel à memória")
+        self.btn_fit_memory.setToolTip(
+            "Menor pixel cujo cálculo e GeoTIFF de saída cabem no limite de memória."
+        )
+        self.btn_fit_memory.clicked.connect(self._fit_pixel_to_memory)
+        self.btn_fit_time = QPushButton("Ajustar pixel ao tempo")
+        self.btn_fit_time.setToolTip("Menor pixel cujo tempo previsto cabe no limite ao lado.")
+        self.btn_fit_time.clicked.connect(self._fit_pixel_to_time)
+        self.fit_seconds_input = QSpinBox()
+        self.fit_seconds_input.setRange(1, 3600)
+        self.fit_seconds_input.setValue(10)
+        self.fit_seconds_input.setSuffix(" s")
+        # (pontos, extensão do filtro ou None) usados na previsão; sem filtro, os da camada
+        self._cost_inputs = None
+        try:
+            if self._layer is not None and hasattr(self._layer, 'featureCount'):
+                self._cost_inputs = (max(0, int(self._layer.featureCount())), None)
+        except Exception:
+            pass
+
+        # Peso: campo numérico ou expressão do QGIS (vazio = sem peso)
+        self.weight_input = QgsFieldExpressionWidget()
+        self.weight_input.setFilters(QgsFieldProxyModel.Numeric)
+        self.weight_input.setAllowEmptyFieldName(True)
+        if self._layer is not None and hasattr(self._layer, 'fields'):
+            self.weight_input.setLayer(self._layer)
+        self.weight_input.setField("")
+        self.weight_input.setToolTip("Campo numérico ou expressão usada como peso de cada ponto.")
+
+        self.weight_null_input = QComboBox()
+        self.weight_null_input.addItem("Nulo = 1", userData="one")
+        self.weight_null_input.addItem("Nulo: ignorar ponto", userData="drop")
+        self.weight_negative_input = QComboBox()
+        self.weight_negative_input.addItem("Negativo: manter", userData="keep")
+        self.weight_negative_input.addItem("Negativo = 0", userData="clip")
+        self.weight_negative_input.addItem("Negativo: ignorar ponto", userData="drop")
+
+        # CRS do cálculo para camadas em graus (motor nativo)
+        self.reproject_input = QComboBox()
+        self.reproject_input.addItem("Metros, CRS local (LAEA)", userData="local")
+        self.reproject_input.addItem("Metros, reprojetado para o CRS da camada", userData="warp")
+        self.reproject_input.addItem("Graus (aproximação pelo centro da camada)", userData="off")
+        self.reproject_input.setToolTip(
+            "Camadas em coordenadas geográficas são projetadas para uma LAEA centrada nos\n"
+            "pontos: o raio vale em metros em toda a extensão. O resultado fica nesse CRS\n"
+            "local ou é reprojetado de volta para o CRS da camada."
+        )
+        is_geographic = False
+        try:
+            is_geographic = bool(self._layer is not None and self._layer.crs().isGeographic())
+        except Exception:
+            pass
+        self.reproject_input.setEnabled(is_geographic)
+
+        # Separar por campo: raster multibanda (total + uma banda por categoria)
+        self.split_input = QComboBox()
+        self.split_input.addItem("(não separar)", userData="")
+        try:
+            for fld in (self._layer.fields() if self._layer is not None else []):
+                self.split_input.addItem(fld.name(), userData=fld.name())
+        except Exception:
+            pass
+        self.split_input.setToolTip(
+            "Calcula a densidade de cada valor do campo numa única passada e grava um\n"
+            "raster com a banda 1 = total e uma banda por categoria (até 32)."
+        )
+
+        # Série temporal: um quadro (banda) por janela deslizante de um campo de data/hora
+        self.time_field_input = QComboBox()
+        self.time_field_input.addItem("(sem série temporal)", userData="")
+        try:
+            for fld in (self._layer.fields() if self._layer is not None else []):
+                if fld.type() in (QVariant.Date, QVariant.DateTime):
+                    self.time_field_input.addItem(fld.name(), userData=fld.name())
+        except Exception:
+            pass
+        self.time_field_input.setToolTip(
+            "Gera um raster com uma banda por janela de tempo e liga as bandas ao\n"
+            "controlador temporal do QGIS (escala de cores fixa entre os quadros)."
+        )
+        self.time_window_input = QDoubleSpinBox()
+        self.time_window_input.setDecimals(1)
+        self.time_window_input.setRange(0.1, 100000.0)
+        self.time_window_input.setValue(7.0)
+        self.time_window_input.setToolTip("Largura da janela de cada quadro")
+        self.time_step_input = QDoubleSpinBox()
+        self.time_step_input.setDecimals(1)
+        self.time_step_input.setRange(0.1, 100000.0)
+        self.time_step_input.setValue(1.0)
+        self.time_step_input.setToolTip("Passo entre o início de quadros consecutivos")
+        self.time_unit_input = QComboBox()
+        for unit in TIME_UNITS:
+            self.time_unit_input.addItem(unit, userData=unit)
+        self.time_unit_input.setCurrentIndex(self.time_unit_input.findData("dias"))
+        self.time_mode_input = QComboBox()
+        self.time_mode_input.addItem("Janela deslizante", userData="window")
+        self.time_mode_input.addItem("Cubo STKDE", userData="stkde")
+        self.time_mode_input.setToolTip(
+            "Janela deslizante: cada quadro soma os pontos da janela [início, início + janela).\n"
+            "Cubo STKDE: kernel espaço x tempo; cada banda é uma fatia a cada passo e o\n"
+            "valor ao lado vira a largura de banda temporal (pesa os pontos pela distância no tempo)."
+        )
+        self.time_window_label = QLabel("janela")
+        self._update_time_inputs()
+        self.time_field_input.currentIndexChanged.connect(self._update_time_inputs)
+        self.time_mode_input.currentIndexChanged.connect(self._update_time_inputs)
+
         # Filtro (experto) texto
         self.filter_input = QLineEdit()
         self.filter_input.setPlaceholderText("Ex.: \"tipo\" = 'escola' AND score > 3")
 
+        # Contagem ao vivo dos pontos que passam no filtro (com atraso ao digitar)
+        self.match_label = QLabel("")
+        # Antes da primeira leitura da camada a contagem só roda sob pedido (link no rótulo)
+        self.match_label.linkActivated.connect(lambda _link: self._update_match_count(force=True))
+        self._count_timer = QTimer(self)
+        self._count_timer.setSingleShot(True)
+        self._count_timer.setInterval(300)
+        self._count_timer.timeout.connect(self._update_match_count)
+        self.filter_input.textChanged.connect(lambda _text: self._count_timer.start())
+
         # Construtor de filtro (anti-erros)
         self.field_combo = QComboBox()
         self.op_combo = QComboBox()
@@ -104,6 +295,17 @@ class HeatmapConfigDialog(QDialog):
         row.addWidget(self.pixel_input)
         form.addRow(row)
 
+        bandwidth_row = QHBoxLayout()
+        bandwidth_row.addWidget(self.bandwidth_input, stretch=1)
+        bandwidth_row.addWidget(self.btn_estimate)
+        form.addRow("Raio por", bandwidth_row)
+        form.addRow("", self.bandwidth_label)
+        adaptive_row = QHBoxLayout()
+        adaptive_row.addWidget(self.adaptive_input)
+        adaptive_row.addWidget(self.adaptive_k_input)
+        adaptive_row.addStretch(1)
+        form.addRow("", adaptive_row)
+
         row2 = QHBoxLayout()
         row2.addWidget(QLabel("Transparência (%)"))
         row2.addWidget(self.transparent_input)
@@ -111,6 +313,39 @@ class HeatmapConfigDialog(QDialog):
         row2.addWidget(QLabel("Paleta"))
         row2.addWidget(self.palette_input)
         form.addRow(row2)
+        engine_row = QHBoxLayout()
+        engine_row.addWidget(self.engine_input, stretch=1)
+        engine_row.addWidget(QLabel("Memória"))
+        engine_row.addWidget(self.memory_input)
+        engine_row.addWidget(QLabel("Processos"))
+        engine_row.addWidget(self.workers_input)
+        form.addRow("Motor", engine_row)
+        form.addRow("Previsão", self.cost_label)
+        fit_row = QHBoxLayout()
+        fit_row.addWidget(self.btn_fit_memory)
+        fit_row.addWidget(self.btn_fit_time)
+        fit_row.addWidget(self.fit_seconds_input)
+        fit_row.addStretch(1)
+        form.addRow("", fit_row)
+
+        form.addRow("CRS do cálculo", self.reproject_input)
+
+        weight_row = QHBoxLayout()
+        weight_row.addWidget(self.weight_input, stretch=1)
+        weight_row.addWidget(self.weight_null_input)
+        weight_row.addWidget(self.weight_negative_input)
+        form.addRow("Peso", weight_row)
+        form.addRow("Separar por", self.split_input)
+
+        time_row = QHBoxLayout()
+        time_row.addWidget(self.time_field_input, stretch=1)
+        time_row.addWidget(self.time_mode_input)
+        time_row.addWidget(self.time_window_label)
+        time_row.addWidget(self.time_window_input)
+        time_row.addWidget(QLabel("passo"))
+        time_row.addWidget(self.time_step_input)
+        time_row.addWidget(self.time_unit_input)
+        form.addRow("Série temporal", time_row)
 
         # Linha do construtor de filtro
         fb_row = QHBoxLayout()
@@ -127,6 +362,7 @@ class HeatmapConfigDialog(QDialog):
         self.operator_combo.setMaximumWidth(80)
         filter_row.addWidget(self.operator_combo)
         form.addRow("Filtro (expressão)", filter_row)
+        form.addRow("", self.match_label)
 
         # Pasta de saída opcional (vazio = temporário)
         out_row = QHBoxLayout()
@@ -138,6 +374,52 @@ class HeatmapConfigDialog(QDialog):
         out_row.addWidget(self.btn_browse_out)
         form.addRow("Pasta (opcional)", out_row)
 
+        self.use_cache_input = QCheckBox("Reutilizar resultado idêntico já calculado (cache)")
+        self.use_cache_input.setChecked(True)
+        self.use_cache_input.setToolTip(
+            "Mesma camada (sem alterações), filtro e parâmetros carregam o GeoTIFF guardado\n"
+            "em vez de recalcular. O cache persiste entre sessões do QGIS."
+        )
+        form.addRow("", self.use_cache_input)
+
+        self.background_input = QCheckBox("Calcular em segundo plano (tarefa cancelável)")
+        self.background_input.setChecked(True)
+        self.background_input.setToolTip(
+            "O cálculo nativo roda como tarefa do QGIS: o mapa continua utilizável, o\n"
+            "progresso aparece na barra de tarefas e vários heatmaps podem ser enfileirados."
+        )
+        form.addRow("", self.background_input)
+
+        self.live_input = QCheckBox("Ao vivo: atualizar o heatmap ao editar os pontos")
+        self.live_input.setToolTip(
+            "Mantém a grade em memória e soma/subtrai apenas o ponto incluído, movido ou\n"
+            "apagado na sessão de edição, redesenhando só a região alterada."
+        )
+        form.addRow("", self.live_input)
+
+        self.progressive_input = QCheckBox("Prévia progressiva (grossa → fina)")
+        self.progressive_input.setChecked(True)
+        self.progressive_input.setToolTip(
+            "Mostra em instantes uma versão de baixa resolução (pixel 8x maior) já com a\n"
+            "paleta, refinando em 4x e 2x até o resultado final substituir a prévia."
+        )
+        form.addRow("", self.progressive_input)
+
+        self.viewport_input = QCheckBox("Explorar: calcular só a área visível (resolução da tela)")
+        self.viewport_input.setToolTip(
+            "Recalcula a densidade da extensão atual do mapa a cada pan/zoom, no tamanho\n"
+            "de pixel da tela. O custo depende da tela, não da extensão dos dados."
+        )
+        form.addRow("", self.viewport_input)
+
+        # Previsão ao vivo: só aritmética sobre contagem e extensão, sem ler os pontos
+        for signal in (self.radius_input.valueChanged, self.pixel_input.valueChanged,
+                       self.engine_input.currentIndexChanged, self.memory_input.valueChanged,
+                       self.workers_input.valueChanged, self.adaptive_input.toggled,
+                       self.reproject_input.currentIndexChanged):
+            signal.connect(self._update_cost_estimate)
+        self._update_cost_estimate()
+
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
@@ -271,6 +553,134 @@ class HeatmapConfigDialog(QDialog):
             new_expr = f"{cur} {operator} {clause}"
         self.filter_input.setText(new_expr)
 
+    def _update_match_count(self, force=False):
+        """
+        Mostra quantos pontos passam no filtro atual (sem alterar a camada)
+
+        A contagem usa os arrays em cache da camada. Se eles ainda não foram
+        lidos, a leitura completa travaria o diálogo em fontes grandes: a
+        previsão usa a contagem do provedor e a contagem exata fica sob pedido.
+        """
+        if not self._layer or not hasattr(self._layer, 'fields'):
+            self.match_label.setText("")
+            return
+        expr = str(self.filter_input.text()).strip()
+        try:
+            from ..services.filter_service import FilterService
+            from ..services.point_array_service import PointArrayService
+            if not force and PointArrayService.cached(self._layer) is None:
+                self.match_label.setText("<a href=\"count\">Contar pontos</a>"
+                                         + (" que passam no filtro" if expr else " da camada"))
+                self._cost_inputs = (max(0, int(self._layer.featureCount())), None)
+                self._update_cost_estimate()
+                return
+            count = FilterService.count(self._layer, expr)
+            self.match_label.setText(f"{count} pontos" + (" passam no filtro" if expr else " na camada"))
+            self._cost_inputs = (count, FilterService.bounds(self._layer, expr) if expr else None)
+        except Exception as e:
+            self.match_label.setText(f"Filtro inválido: {e}")
+            self._cost_inputs = None
+        self._update_cost_estimate()
+
+    def _estimate_parameters(self):
+        """Parâmetros que pesam na previsão, com os valores atuais do diálogo."""
+        from ..models.heatmap_parameters import HeatmapParameters
+
+        return HeatmapParameters.from_dict({
+            **self._weight_config(),
+            "weight_null": str(self.weight_null_input.currentData() or "one"),
+            "weight_negative": str(self.weight_negative_input.currentData() or "keep"),
+            "radius": int(self.radius_input.value()),
+            "pixel_size": float(self.pixel_input.value()),
+            "engine": str(self.engine_input.currentData() or "auto"),
+            "memory_budget_mb": int(self.memory_input.value()),
+            "workers": int(self.workers_input.value()),
+            "adaptive_k": int(self.adaptive_k_input.value()) if self.adaptive_input.isChecked() else 0,
+            "reproject": str(self.reproject_input.currentData() or "local"),
+        })
+
+    def _update_cost_estimate(self, *args):
+        """Grade, GeoTIFF, carimbo e tempo previstos para os valores atuais (sem calcular)."""
+        if not self._layer or self._cost_inputs is None:
+            self.cost_label.setText("")
+            return
+        count, bounds = self._cost_inputs
+        try:
+            from ..services.engine_planner_service import EnginePlanner
+            info = EnginePlanner.preview(self._layer, self._estimate_parameters(), count, bounds)
+        except Exception as e:
+            self.cost_label.setText(f"Previsão indisponível: {e}")
+            self.cost_label.setStyleSheet("")
+            return
+        seconds = info['seconds']
+        duration = f"{seconds:.1f} s" if seconds < 60 else f"{seconds / 60.0:.0f} min"
+        engine = self.engine_input.itemText(self.engine_input.findData(info['engine'])) or info['engine']
+        warn = not info['fits'] or seconds > SLOW_ESTIMATE_S
+        self.cost_label.setText(
+            ("⚠️ " if warn else "")
+            + f"Grade {info['cols']} x {info['rows']} ({info['cols'] * info['rows'] / 1e6:.1f} Mpx), "
+            f"GeoTIFF {info['raster_mb']:.0f} MB, carimbo {info['footprint_px']} px "
+            f"(~{info['footprint_cells']} células); {engine}: ~{duration}, {info['memory_mb']:.0f} MB"
+        )
+        self.cost_label.setStyleSheet("color: #c0392b;" if warn else "")
+
+    def _fit_pixel(self, **limits):
+        """Troca o pixel pelo menor que cabe nos limites previstos."""
+        if not self._layer or self._cost_inputs is None:
+            return
+        count, bounds = self._cost_inputs
+        try:
+            from ..services.engine_planner_service import EnginePlanner
+            pixel = EnginePlanner.fit_pixel_size(self._layer, self._estimate_parameters(), count, bounds,
+                                                 min_pixel=self.pixel_input.minimum(), **limits)
+        except Exception as e:
+            self.cost_label.setText(f"Não foi possível ajustar o pixel: {e}")
+            return
+        self.pixel_input.setValue(max(self.pixel_input.minimum(), min(self.pixel_input.maximum(), pixel)))
+
+    def _fit_pixel_to_memory(self):
+        budget = float(self.memory_input.value())
+        self._fit_pixel(max_memory_mb=budget, max_raster_mb=budget)
+
+    def _fit_pixel_to_time(self):
+        self._fit_pixel(max_seconds=float(self.fit_seconds_input.value()))
+
+    def _estimate_radius(self):
+        """Calcula o raio pelo método escolhido e informa valor, amostra e tempo."""
+        method = str(self.bandwidth_input.currentData() or "fixed")
+        if method == "fixed" or not self._layer or not hasattr(self._layer, 'fields'):
+            self.bandwidth_label.setText("")
+            return
+        expr = str(self.filter_input.text()).strip() or None
+        try:
+            if method == "auto":
+                from ..services.filter_service import FilterService
+                from ..services.heatmap_utils import estimate_dynamic_radius
+                radius = estimate_dynamic_radius(self._layer, FilterService.count(self._layer, expr),
+                                                 FilterService.bounds(self._layer, expr))
+                detail = "densidade média"
+            else:
+                from ..services.bandwidth_service import BandwidthService
+                radius, info = BandwidthService.estimate(self._layer, method, expr)
+                detail = f"amostra de {info['sample']} de {info['points']} pontos, {info['seconds']:.2f}s"
+        except Exception as e:
+            self.bandwidth_label.setText(f"Não foi possível estimar o raio: {e}")
+            return
+        value = max(self.radius_input.minimum(), min(self.radius_input.maximum(), int(round(radius))))
+        self.radius_input.setValue(value)
+        self._estimated = (method, expr, value)
+        self.bandwidth_label.setText(
+            f"{METHOD_LABELS.get(method, method)}: {radius:.1f} m ({detail})"
+        )
+
+    def _bandwidth_config(self) -> str:
+        """Método do raio; uma estimativa já feita no diálogo vira raio manual."""
+        method = str(self.bandwidth_input.currentData() or "fixed")
+        expr = str(self.filter_input.text()).strip() or None
+        if self._estimated == (method, expr, int(self.radius_input.value())):
+            return "fixed"
+        return method
+
     def _resize_combo_popup_to_fit(self, combo: QComboBox, texts):
         """Ajusta a largura do popup do combo para caber o maior texto."""
         try:
@@ -285,17 +695,61 @@ class HeatmapConfigDialog(QDialog):
         except Exception:
             pass
 
+    def _weight_config(self) -> dict:
+        """Campo ou expressão de peso escolhidos no widget."""
+        try:
+            name, is_expression, is_valid = self.weight_input.currentField()
+        except Exception:
+            return {"weight_field": "", "weight_expression": ""}
+        if not name or not is_valid:
+            return {"weight_field": "", "weight_expression": ""}
+        if is_expression:
+            return {"weight_field": "", "weight_expression": str(name)}
+        return {"weight_field": str(name), "weight_expression": ""}
+
     def get_config(self) -> dict:
         return {
+            **self._weight_config(),
+            "weight_null": str(self.weight_null_input.currentData() or "one"),
+            "weight_negative": str(self.weight_negative_input.currentData() or "keep"),
             "radius": int(self.radius_input.value()),
+            "bandwidth": self._bandwidth_config(),
+            "reproject": str(self.reproject_input.currentData() or "local"),
+            "adaptive_k": int(self.adaptive_k_input.value()) if self.adaptive_input.isChecked() else 0,
             "pixel_size": float(self.pixel_input.value()),
             "palette": str(self.palette_input.currentText()),
+            "engine": str(self.engine_input.currentData() or "auto"),
+            "memory_budget_mb": int(self.memory_input.value()),
+            "workers": int(self.workers_input.value()),
+            "split_field": str(self.split_input.currentData() or "") or None,
+            "time_field": str(self.time_field_input.currentData() or "") or None,
+            "time_window": float(self.time_window_input.value()),
+            "time_step": float(self.time_step_input.value()),
+            "time_unit": str(self.time_unit_input.currentData() or "dias"),
+            "time_mode": str(self.time_mode_input.currentData() or "window"),
+            "time_bandwidth": (float(self.time_window_input.value())
+                               if self.time_mode_input.currentData() == "stkde" else None),
             "filter_expr": str(self.filter_input.text()).strip() or None,
             "output_dir": str(self.output_dir_input.text()).strip() or None,
             "output_filename": str(self._chosen_filename).strip() if self._chosen_filename else None,
-            "transparent": int(self.transparent_input.value())
+            "transparent": int(self.transparent_input.value()),
+            "use_cache": bool(self.use_cache_input.isChecked()),
+            "background": bool(self.background_input.isChecked()),
+            "live": bool(self.live_input.isChecked()),
+            "progressive": bool(self.progressive_input.isChecked()),
+            "viewport": bool(self.viewport_input.isChecked())
         }
 
+    def _update_time_inputs(self, *args):
+        enabled = bool(self.time_field_input.currentData())
+        for widget in (self.time_window_input, self.time_step_input, self.time_unit_input,
+                       self.time_mode_input):
+            widget.setEnabled(enabled)
+        stkde = self.time_mode_input.currentData() == "stkde"
+        self.time_window_label.setText("banda" if stkde else "janela")
+        self.time_window_input.setToolTip("Largura de banda temporal do kernel" if stkde
+                                          else "Largura da janela de cada quadro")
+
     def _choose_output_dir(self):
         try:
             # Abre diálogo de salvar arquivo permitindo informar o nome no explorador
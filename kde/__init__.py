@@ -0,0 +1,9 @@
+"""
+Núcleo numérico (NumPy) de estimativa de densidade por kernel
+Não depende do QGIS: pode ser importado em processos de trabalho e scripts
+"""
+
+from .grid import KdeGrid
+from .engine import KdeEngine
+
+__all__ = ['KdeGrid', 'KdeEngine']
@@ -0,0 +1,116 @@
+"""
+KDE adaptativo: raio de cada ponto pela distância ao k-ésimo vizinho
+
+Ideia central:
+- O raio de cada ponto é a distância ao seu k-ésimo vizinho (GridIndex sobre o
+  array de coordenadas), limitado a [raio / MAX_RATIO, raio]: no centro denso o
+  carimbo encolhe, na periferia esparsa ele chega ao raio informado.
+- Os raios são quantizados em LEVELS_PER_OCTAVE degraus por oitava abaixo do
+  raio informado; cada degrau é um `KdeEngine.splat` com raio fixo. Assim os
+  carimbos continuam vindo do FOOTPRINT_CACHE (e o degrau do próprio raio é o
+  mesmo carimbo do KDE de raio fixo) e o custo fica perto do KDE comum: cada
+  ponto é carimbado uma vez, com um carimbo menor ou igual ao fixo.
+- Com saída bruta (pico 1), o carimbo de raio r recebe o fator (R / r)^2 para
+  que cada ponto contribua a mesma massa que no raio R informado.
+"""
+
+import numpy as np
+
+from .engine import KdeEngine
+from .grid import KdeGrid
+from .kernels import OUTPUT_RAW, normalize_kernel
+from .spatial_index import GridIndex
+
+DEFAULT_K = 10
+LEVELS_PER_OCTAVE = 4
+# Menor raio = raio informado / MAX_RATIO
+MAX_RATIO = 16.0
+
+
+def adaptive_radii(xs, ys, k: int, radius: float, pixel_size: float, index=None) -> np.ndarray:
+    """
+    Raio por ponto: distância ao k-ésimo vizinho limitada ao intervalo permitido
+
+    Args:
+        xs, ys: Coordenadas dos pontos
+        k: Ordem do vizinho
+        radius: Raio máximo (o raio informado pelo usuário)
+        pixel_size: Tamanho do pixel (o raio nunca fica abaixo de 1 pixel)
+        index: GridIndex já construído sobre xs/ys (opcional)
+
+    Returns:
+        np.ndarray: Raios (float64), um por ponto
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    low = min(float(radius), max(float(pixel_size), float(radius) / MAX_RATIO))
+    if xs.size <= 1:
+        return np.full(xs.size, float(radius))
+    index = index if index is not None else GridIndex(xs, ys)
+    k = max(1, min(int(k), xs.size - 1))
+    distances = index.knn_distance(xs, ys, k, exclude_self=True, max_distance=float(radius))
+    return np.clip(distances, low, float(radius))
+
+
+def quantize_radii(radii, radius: float, levels_per_octave: int = LEVELS_PER_OCTAVE):
+    """
+    Agrupa raios em degraus geométricos abaixo do raio máximo
+
+    Cada raio é arredondado para o degrau R * 2^(-j / levels_per_octave) mais
+    próximo (em escala log), sem passar de R.
+
+    Returns:
+        tuple: (raios dos degraus, índice do degrau de cada ponto)
+    """
+    radius = float(radius)
+    ratio = radius / np.maximum(np.asarray(radii, dtype=np.float64), 1e-300)
+    steps = np.maximum(np.rint(levels_per_octave * np.log2(ratio)), 0).astype(np.int64)
+    levels = np.unique(steps)
+    step_radii = radius * 2.0 ** (-levels / float(levels_per_octave))
+    return step_radii, np.searchsorted(levels, steps)
+
+
+def adaptive_density(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+                     output_value: int = OUTPUT_RAW, decay: float = 0.0, k: int = DEFAULT_K,
+                     radii=None, progress=None):
+    """
+    Densidade com raio variável por ponto (carimbos agrupados por degrau)
+
+    Args:
+        xs, ys: Coordenadas dos pontos
+        grid: Grade de saída (montada com o raio máximo)
+        radius: Raio máximo
+        kernel, weights, output_value, decay: Como em KdeEngine.splat
+        k: Ordem do vizinho que define o raio de cada ponto
+        radii: Raios por ponto já calculados (opcional; senão usa adaptive_radii)
+        progress: Como em KdeEngine.splat (fração sobre todos os pontos)
+
+    Returns:
+        np.ndarray: Densidade (rows, cols) em float64
+    """
+    kernel = normalize_kernel(kernel)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if radii is None:
+        radii = adaptive_radii(xs, ys, k, radius, grid.pixel_size)
+    step_radii, step_of = quantize_radii(radii, radius)
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)
+
+    density = np.zeros(grid.shape, dtype=np.float64)
+    done = 0
+    for step, step_radius in enumerate(step_radii):
+        members = np.flatnonzero(step_of == step)
+        step_progress = None
+        if progress is not None:
+            # Fração do degrau convertida para a fração do total de pontos
+            step_progress = (lambda f, before=done, size=members.size:
+                             progress((before + f * size) / xs.size))
+        group_w = None if w is None else w[members]
+        if int(output_value) == OUTPUT_RAW and step_radius < radius:
+            # Mesma massa por ponto que o carimbo de raio R
+            scale = (float(radius) / step_radius) ** 2
+            group_w = np.full(members.size, scale) if group_w is None else group_w * scale
+        KdeEngine.splat(xs[members], ys[members], grid, float(step_radius), kernel, group_w,
+                        output_value, decay, out=density, progress=step_progress)
+        done += members.size
+    return density
@@ -0,0 +1,457 @@
+"""
+Motor nativo (NumPy) de estimativa de densidade por kernel
+
+Ideia central:
+- Coordenadas chegam como arrays contíguos (uma leitura da camada).
+- Cada ponto usa um carimbo (footprint) pré-calculado para o seu deslocamento
+  sub-pixel; os carimbos são somados na grade com adições vetorizadas.
+- Carimbos vêm do cache LRU `FOOTPRINT_CACHE` e são reaproveitados entre execuções.
+
+Tolerância em relação ao Processing (`qgis:heatmapkerneldensityestimation`):
+- Mesma grade (extensão + raio, `ceil(lado/pixel)+1`) e mesmas fórmulas de kernel.
+- Cada ponto é deslocado no máximo pixel/(2*B) por eixo, com B subdivisões do
+  pixel por eixo. O erro por pixel é ~ 1,4 / (B * raio/pixel) do pico de um
+  ponto (epanechnikov, o de maior inclinação); B cresce com raios de poucos
+  pixels (`subpixel_buckets`: 16 em raio/pixel = 3, 4 a partir de ~12) para
+  mantê-lo abaixo de 3% nos kernels contínuos (quartic, triweight,
+  epanechnikov, triangular). Com raio abaixo de ~1,5 pixel o teto de
+  subdivisões é atingido e o erro passa disso (aviso no cálculo nativo). A massa
+  total (soma da grade) difere menos de 0,1%. No kernel uniforme, pixels
+  exatamente na borda do raio podem entrar ou sair do carimbo (diferença de até
+  1 contribuição nesses pixels).
+"""
+
+import numpy as np
+
+from .grid import KdeGrid
+from .kernels import (
+    FOOTPRINT_CACHE,
+    OUTPUT_RAW,
+    footprint_extent,
+    normalize_kernel,
+    subpixel_buckets,
+)
+
+# Número máximo de células (pontos x carimbo) processadas por lote
+BATCH_CELLS = 4_000_000
+
+ENGINE_NATIVE = "native"
+ENGINE_FFT = "fft"
+ENGINE_PROCESSING = "processing"
+ENGINE_TILED = "tiled"
+ENGINE_PARALLEL = "parallel"
+
+# Lado do bloco interno do GeoTIFF; blocos de cálculo são múltiplos dele
+TIFF_BLOCK = 256
+
+# Passadas de prévia (múltiplos do pixel pedido), da mais grossa para a mais fina
+PROGRESSIVE_FACTORS = (8, 4, 2)
+
+
+class KdeCancelled(Exception):
+    """Cálculo interrompido pelo callback de progresso (cancelamento cooperativo)."""
+
+
+def _next_fast_len(n: int) -> int:
+    """Menor inteiro >= n cujos fatores primos são 2, 3 ou 5 (FFT rápida)."""
+    n = max(1, int(n))
+    best = None
+    p5 = 1
+    while p5 < 2 * n:
+        p35 = p5
+        while p35 < 2 * n:
+            p = p35
+            while p < n:
+                p *= 2
+            if best is None or p < best:
+                best = p
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+class KdeEngine:
+    """Cálculo de densidade sobre arrays de coordenadas, sem dependência do QGIS."""
+
+    @staticmethod
+    def grid_for_points(xs, ys, radius: float, pixel_size: float) -> KdeGrid:
+        """Cria a grade de saída no layout do Processing a partir dos pontos."""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if xs.size == 0:
+            raise ValueError("Nenhum ponto para calcular a grade")
+        return KdeGrid.from_bounds(
+            float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()),
+            float(radius), float(pixel_size)
+        )
+
+    @staticmethod
+    def _accumulate(flat, idx, vals):
+        """Soma `vals` em `flat[idx]` escolhendo a rotina mais barata para o volume."""
+        if idx.size == 0:
+            return
+        if idx.size * 4 >= flat.size:
+            flat += np.bincount(idx, weights=vals, minlength=flat.size)
+        else:
+            np.add.at(flat, idx, vals)
+
+    @staticmethod
+    def splat(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+              output_value: int = OUTPUT_RAW, decay: float = 0.0, out=None,
+              batch_cells: int = BATCH_CELLS, progress=None, bands=None):
+        """
+        Soma os carimbos de kernel de todos os pontos na grade
+
+        Args:
+            xs, ys: Coordenadas dos pontos (unidades do mapa da grade)
+            grid: Grade de saída
+            radius: Raio do kernel (unidades do mapa)
+            kernel: Índice ou nome do kernel
+            weights: Pesos por ponto (None = peso 1)
+            output_value: 0 = bruto, 1 = escalado
+            decay: Decaimento do kernel triangular
+            out: Array (rows, cols) float64 existente para acumular (opcional)
+            batch_cells: Limite de células temporárias por lote (controla memória)
+            progress: Chamado como progress(fração) a cada lote; pode lançar
+                KdeCancelled para interromper
+            bands: Banda (int >= 0) de cada ponto; com ela a saída é
+                (n_bandas, rows, cols) e cada ponto soma só na própria banda,
+                numa única passada sobre os pontos
+
+        Returns:
+            np.ndarray: Densidade (rows, cols) em float64, ou (n_bandas, rows, cols)
+        """
+        kernel = normalize_kernel(kernel)
+        if bands is not None:
+            bands = np.asarray(bands, dtype=np.int64)
+        if out is None:
+            n_bands = int(bands.max()) + 1 if bands is not None and bands.size else 1
+            out = np.zeros(grid.shape if bands is None else (n_bands,) + grid.shape, dtype=np.float64)
+        flat = out.reshape(-1)
+
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if xs.size == 0:
+            return out
+        w = None if weights is None else np.asarray(weights, dtype=np.float64)
+
+        # Posição fracionária de cada ponto em pixels (origem no canto superior esquerdo)
+        col_f = (xs - grid.x_min) / grid.pixel_size
+        row_f = (grid.y_max - ys) / grid.pixel_size
+        col0 = np.floor(col_f)
+        row0 = np.floor(row_f)
+        buckets = subpixel_buckets(radius, grid.pixel_size)
+        bx = np.minimum(((col_f - col0) * buckets).astype(np.int64), buckets - 1)
+        by = np.minimum(((row_f - row0) * buckets).astype(np.int64), buckets - 1)
+        col0 = col0.astype(np.int64)
+        row0 = row0.astype(np.int64)
+        bucket = by * buckets + bx
+
+        # Pontos cujo carimbo inteiro cabe na grade dispensam a máscara de borda
+        half = footprint_extent(radius, grid.pixel_size)
+        interior = ((row0 >= half) & (row0 < grid.rows - half)
+                    & (col0 >= half) & (col0 < grid.cols - half))
+        base = row0 * grid.cols + col0
+        # Deslocamento da banda de cada ponto na saída achatada
+        band_off = None if bands is None else bands * (grid.rows * grid.cols)
+        if band_off is not None:
+            base = base + band_off
+
+        order = np.argsort(bucket, kind="stable")
+        sorted_buckets = bucket[order]
+        starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+        ends = np.r_[starts[1:], sorted_buckets.size]
+
+        done = 0
+        for start, end in zip(starts, ends):
+            fp = FOOTPRINT_CACHE.get(kernel, radius, grid.pixel_size, int(sorted_buckets[start]),
+                                     output_value, decay)
+            if fp.values.size == 0:
+                continue
+            doff = fp.drows * grid.cols + fp.dcols
+            step = max(1, int(batch_cells) // fp.values.size)
+            members = order[start:end]
+            inner = members[interior[members]]
+            border = members[~interior[members]]
+
+            for i in range(0, inner.size, step):
+                sel = inner[i:i + step]
+                idx = (base[sel][:, None] + doff[None, :]).ravel()
+                if w is None:
+                    vals = np.tile(fp.values, sel.size)
+                else:
+                    vals = (w[sel][:, None] * fp.values[None, :]).ravel()
+                KdeEngine._accumulate(flat, idx, vals)
+                done += sel.size
+                if progress is not None:
+                    progress(done / xs.size)
+
+            for i in range(0, border.size, step):
+                sel = border[i:i + step]
+                rr = row0[sel][:, None] + fp.drows[None, :]
+                cc = col0[sel][:, None] + fp.dcols[None, :]
+                valid = (rr >= 0) & (rr < grid.rows) & (cc >= 0) & (cc < grid.cols)
+                if w is None:
+                    vals = np.broadcast_to(fp.values[None, :], rr.shape)
+                else:
+                    vals = w[sel][:, None] * fp.values[None, :]
+                idx = rr * grid.cols + cc
+                if band_off is not None:
+                    idx += band_off[sel][:, None]
+                KdeEngine._accumulate(flat, idx[valid], vals[valid])
+                done += sel.size
+                if progress is not None:
+                    progress(done / xs.size)
+        return out
+
+    @staticmethod
+    def footprint_window(xs, ys, grid: KdeGrid, radius: float):
+        """
+        Janela da grade afetada pelos carimbos dos pontos (região "suja")
+
+        Returns:
+            tuple: (linha inicial, linha final, coluna inicial, coluna final) com
+            fim exclusivo, recortada à grade; None se nenhum pixel é afetado
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if xs.size == 0:
+            return None
+        half = footprint_extent(radius, grid.pixel_size)
+        col0 = int(np.floor((xs.min() - grid.x_min) / grid.pixel_size)) - half
+        col1 = int(np.floor((xs.max() - grid.x_min) / grid.pixel_size)) + half + 1
+        row0 = int(np.floor((grid.y_max - ys.max()) / grid.pixel_size)) - half
+        row1 = int(np.floor((grid.y_max - ys.min()) / grid.pixel_size)) + half + 1
+        row0, row1 = max(0, row0), min(grid.rows, row1)
+        col0, col1 = max(0, col0), min(grid.cols, col1)
+        if row0 >= row1 or col0 >= col1:
+            return None
+        return row0, row1, col0, col1
+
+    @staticmethod
+    def bin_points(xs, ys, grid: KdeGrid, weights=None):
+        """
+        Distribui os pontos nos centros de pixel vizinhos (cloud-in-cell)
+
+        Cada ponto reparte seu peso entre os 4 centros de pixel mais próximos,
+        proporcionalmente à distância, preservando a massa total.
+
+        Returns:
+            np.ndarray: Grade (rows, cols) float64 com a massa dos pontos
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        w = np.ones_like(xs) if weights is None else np.asarray(weights, dtype=np.float64)
+        size = grid.rows * grid.cols
+
+        # Coordenadas relativas aos centros de pixel
+        col_c = (xs - grid.x_min) / grid.pixel_size - 0.5
+        row_c = (grid.y_max - ys) / grid.pixel_size - 0.5
+        c0 = np.floor(col_c).astype(np.int64)
+        r0 = np.floor(row_c).astype(np.int64)
+        fx = col_c - c0
+        fy = row_c - r0
+
+        bins = np.zeros(size, dtype=np.float64)
+        for dr, dc, share in (
+            (0, 0, (1.0 - fy) * (1.0 - fx)),
+            (0, 1, (1.0 - fy) * fx),
+            (1, 0, fy * (1.0 - fx)),
+            (1, 1, fy * fx),
+        ):
+            rr = r0 + dr
+            cc = c0 + dc
+            valid = (rr >= 0) & (rr < grid.rows) & (cc >= 0) & (cc < grid.cols)
+            bins += np.bincount((rr * grid.cols + cc)[valid], weights=(w * share)[valid], minlength=size)
+        return bins.reshape(grid.shape)
+
+    @staticmethod
+    def fft_density(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+                    output_value: int = OUTPUT_RAW, decay: float = 0.0):
+        """
+        Densidade por convolução FFT: binning em uma passada + kernel discretizado
+
+        O custo depende do tamanho da grade (O(N log N) em pixels) e não mais de
+        pontos x carimbo, o que favorece raios grandes e pixels pequenos.
+
+        Returns:
+            np.ndarray: Densidade (rows, cols) em float64
+        """
+        kernel = normalize_kernel(kernel)
+        bins = KdeEngine.bin_points(xs, ys, grid, weights)
+
+        # Kernel denso centrado no pixel (ponto no centro do pixel)
+        half = footprint_extent(radius, grid.pixel_size)
+        fp = FOOTPRINT_CACHE.get(kernel, radius, grid.pixel_size, None, output_value, decay)
+        stamp = np.zeros((2 * half + 1, 2 * half + 1), dtype=np.float64)
+        stamp[fp.drows + half, fp.dcols + half] = fp.values
+
+        # Convolução linear: preenche para evitar o efeito circular da FFT
+        shape = (_next_fast_len(grid.rows + 2 * half), _next_fast_len(grid.cols + 2 * half))
+        spectrum = np.fft.rfft2(bins, s=shape)
+        spectrum *= np.fft.rfft2(stamp, s=shape)
+        full = np.fft.irfft2(spectrum, s=shape)
+        density = full[half:half + grid.rows, half:half + grid.cols].copy()
+
+        # Ruído numérico da FFT vira 0 (mantém NoData fora do alcance dos pontos)
+        peak = float(np.abs(density).max()) if density.size else 0.0
+        density[np.abs(density) <= peak * 1e-12] = 0.0
+        return density
+
+    @staticmethod
+    def compute(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+                output_value: int = OUTPUT_RAW, decay: float = 0.0, engine: str = ENGINE_NATIVE,
+                progress=None):
+        """Calcula a densidade com o motor escolhido ("native" ou "fft")."""
+        if engine == ENGINE_FFT:
+            # FFT é uma operação única: sem progresso intermediário
+            return KdeEngine.fft_density(xs, ys, grid, radius, kernel, weights, output_value, decay)
+        return KdeEngine.splat(xs, ys, grid, radius, kernel, weights, output_value, decay,
+                               progress=progress)
+
+    @staticmethod
+    def tile_layout(radius: float, pixel_size: float, memory_budget_mb: float,
+                    engine: str = ENGINE_NATIVE):
+        """
+        Define lado do bloco e tamanho de lote que cabem no orçamento de memória
+
+        Estimativa por pixel do bloco: densidade float64 + conversão float32 e
+        máscara de NoData (~16 bytes). O motor FFT trabalha no bloco expandido
+        pelo raio com espectros complexos (~56 bytes por pixel expandido).
+        Metade do orçamento fica para os lotes temporários do splat (~32 bytes
+        por célula: índice, valor e cópias).
+
+        Returns:
+            tuple: (lado do bloco em pixels, células por lote)
+        """
+        budget = max(16.0, float(memory_budget_mb)) * 1024 * 1024
+        batch_cells = int(max(65536, min(BATCH_CELLS, budget / 2 / 32)))
+        half = footprint_extent(radius, pixel_size)
+        if engine == ENGINE_FFT:
+            side = int(np.sqrt(budget / 56.0)) - 2 * half
+        else:
+            side = int(np.sqrt(budget / 2 / 16.0))
+        side = max(TIFF_BLOCK, (side // TIFF_BLOCK) * TIFF_BLOCK)
+        return side, batch_cells
+
+    @staticmethod
+    def tile_grids(grid: KdeGrid, side: int):
+        """Percorre a grade em blocos de `side` pixels (ordem linha a linha).
+
+        Yields:
+            tuple: (linha inicial, coluna inicial, KdeGrid do bloco)
+        """
+        for row_off in range(0, grid.rows, side):
+            for col_off in range(0, grid.cols, side):
+                yield row_off, col_off, KdeGrid(
+                    x_min=grid.x_min + col_off * grid.pixel_size,
+                    y_max=grid.y_max - row_off * grid.pixel_size,
+                    pixel_size=grid.pixel_size,
+                    rows=min(side, grid.rows - row_off),
+                    cols=min(side, grid.cols - col_off),
+                )
+
+    @staticmethod
+    def compute_tile(xs, ys, tile: KdeGrid, radius: float, kernel=0, weights=None,
+                     output_value: int = OUTPUT_RAW, decay: float = 0.0,
+                     engine: str = ENGINE_NATIVE, batch_cells: int = BATCH_CELLS):
+        """
+        Densidade de um bloco a partir dos pontos próximos a ele
+
+        Returns:
+            np.ndarray: Bloco (rows, cols) float64
+        """
+        if np.asarray(xs).size == 0:
+            return np.zeros(tile.shape, dtype=np.float64)
+        if engine == ENGINE_FFT:
+            # FFT precisa da margem do raio dentro da grade para não perder pontos vizinhos
+            half = footprint_extent(radius, tile.pixel_size)
+            padded = KdeGrid(
+                x_min=tile.x_min - half * tile.pixel_size,
+                y_max=tile.y_max + half * tile.pixel_size,
+                pixel_size=tile.pixel_size,
+                rows=tile.rows + 2 * half,
+                cols=tile.cols + 2 * half,
+            )
+            full = KdeEngine.fft_density(xs, ys, padded, radius, kernel, weights, output_value, decay)
+            return full[half:half + tile.rows, half:half + tile.cols]
+        return KdeEngine.splat(xs, ys, tile, radius, kernel, weights, output_value, decay,
+                               batch_cells=batch_cells)
+
+    @staticmethod
+    def iter_tiles(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+                   output_value: int = OUTPUT_RAW, decay: float = 0.0,
+                   memory_budget_mb: float = 512, engine: str = ENGINE_NATIVE):
+        """
+        Gera a densidade bloco a bloco, com memória limitada pelo orçamento
+
+        Cada bloco recebe apenas os pontos a até `radius` de suas bordas. Os
+        pontos são ordenados por y uma única vez; cada faixa de blocos é obtida
+        por busca binária e reordenada por x para recortar as colunas.
+
+        Yields:
+            tuple: (linha inicial, coluna inicial, bloco float64)
+        """
+        side, batch_cells = KdeEngine.tile_layout(radius, grid.pixel_size, memory_budget_mb, engine)
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        w = None if weights is None else np.asarray(weights, dtype=np.float64)
+        margin = float(radius) + grid.pixel_size
+
+        by_y = np.argsort(ys, kind="stable")
+        ys_sorted = ys[by_y]
+        band = band_xs = None
+        band_row = -1
+        for row_off, col_off, tile in KdeEngine.tile_grids(grid, side):
+            if row_off != band_row:
+                band_row = row_off
+                lo = np.searchsorted(ys_sorted, tile.y_min - margin, side="left")
+                hi = np.searchsorted(ys_sorted, tile.y_max + margin, side="right")
+                band = by_y[lo:hi]
+                band = band[np.argsort(xs[band], kind="stable")]
+                band_xs = xs[band]
+            c_lo = np.searchsorted(band_xs, tile.x_min - margin, side="left")
+            c_hi = np.searchsorted(band_xs, tile.x_max + margin, side="right")
+            sel = band[c_lo:c_hi]
+            block = KdeEngine.compute_tile(
+                xs[sel], ys[sel], tile, radius, kernel,
+                None if w is None else w[sel], output_value, decay,
+                engine=engine, batch_cells=batch_cells,
+            )
+            yield row_off, col_off, block
+
+    @staticmethod
+    def coarse_grid(grid: KdeGrid, factor: int) -> KdeGrid:
+        """Grade com a mesma origem e pixel `factor` vezes maior (cobre a grade original)."""
+        factor = max(1, int(factor))
+        return KdeGrid(
+            x_min=grid.x_min,
+            y_max=grid.y_max,
+            pixel_size=grid.pixel_size * factor,
+            rows=int(np.ceil(grid.rows / factor)),
+            cols=int(np.ceil(grid.cols / factor)),
+        )
+
+    @staticmethod
+    def progressive_passes(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+                           output_value: int = OUTPUT_RAW, decay: float = 0.0,
+                           factors=PROGRESSIVE_FACTORS):
+        """
+        Prévias grossas da densidade, da mais grossa para a mais fina
+
+        Cada prévia usa binning + FFT em uma grade `factor` vezes mais grossa:
+        o custo é de uma passada nos pontos mais uma FFT pequena (64x menos
+        pixels no fator 8), o que entrega a primeira imagem quase de imediato.
+        Os valores são avaliações do mesmo kernel, então a escala de cores da
+        prévia é comparável à do resultado final. Fatores em que o raio cobre
+        menos de 1,5 pixel grosso são pulados (a prévia seria só ruído).
+
+        Yields:
+            tuple: (fator, KdeGrid grossa, densidade float64)
+        """
+        for factor in factors:
+            if factor <= 1 or float(radius) / (grid.pixel_size * factor) < 1.5:
+                continue
+            coarse = KdeEngine.coarse_grid(grid, factor)
+            yield factor, coarse, KdeEngine.fft_density(xs, ys, coarse, radius, kernel, weights,
+                                                        output_value, decay)
@@ -0,0 +1,69 @@
+"""
+Modelo da grade de saída do heatmap
+Descreve origem, tamanho do pixel e dimensões do raster de densidade
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Tuple
+
+
+@dataclass
+class KdeGrid:
+    """Grade regular (norte para cima) usada pelos motores de densidade.
+
+    A origem é o canto superior esquerdo (`x_min`, `y_max`), como no GeoTIFF.
+    Linhas crescem para o sul e colunas para o leste.
+    """
+
+    x_min: float
+    y_max: float
+    pixel_size: float
+    rows: int
+    cols: int
+
+    @classmethod
+    def from_bounds(cls, x_min: float, y_min: float, x_max: float, y_max: float,
+                    radius: float, pixel_size: float, snap: bool = False) -> 'KdeGrid':
+        """
+        Cria a grade no mesmo layout do algoritmo de Processing do QGIS
+
+        A extensão dos pontos é expandida pelo raio e as dimensões seguem
+        `ceil(lado / pixel) + 1`, exatamente como `QgsKernelDensityEstimation`.
+
+        Args:
+            x_min, y_min, x_max, y_max: Extensão dos pontos (unidades do mapa)
+            radius: Raio do kernel (unidades do mapa)
+            pixel_size: Tamanho do pixel (unidades do mapa)
+            snap: Alinha a origem a múltiplos do pixel; grades de mesmo pixel
+                ficam alinhadas pixel a pixel (álgebra de rasters entre saídas)
+
+        Returns:
+            KdeGrid: Grade de saída
+        """
+        left = float(x_min) - radius
+        top = float(y_max) + radius
+        if snap:
+            left = math.floor(left / pixel_size) * pixel_size
+            top = math.ceil(top / pixel_size) * pixel_size
+        width = (float(x_max) + radius) - left
+        height = top - (float(y_min) - radius)
+        cols = int(max(math.ceil(width / pixel_size) + 1, 1))
+        rows = int(max(math.ceil(height / pixel_size) + 1, 1))
+        return cls(x_min=left, y_max=top, pixel_size=float(pixel_size), rows=rows, cols=cols)
+
+    @property
+    def x_max(self) -> float:
+        return self.x_min + self.cols * self.pixel_size
+
+    @property
+    def y_min(self) -> float:
+        return self.y_max - self.rows * self.pixel_size
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.rows, self.cols)
+
+    def geotransform(self) -> Tuple[float, float, float, float, float, float]:
+        """Retorna o geotransform GDAL da grade."""
+        return (self.x_min, self.pixel_size, 0.0, self.y_max, 0.0, -self.pixel_size)
@@ -0,0 +1,259 @@
+"""
+Kernels de densidade e "carimbos" (footprints) discretizados
+
+As fórmulas reproduzem `QgsKernelDensityEstimation` (Processing do QGIS):
+- Saída bruta (output_value=0): valor do kernel sem normalização.
+- Saída escalada (output_value=1): kernel normalizado pela área (integra 1).
+"""
+
+import math
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+# Mesma ordem do parâmetro KERNEL do Processing
+KERNEL_QUARTIC = 0
+KERNEL_TRIANGULAR = 1
+KERNEL_UNIFORM = 2
+KERNEL_TRIWEIGHT = 3
+KERNEL_EPANECHNIKOV = 4
+
+KERNEL_NAMES = {
+    "quartic": KERNEL_QUARTIC,
+    "triangular": KERNEL_TRIANGULAR,
+    "uniform": KERNEL_UNIFORM,
+    "triweight": KERNEL_TRIWEIGHT,
+    "epanechnikov": KERNEL_EPANECHNIKOV,
+}
+
+OUTPUT_RAW = 0
+OUTPUT_SCALED = 1
+
+# Subdivisões do pixel usadas para escolher o carimbo de cada ponto (por eixo):
+# mínimo e teto; o número efetivo depende de raio/pixel (ver subpixel_buckets).
+# Cada ponto é deslocado no máximo pixel/(2*subdivisões) por eixo.
+SUBPIXEL_BUCKETS = 4
+MAX_SUBPIXEL_BUCKETS = 32
+# Erro por pixel buscado, em fração do pico de um ponto
+SUBPIXEL_TOLERANCE = 0.03
+# Maior inclinação |dK/du| (u = distância/raio) dos kernels contínuos (epanechnikov, em u=1)
+_MAX_SLOPE = 2.0
+
+Footprint = namedtuple("Footprint", ["drows", "dcols", "values"])
+
+
+def normalize_kernel(kernel) -> int:
+    """Aceita índice (0..4) ou nome ("Quartic", "uniform"...) e devolve o índice."""
+    if kernel is None or kernel == "":
+        return KERNEL_QUARTIC
+    try:
+        idx = int(kernel)
+        if idx in KERNEL_NAMES.values():
+            return idx
+    except (TypeError, ValueError):
+        pass
+    key = str(kernel).strip().lower()
+    if key in KERNEL_NAMES:
+        return KERNEL_NAMES[key]
+    raise ValueError(f"Kernel desconhecido: {kernel}")
+
+
+def kernel_values(distance, radius: float, kernel=KERNEL_QUARTIC,
+                  output_value: int = OUTPUT_RAW, decay: float = 0.0):
+    """
+    Avalia o kernel para um array de distâncias
+
+    Args:
+        distance: Distâncias ao ponto (unidades do mapa)
+        radius: Raio/bandwidth do kernel (unidades do mapa)
+        kernel: Índice ou nome do kernel
+        output_value: 0 = bruto, 1 = escalado
+        decay: Razão de decaimento (somente kernel triangular)
+
+    Returns:
+        np.ndarray: Valores do kernel (0 fora do raio)
+    """
+    kernel = normalize_kernel(kernel)
+    d = np.asarray(distance, dtype=np.float64)
+    u = d / float(radius)
+    inside = u <= 1.0
+    u2 = u * u
+    h2 = float(radius) ** 2
+    scaled = int(output_value) == OUTPUT_SCALED
+
+    if kernel == KERNEL_QUARTIC:
+        values = (1.0 - u2) ** 2
+        factor = (116.0 / (5.0 * math.pi * h2)) * (15.0 / 16.0) if scaled else 1.0
+    elif kernel == KERNEL_TRIANGULAR:
+        values = 1.0 - (1.0 - float(decay)) * u
+        # Decaimento negativo ("coolmap") não é normalizável: Processing devolve o valor bruto
+        if scaled and float(decay) >= 0:
+            factor = 3.0 / ((1.0 + 2.0 * float(decay)) * math.pi * h2)
+        else:
+            factor = 1.0
+    elif kernel == KERNEL_UNIFORM:
+        values = np.ones_like(u)
+        factor = (2.0 / (math.pi * h2)) * 0.5 if scaled else 1.0
+    elif kernel == KERNEL_TRIWEIGHT:
+        values = (1.0 - u2) ** 3
+        factor = (128.0 / (35.0 * math.pi * h2)) * (35.0 / 32.0) if scaled else 1.0
+    else:
+        values = 1.0 - u2
+        factor = (8.0 / (3.0 * math.pi * h2)) * (3.0 / 4.0) if scaled else 1.0
+
+    return np.where(inside, values * factor, 0.0)
+
+
+def footprint_extent(radius: float, pixel_size: float) -> int:
+    """Meia largura (em pixels) do carimbo que cobre qualquer deslocamento sub-pixel."""
+    return int(math.ceil(float(radius) / float(pixel_size))) + 1
+
+
+def subpixel_error_bound(radius: float, pixel_size: float, buckets=None) -> float:
+    """
+    Erro máximo previsto por pixel, em fração do pico de um ponto
+
+    O deslocamento chega a pixel*√2/(2*subdivisões) na diagonal; o erro é a
+    inclinação do kernel vezes esse deslocamento, medido em raios.
+    """
+    buckets = subpixel_buckets(radius, pixel_size) if buckets is None else int(buckets)
+    ratio = max(float(radius) / float(pixel_size), 1e-9)
+    return _MAX_SLOPE * math.sqrt(2.0) / (2.0 * buckets * ratio)
+
+
+def subpixel_buckets(radius: float, pixel_size: float) -> int:
+    """
+    Subdivisões do pixel por eixo para o erro ficar abaixo de SUBPIXEL_TOLERANCE
+
+    Raio de poucos pixels pede mais carimbos (raio/pixel = 3 -> 16, 10 -> 5);
+    a partir de ~12 pixels bastam SUBPIXEL_BUCKETS. Abaixo de ~1,5 pixel o teto
+    MAX_SUBPIXEL_BUCKETS limita e o erro passa da tolerância.
+    """
+    ratio = max(float(radius) / float(pixel_size), 1e-9)
+    needed = math.ceil(_MAX_SLOPE * math.sqrt(2.0) / (2.0 * SUBPIXEL_TOLERANCE * ratio) - 1e-9)
+    return int(min(MAX_SUBPIXEL_BUCKETS, max(SUBPIXEL_BUCKETS, needed)))
+
+
+def build_footprint(kernel, radius: float, pixel_size: float, offset_x: float = 0.5,
+                    offset_y: float = 0.5, output_value: int = OUTPUT_RAW,
+                    decay: float = 0.0) -> Footprint:
+    """
+    Discretiza o kernel na grade para um ponto com deslocamento sub-pixel fixo
+
+    O ponto fica em (offset_x, offset_y) dentro do seu pixel (0..1, a partir do
+    canto superior esquerdo). Apenas células com valor não nulo são retornadas.
+
+    Returns:
+        Footprint: deslocamentos de linha/coluna relativos ao pixel do ponto e valores
+    """
+    half = footprint_extent(radius, pixel_size)
+    offsets = np.arange(-half, half + 1, dtype=np.int64)
+    drows, dcols = np.meshgrid(offsets, offsets, indexing="ij")
+    dx = (dcols + 0.5 - float(offset_x)) * float(pixel_size)
+    dy = (drows + 0.5 - float(offset_y)) * float(pixel_size)
+    values = kernel_values(np.hypot(dx, dy), radius, kernel, output_value, decay)
+    keep = values != 0.0
+    return Footprint(
+        drows=drows[keep].astype(np.int64),
+        dcols=dcols[keep].astype(np.int64),
+        values=values[keep],
+    )
+
+
+def bucket_offset(bucket, buckets: int = SUBPIXEL_BUCKETS) -> tuple:
+    """Deslocamento sub-pixel (x, y) do centro do bucket; None = centro do pixel."""
+    if bucket is None:
+        return 0.5, 0.5
+    bucket = int(bucket)
+    return (((bucket % buckets) + 0.5) / buckets,
+            ((bucket // buckets) + 0.5) / buckets)
+
+
+class FootprintCache:
+    """Cache LRU de carimbos discretizados, com teto de memória e estatísticas.
+
+    Chave: (kernel, raio em unidades do mapa, pixel, bucket sub-pixel, saída, decaimento).
+    As subdivisões do bucket saem de raio e pixel (subpixel_buckets), já na chave.
+    Varreduras de raio/pixel e execuções repetidas reaproveitam os carimbos
+    sem reconstruí-los. Thread-safe (tarefas em segundo plano compartilham o cache).
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(kernel, radius, pixel_size, bucket, output_value, decay):
+        return (normalize_kernel(kernel), round(float(radius), 9), round(float(pixel_size), 9),
+                None if bucket is None else int(bucket), int(output_value), round(float(decay), 9))
+
+    @staticmethod
+    def _nbytes(fp: Footprint) -> int:
+        return int(fp.drows.nbytes + fp.dcols.nbytes + fp.values.nbytes)
+
+    def get(self, kernel, radius: float, pixel_size: float, bucket=None,
+            output_value: int = OUTPUT_RAW, decay: float = 0.0) -> Footprint:
+        """Devolve o carimbo do bucket (constrói e guarda em caso de ausência)."""
+        key = self._key(kernel, radius, pixel_size, bucket, output_value, decay)
+        with self._lock:
+            fp = self._items.get(key)
+            if fp is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return fp
+            self.misses += 1
+
+        offset_x, offset_y = bucket_offset(bucket, subpixel_buckets(radius, pixel_size))
+        fp = build_footprint(kernel, radius, pixel_size, offset_x, offset_y, output_value, decay)
+        for arr in fp:
+            arr.setflags(write=False)
+        size = self._nbytes(fp)
+
+        with self._lock:
+            if size > self.max_bytes or key in self._items:
+                return self._items.get(key, fp)
+            self._items[key] = fp
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= self._nbytes(old)
+                self.evictions += 1
+        return fp
+
+    def set_max_bytes(self, max_bytes: int):
+        """Ajusta o teto de memória, descartando os carimbos menos usados se preciso."""
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            while self._bytes > self.max_bytes and self._items:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= self._nbytes(old)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Estatísticas de uso: acertos, ausências, despejos, memória e entradas."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / total) if total else 0.0,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'entries': len(self._items),
+            }
+
+
+# Cache compartilhado pelo processo (cada processo de trabalho tem o seu)
+FOOTPRINT_CACHE = FootprintCache()
@@ -0,0 +1,302 @@
+"""
+Cálculo de densidade em paralelo: blocos distribuídos em um pool de processos
+
+Ideia central:
+- Pontos (ordenados por y) vão uma única vez para memória compartilhada.
+- Cada tarefa leva só a descrição do bloco e um índice de "slot"; o processo
+  grava o bloco calculado no slot, também em memória compartilhada.
+- O processo principal consome os slots à medida que ficam prontos (gravando
+  no GeoTIFF) e os reaproveita: memória limitada a 2 slots por processo.
+- Em lote (`iter_variants`) a tarefa é uma variante inteira (filtro/camada)
+  sobre a grade comum, e o slot tem o tamanho da grade.
+"""
+
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from .engine import ENGINE_NATIVE, KdeEngine
+from .grid import KdeGrid
+from .kernels import OUTPUT_RAW, normalize_kernel
+
+# Estado de cada processo de trabalho (preenchido pelo inicializador)
+_WORKER = {}
+
+
+def _python_executable() -> str:
+    """Interpretador Python para os processos de trabalho.
+
+    Dentro do QGIS `sys.executable` pode ser o próprio executável do QGIS
+    (ex.: qgis-bin.exe); nesse caso procura o Python distribuído junto.
+    """
+    exe = sys.executable or ""
+    if os.path.basename(exe).lower().startswith("python"):
+        return exe
+    names = ("pythonw.exe", "python.exe") if os.name == "nt" else ("python3", "python")
+    for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, "bin"), os.path.dirname(exe)):
+        for name in names:
+            candidate = os.path.join(folder, name)
+            if os.path.isfile(candidate):
+                return candidate
+    return shutil.which("python3") or shutil.which("python") or exe
+
+
+def _init_worker(points_name, n_points, has_weights, slots_name, n_slots, slot_cells):
+    """Anexa a memória compartilhada de pontos e slots no processo de trabalho."""
+    from multiprocessing import shared_memory
+
+    points_shm = shared_memory.SharedMemory(name=points_name)
+    slots_shm = shared_memory.SharedMemory(name=slots_name)
+    _WORKER["shms"] = (points_shm, slots_shm)
+    _WORKER["points"] = np.ndarray((3 if has_weights else 2, n_points), dtype=np.float64, buffer=points_shm.buf)
+    _WORKER["slots"] = np.ndarray((n_slots, slot_cells), dtype=np.float32, buffer=slots_shm.buf)
+
+
+def _run_tile(task):
+    """Calcula um bloco no processo de trabalho e grava o resultado no slot indicado."""
+    row_off, col_off, tile_args, slot, radius, kernel, output_value, decay, engine, batch_cells = task
+    start = time.perf_counter()
+    tile = KdeGrid(*tile_args)
+    points = _WORKER["points"]
+    xs, ys = points[0], points[1]
+    margin = float(radius) + tile.pixel_size
+
+    # Pontos ordenados por y: a faixa do bloco sai por busca binária, as colunas por máscara
+    lo = np.searchsorted(ys, tile.y_min - margin, side="left")
+    hi = np.searchsorted(ys, tile.y_max + margin, side="right")
+    band_xs = xs[lo:hi]
+    mask = (band_xs >= tile.x_min - margin) & (band_xs <= tile.x_max + margin)
+    weights = points[2][lo:hi][mask] if points.shape[0] == 3 else None
+
+    block = KdeEngine.compute_tile(
+        band_xs[mask], ys[lo:hi][mask], tile, radius, kernel, weights,
+        output_value, decay, engine=engine, batch_cells=batch_cells,
+    )
+    _WORKER["slots"][slot, :block.size] = block.ravel()
+    return row_off, col_off, tile.rows, tile.cols, slot, time.perf_counter() - start
+
+
+def _run_variant(task):
+    """Calcula a grade inteira de uma variante (fatia dos pontos) e grava no slot indicado."""
+    index, lo, hi, use_weights, grid_args, slot, radius, kernel, output_value, decay, engine = task
+    start = time.perf_counter()
+    grid = KdeGrid(*grid_args)
+    points = _WORKER["points"]
+    weights = points[2][lo:hi] if use_weights else None
+    density = KdeEngine.compute(points[0][lo:hi], points[1][lo:hi], grid, radius, kernel, weights,
+                                output_value, decay, engine=engine)
+    _WORKER["slots"][slot, :density.size] = density.ravel()
+    return index, slot, hi - lo, time.perf_counter() - start
+
+
+def _release(*shms):
+    """Fecha e remove blocos de memória compartilhada (ignora os já liberados)."""
+    for shm in shms:
+        try:
+            shm.close()
+        except Exception:
+            pass
+        try:
+            shm.unlink()
+        except Exception:
+            pass
+
+
+class ParallelKde:
+    """Distribui os blocos de densidade entre processos (um por núcleo, por padrão)."""
+
+    @staticmethod
+    def default_workers() -> int:
+        return max(1, os.cpu_count() or 1)
+
+    @staticmethod
+    def iter_tiles(xs, ys, grid: KdeGrid, radius: float, kernel=0, weights=None,
+                   output_value: int = OUTPUT_RAW, decay: float = 0.0,
+                   memory_budget_mb: float = 512, workers: int = 0,
+                   engine: str = ENGINE_NATIVE):
+        """
+        Gera os blocos calculados em paralelo, na ordem em que ficam prontos
+
+        O bloco entregue é uma visão do slot compartilhado e só é válido até a
+        próxima iteração: grave-o (ou copie) antes de pedir o próximo.
+
+        Args:
+            workers: Número de processos (0 = todos os núcleos)
+            memory_budget_mb: Orçamento total, dividido entre os processos
+
+        Yields:
+            tuple: (linha inicial, coluna inicial, bloco float32)
+        """
+        from multiprocessing import get_context, shared_memory
+
+        workers = int(workers) if workers and int(workers) > 0 else ParallelKde.default_workers()
+        kernel = normalize_kernel(kernel)
+        side, batch_cells = KdeEngine.tile_layout(
+            radius, grid.pixel_size, float(memory_budget_mb) / workers, engine
+        )
+        tiles = list(KdeEngine.tile_grids(grid, side))
+        workers = max(1, min(workers, len(tiles)))
+
+        # Pontos ordenados por y, copiados uma vez para a memória compartilhada
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        order = np.argsort(ys, kind="stable")
+        columns = [xs[order], ys[order]]
+        if weights is not None:
+            columns.append(np.asarray(weights, dtype=np.float64)[order])
+        n_points = int(xs.size)
+
+        n_slots = 2 * workers
+        slot_cells = side * side
+        points_shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * len(columns) * n_points))
+        slots_shm = shared_memory.SharedMemory(create=True, size=4 * n_slots * slot_cells)
+        executor = None
+        shared_points = slots = None
+        try:
+            shared_points = np.ndarray((len(columns), n_points), dtype=np.float64, buffer=points_shm.buf)
+            for i, column in enumerate(columns):
+                shared_points[i] = column
+            slots = np.ndarray((n_slots, slot_cells), dtype=np.float32, buffer=slots_shm.buf)
+
+            ctx = get_context("spawn")
+            ctx.set_executable(_python_executable())
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(points_shm.name, n_points, weights is not None,
+                          slots_shm.name, n_slots, slot_cells),
+            )
+
+            pending = iter(tiles)
+            free_slots = list(range(n_slots))
+            in_flight = set()
+            busy_s = 0.0
+            start = time.perf_counter()
+            while True:
+                while free_slots:
+                    nxt = next(pending, None)
+                    if nxt is None:
+                        break
+                    row_off, col_off, tile = nxt
+                    task = (row_off, col_off,
+                            (tile.x_min, tile.y_max, tile.pixel_size, tile.rows, tile.cols),
+                            free_slots.pop(), float(radius), kernel, output_value, decay,
+                            engine, batch_cells)
+                    in_flight.add(executor.submit(_run_tile, task))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row_off, col_off, rows, cols, slot, elapsed = future.result()
+                    busy_s += elapsed
+                    yield row_off, col_off, slots[slot, :rows * cols].reshape(rows, cols)
+                    free_slots.append(slot)
+
+            wall = time.perf_counter() - start
+            print(f"[CTCO] Paralelo: {len(tiles)} blocos de {side}px em {workers} processos, "
+                  f"{wall:.2f}s (trabalho somado {busy_s:.2f}s, paralelismo efetivo {busy_s / max(wall, 1e-9):.1f}x)")
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            # Soltar as visões NumPy antes de fechar a memória compartilhada
+            shared_points = slots = None
+            _release(points_shm, slots_shm)
+
+    @staticmethod
+    def iter_variants(point_sets, grid: KdeGrid, radius: float, kernel=0,
+                      output_value: int = OUTPUT_RAW, decay: float = 0.0,
+                      memory_budget_mb: float = 512, workers: int = 0,
+                      engine: str = ENGINE_NATIVE):
+        """
+        Calcula várias densidades sobre a mesma grade, uma variante por tarefa
+
+        Todos os conjuntos de pontos vão juntos (concatenados) para a memória
+        compartilhada; cada processo grava a grade da variante num slot do
+        tamanho da grade. O número de slots (2 por processo) respeita o
+        orçamento de memória, o que pode reduzir o número de processos.
+
+        Args:
+            point_sets: Lista de (xs, ys, pesos ou None), uma por variante
+            grid: Grade comum a todas as variantes
+
+        Yields:
+            tuple: (índice da variante, densidade float32 (rows, cols)); a visão
+            só é válida até a próxima iteração
+
+        Raises:
+            ValueError: Dois slots (um processo) não cabem no orçamento de memória
+        """
+        from multiprocessing import get_context, shared_memory
+
+        kernel = normalize_kernel(kernel)
+        slot_cells = grid.rows * grid.cols
+        slot_mb = 4.0 * slot_cells / 1048576.0
+        if 2 * slot_mb > float(memory_budget_mb):
+            raise ValueError(f"Grade {grid.cols}x{grid.rows} precisa de ~{2 * slot_mb:.0f} MB por processo "
+                             f"(orçamento {memory_budget_mb} MB): aumente o pixel ou o orçamento")
+        workers = int(workers) if workers and int(workers) > 0 else ParallelKde.default_workers()
+        workers = max(1, min(workers, len(point_sets), int(float(memory_budget_mb) // (2 * slot_mb))))
+
+        sizes = [int(np.asarray(xs).size) for xs, _, _ in point_sets]
+        bounds = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        n_points = int(bounds[-1])
+        n_slots = 2 * workers
+        points_shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * 3 * n_points))
+        slots_shm = shared_memory.SharedMemory(create=True, size=4 * n_slots * slot_cells)
+        executor = None
+        shared_points = slots = None
+        try:
+            shared_points = np.ndarray((3, n_points), dtype=np.float64, buffer=points_shm.buf)
+            for (xs, ys, weights), lo, hi in zip(point_sets, bounds[:-1], bounds[1:]):
+                shared_points[0, lo:hi] = xs
+                shared_points[1, lo:hi] = ys
+                shared_points[2, lo:hi] = 1.0 if weights is None else weights
+            slots = np.ndarray((n_slots, slot_cells), dtype=np.float32, buffer=slots_shm.buf)
+
+            ctx = get_context("spawn")
+            ctx.set_executable(_python_executable())
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(points_shm.name, n_points, True, slots_shm.name, n_slots, slot_cells),
+            )
+
+            # Variantes maiores primeiro: o pool termina mais equilibrado
+            pending = iter(sorted(range(len(point_sets)), key=lambda i: -sizes[i]))
+            grid_args = (grid.x_min, grid.y_max, grid.pixel_size, grid.rows, grid.cols)
+            free_slots = list(range(n_slots))
+            in_flight = set()
+            busy_s = 0.0
+            start = time.perf_counter()
+            while True:
+                while free_slots:
+                    index = next(pending, None)
+                    if index is None:
+                        break
+                    task = (index, int(bounds[index]), int(bounds[index + 1]),
+                            point_sets[index][2] is not None, grid_args, free_slots.pop(),
+                            float(radius), kernel, output_value, decay, engine)
+                    in_flight.add(executor.submit(_run_variant, task))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, slot, _, elapsed = future.result()
+                    busy_s += elapsed
+                    yield index, slots[slot].reshape(grid.rows, grid.cols)
+                    free_slots.append(slot)
+
+            wall = time.perf_counter() - start
+            print(f"[CTCO] Paralelo: {len(point_sets)} variantes em grade {grid.cols}x{grid.rows}, "
+                  f"{workers} processos, {wall:.2f}s (trabalho somado {busy_s:.2f}s)")
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            shared_points = slots = None
+            _release(points_shm, slots_shm)
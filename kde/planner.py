@@ -0,0 +1,274 @@
+"""
+Modelo de custo dos motores de densidade (tempo e memória previstos)
+
+Ideia central:
+- Cada motor tem uma fórmula de custo sobre as grandezas que de fato pesam:
+  pontos, pixels da grade, células do carimbo (pontos x carimbo), grade
+  expandida da FFT, número de blocos e de processos.
+- Os coeficientes padrão são ordens de grandeza medidas em NumPy; cada motor
+  tem ainda um fator de escala aprendido das execuções reais (média móvel no
+  log da razão real/previsto), que absorve a máquina e a versão do NumPy.
+- O plano é o motor mais rápido entre os que cabem no orçamento de memória;
+  se nenhum couber, o de menor memória.
+
+Não depende do QGIS: a persistência do modelo (JSON) fica com quem o usa.
+"""
+
+import math
+from dataclasses import dataclass, field
+
+from .engine import (
+    BATCH_CELLS,
+    ENGINE_FFT,
+    ENGINE_NATIVE,
+    ENGINE_PARALLEL,
+    ENGINE_PROCESSING,
+    ENGINE_TILED,
+    KdeEngine,
+    _next_fast_len,
+)
+from .kernels import footprint_extent
+
+ENGINE_AUTO = "auto"
+
+# Motores que o planejador sabe estimar, na ordem de preferência em empate
+PLANNABLE = (ENGINE_NATIVE, ENGINE_FFT, ENGINE_TILED, ENGINE_PARALLEL, ENGINE_PROCESSING)
+
+# Coeficientes padrão (segundos por unidade)
+DEFAULT_COEFFICIENTS = {
+    # Soma vetorizada de uma célula de carimbo na grade
+    'splat_cell': 1.2e-8,
+    # Alocar, converter e gravar um pixel da grade
+    'grid_pixel': 3.0e-8,
+    # Por ponto: posição sub-pixel, bucket e ordenação
+    'point': 1.5e-7,
+    # FFT: por P*log2(P) da grade expandida
+    'fft_unit': 3.5e-9,
+    # Custo fixo por bloco (busca dos pontos, gravação do bloco)
+    'tile': 2.0e-3,
+    # Abrir um processo (spawn) e copiar os pontos para a memória compartilhada
+    'process': 0.4,
+    # Fração do ganho linear que o paralelo entrega
+    'parallel_efficiency': 0.8,
+    # Processing: iteração das feições em C++ e cada célula do carimbo
+    'processing_point': 4.0e-6,
+    'processing_cell': 6.0e-9,
+    'processing_fixed': 1.0,
+}
+
+# Bytes por pixel do GeoTIFF de saída (float32)
+RASTER_BYTES = 4
+
+# Peso da execução nova na média móvel do fator de escala
+CALIBRATION_RATE = 0.3
+# Razão real/previsto aceita numa calibração (fora disso é outlier: ignorada)
+CALIBRATION_LIMITS = (0.02, 50.0)
+
+
+@dataclass
+class EngineEstimate:
+    """Previsão de um motor para um cálculo."""
+
+    engine: str
+    seconds: float
+    memory_mb: float
+    fits: bool
+    # Previsão sem o fator de escala aprendido (base da calibração)
+    raw_seconds: float = 0.0
+
+
+@dataclass
+class EnginePlan:
+    """Motor escolhido e as previsões de todos os candidatos."""
+
+    engine: str
+    estimate: EngineEstimate
+    estimates: list = field(default_factory=list)
+    # Grandezas do cálculo, para calibrar depois com o tempo real
+    features: dict = field(default_factory=dict)
+
+    def describe(self) -> str:
+        others = ", ".join(f"{e.engine} {e.seconds:.2f}s/{e.memory_mb:.0f}MB"
+                           + ("" if e.fits else " (excede memória)")
+                           for e in self.estimates if e.engine != self.engine)
+        return (f"{self.engine} (previsto {self.estimate.seconds:.2f}s, "
+                f"{self.estimate.memory_mb:.0f} MB); alternativas: {others or 'nenhuma'}")
+
+
+def plan_features(points: int, rows: int, cols: int, radius: float, pixel_size: float,
+                  workers: int = 1, memory_budget_mb: float = 512) -> dict:
+    """Grandezas que entram no modelo de custo (só números: serializável)."""
+    half = footprint_extent(radius, pixel_size)
+    # Células não nulas do carimbo ~ área do disco em pixels
+    footprint = max(1.0, math.pi * (float(radius) / float(pixel_size)) ** 2)
+    side, _ = KdeEngine.tile_layout(radius, pixel_size, memory_budget_mb)
+    tiles = math.ceil(rows / side) * math.ceil(cols / side)
+    fft_cells = _next_fast_len(rows + 2 * half) * _next_fast_len(cols + 2 * half)
+    return {
+        'points': int(points),
+        'rows': int(rows),
+        'cols': int(cols),
+        'half': int(half),
+        'footprint': float(footprint),
+        'tiles': int(tiles),
+        'tile_side': int(side),
+        'fft_cells': int(fft_cells),
+        'workers': max(1, int(workers)),
+        'memory_budget_mb': float(memory_budget_mb),
+    }
+
+
+class CostModel:
+    """Tempo e memória previstos por motor, com fatores de escala calibráveis."""
+
+    def __init__(self, coefficients=None, scales=None, runs=None):
+        self.coefficients = dict(DEFAULT_COEFFICIENTS, **(coefficients or {}))
+        self.scales = dict(scales or {})
+        self.runs = dict(runs or {})
+
+    def _raw(self, engine: str, f: dict):
+        """(segundos sem escala, MB) previstos para o motor."""
+        c = self.coefficients
+        pixels = f['rows'] * f['cols']
+        cells = f['points'] * f['footprint']
+        batch_mb = 32.0 * min(cells, BATCH_CELLS) / 1048576.0
+        grid_mb = 13.0 * pixels / 1048576.0
+
+        if engine == ENGINE_NATIVE:
+            return (c['point'] * f['points'] + c['splat_cell'] * cells + c['grid_pixel'] * pixels,
+                    grid_mb + batch_mb)
+        if engine == ENGINE_FFT:
+            p = f['fft_cells']
+            return (c['point'] * f['points'] + c['fft_unit'] * p * math.log2(max(p, 2))
+                    + c['grid_pixel'] * pixels,
+                    (40.0 * p + 8.0 * pixels) / 1048576.0 + grid_mb)
+
+        # Em blocos: pontos perto das bordas entram em mais de um bloco (halo do raio)
+        side = f['tile_side']
+        halo = ((side + 2.0 * f['half']) / side) ** 2 if f['tiles'] > 1 else 1.0
+        tile_mb = min(f['memory_budget_mb'], 16.0 * side * side / 1048576.0 + batch_mb)
+        tiled_s = (c['point'] * f['points'] + c['splat_cell'] * cells * halo
+                   + c['grid_pixel'] * pixels + c['tile'] * f['tiles'])
+        if engine == ENGINE_TILED:
+            return tiled_s, tile_mb
+        if engine == ENGINE_PARALLEL:
+            procs = max(1, min(f['workers'], f['tiles']))
+            speedup = 1.0 + (procs - 1) * c['parallel_efficiency']
+            # Gravação dos blocos segue na thread principal
+            return (c['process'] * procs + (tiled_s - c['grid_pixel'] * pixels) / speedup
+                    + c['grid_pixel'] * pixels, tile_mb)
+        if engine == ENGINE_PROCESSING:
+            # Grava linha a linha: memória ~ faixa de linhas alcançada pelo raio
+            return (c['processing_fixed'] + c['processing_point'] * f['points']
+                    + c['processing_cell'] * cells,
+                    8.0 * f['cols'] * (2 * f['half'] + 1) / 1048576.0)
+        raise ValueError(f"Motor desconhecido: {engine}")
+
+    def estimate(self, engine: str, features: dict) -> EngineEstimate:
+        raw_s, memory_mb = self._raw(engine, features)
+        return EngineEstimate(
+            engine=engine,
+            seconds=raw_s * float(self.scales.get(engine, 1.0)),
+            memory_mb=memory_mb,
+            fits=memory_mb <= features['memory_budget_mb'],
+            raw_seconds=raw_s,
+        )
+
+    def plan(self, features: dict, engines=PLANNABLE) -> EnginePlan:
+        """
+        Escolhe o motor mais rápido que cabe no orçamento de memória
+
+        O paralelo só entra com mais de um processo e mais de um bloco.
+        """
+        candidates = [e for e in engines
+                      if e != ENGINE_PARALLEL or (features['workers'] > 1 and features['tiles'] > 1)]
+        if not candidates:
+            raise ValueError("Nenhum motor disponível para o planejador")
+        estimates = [self.estimate(engine, features) for engine in candidates]
+        fitting = [e for e in estimates if e.fits]
+        if fitting:
+            best = min(fitting, key=lambda e: e.seconds)
+        else:
+            best = min(estimates, key=lambda e: e.memory_mb)
+        return EnginePlan(engine=best.engine, estimate=best, estimates=estimates, features=dict(features))
+
+    def calibrate(self, engine: str, features: dict, actual_s: float) -> float:
+        """
+        Ajusta o fator de escala do motor com o tempo real de uma execução
+
+        Returns:
+            float: Novo fator (inalterado se a medição for descartada)
+        """
+        raw_s, _ = self._raw(engine, features)
+        scale = float(self.scales.get(engine, 1.0))
+        if raw_s <= 0 or actual_s <= 0:
+            return scale
+        ratio = float(actual_s) / raw_s
+        low, high = CALIBRATION_LIMITS
+        if not (low * scale <= ratio <= high * scale):
+            return scale
+        scale = math.exp((1.0 - CALIBRATION_RATE) * math.log(scale) + CALIBRATION_RATE * math.log(ratio))
+        self.scales[engine] = scale
+        self.runs[engine] = int(self.runs.get(engine, 0)) + 1
+        return scale
+
+    def to_dict(self) -> dict:
+        return {'scales': dict(self.scales), 'runs': dict(self.runs)}
+
+    @classmethod
+    def from_dict(cls, data) -> 'CostModel':
+        data = data or {}
+        scales = {str(k): float(v) for k, v in (data.get('scales') or {}).items() if float(v) > 0}
+        runs = {str(k): int(v) for k, v in (data.get('runs') or {}).items()}
+        return cls(scales=scales, runs=runs)
+
+    def fit_pixel_size(self, points: int, width: float, height: float, radius: float,
+                       workers: int = 1, memory_budget_mb: float = 512, max_seconds=None,
+                       max_memory_mb=None, engines=PLANNABLE, min_pixel=None,
+                       max_raster_mb=None) -> float:
+        """
+        Menor pixel cujo melhor motor cabe nos limites de tempo e de memória
+
+        Tempo e memória só crescem com pixels menores: busca binária (em escala
+        log) entre `min_pixel` e o pixel que cobre a extensão com poucos pixels.
+
+        Args:
+            points: Pontos do cálculo
+            width, height: Extensão dos pontos (unidades do mapa)
+            radius: Raio do kernel (unidades do mapa)
+            max_seconds: Tempo previsto máximo (None = sem limite)
+            max_memory_mb: Memória prevista máxima (None = orçamento de memória)
+            min_pixel: Menor pixel aceito (padrão: raio / 1000)
+            max_raster_mb: Tamanho máximo do GeoTIFF de saída (None = sem limite)
+
+        Returns:
+            float: Pixel (unidades do mapa)
+        """
+        max_memory_mb = float(memory_budget_mb if max_memory_mb is None else max_memory_mb)
+        extent = max(float(width), float(height), float(radius), 1e-12)
+        lo = float(min_pixel) if min_pixel else float(radius) / 1000.0
+        hi = max(lo, extent / 4.0)
+
+        def fits(pixel):
+            rows = int(math.ceil((float(height) + 2.0 * radius) / pixel)) + 1
+            cols = int(math.ceil((float(width) + 2.0 * radius) / pixel)) + 1
+            plan = self.plan(plan_features(points, rows, cols, radius, pixel, workers, memory_budget_mb),
+                             engines)
+            return (plan.estimate.memory_mb <= max_memory_mb
+                    and (max_seconds is None or plan.estimate.seconds <= float(max_seconds))
+                    and (max_raster_mb is None
+                         or RASTER_BYTES * rows * cols / 1048576.0 <= float(max_raster_mb)))
+
+        if fits(lo):
+            return lo
+        if not fits(hi):
+            return hi
+        for _ in range(40):
+            mid = math.sqrt(lo * hi)
+            if fits(mid):
+                hi = mid
+            else:
+                lo = mid
+            if hi / lo < 1.01:
+                break
+        return hi
@@ -0,0 +1,85 @@
+"""
+Projeção azimutal equivalente de Lambert (LAEA) vetorizada
+
+Usada para levar pontos em graus a metros reais antes da densidade: a
+projeção centrada nos próprios dados preserva área (a massa do kernel por
+metro quadrado não é distorcida) e, perto do centro, também distâncias.
+
+Fórmulas elipsoidais de Snyder (1987), "Map Projections: A Working Manual",
+pp. 187-188.
+"""
+
+import numpy as np
+
+WGS84_A = 6378137.0
+WGS84_INV_F = 298.257223563
+
+
+class LambertAzimuthal:
+    """LAEA elipsoidal com centro (lon0, lat0) em graus."""
+
+    def __init__(self, lon0: float, lat0: float, a: float = WGS84_A, inv_f: float = WGS84_INV_F):
+        self.lon0 = float(lon0)
+        self.lat0 = float(lat0)
+        self.a = float(a)
+        f = 1.0 / float(inv_f) if inv_f else 0.0
+        self.e2 = f * (2.0 - f)
+        self.e = np.sqrt(self.e2)
+        self.qp = self._q(np.pi / 2.0)
+        self.rq = self.a * np.sqrt(self.qp / 2.0)
+        phi1 = np.radians(self.lat0)
+        self.beta1 = np.arcsin(np.clip(self._q(phi1) / self.qp, -1.0, 1.0))
+        m1 = np.cos(phi1) / np.sqrt(1.0 - self.e2 * np.sin(phi1) ** 2)
+        cos_beta1 = np.cos(self.beta1)
+        # No polo D fica indefinido; o limite é 1
+        self.d = self.a * m1 / (self.rq * cos_beta1) if cos_beta1 > 1e-12 else 1.0
+
+    @classmethod
+    def for_points(cls, lon, lat, a: float = WGS84_A, inv_f: float = WGS84_INV_F):
+        """Centro no meio da extensão dos pontos (longitudes contínuas no antimeridiano)."""
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon_min, lon_max = float(lon.min()), float(lon.max())
+        if lon_max - lon_min > 180.0:
+            # Dados atravessando o antimeridiano: centro pelas longitudes em [0, 360)
+            wrapped = np.mod(lon, 360.0)
+            lon_min, lon_max = float(wrapped.min()), float(wrapped.max())
+        lon0 = (lon_min + lon_max) / 2.0
+        lon0 = (lon0 + 180.0) % 360.0 - 180.0
+        lat0 = (float(lat.min()) + float(lat.max())) / 2.0
+        return cls(lon0, lat0, a, inv_f)
+
+    def _q(self, phi):
+        sin_phi = np.sin(phi)
+        if self.e < 1e-12:
+            return 2.0 * sin_phi
+        es = self.e * sin_phi
+        return (1.0 - self.e2) * (
+            sin_phi / (1.0 - es * es)
+            - np.log((1.0 - es) / (1.0 + es)) / (2.0 * self.e)
+        )
+
+    def forward(self, lon, lat):
+        """
+        Graus -> metros
+
+        Returns:
+            tuple: (x, y) em metros (float64)
+        """
+        lam = np.radians(np.asarray(lon, dtype=np.float64) - self.lon0)
+        beta = np.arcsin(np.clip(self._q(np.radians(np.asarray(lat, dtype=np.float64))) / self.qp,
+                                 -1.0, 1.0))
+        sin_b, cos_b = np.sin(beta), np.cos(beta)
+        sin_b1, cos_b1 = np.sin(self.beta1), np.cos(self.beta1)
+        cos_lam = np.cos(lam)
+        denom = np.maximum(1.0 + sin_b1 * sin_b + cos_b1 * cos_b * cos_lam, 1e-15)
+        b = self.rq * np.sqrt(2.0 / denom)
+        x = b * self.d * cos_b * np.sin(lam)
+        y = (b / self.d) * (cos_b1 * sin_b - sin_b1 * cos_b * cos_lam)
+        return x, y
+
+    def proj4(self) -> str:
+        """Definição PROJ equivalente (elipsoide explícito)."""
+        inv_f = 1.0 / (1.0 - np.sqrt(1.0 - self.e2)) if self.e2 > 0 else 0.0
+        return (f"+proj=laea +lat_0={self.lat0:.10f} +lon_0={self.lon0:.10f} +x_0=0 +y_0=0 "
+                f"+a={self.a:.4f} +rf={inv_f:.9f} +units=m +no_defs")
@@ -0,0 +1,180 @@
+"""
+Índice espacial em buckets de grade para consultas kNN vetorizadas
+
+Ideia central:
+- Para um tamanho de célula s, o k-ésimo vizinho encontrado no bloco 3x3 de
+  células ao redor da consulta é exato se estiver a no máximo s de distância
+  (qualquer ponto mais próximo está, necessariamente, dentro do bloco).
+- Cada consulta começa no nível de célula previsto pela densidade local (um
+  histograma grosso) e sobe de nível (célula sqrt(2) vezes maior) só se não resolver.
+  Assim regiões densas usam células pequenas e poucas candidatas por consulta.
+- Candidatas são reunidas sem laço Python (três faixas contíguas por consulta,
+  uma por linha do bloco; searchsorted + repeat) e o k-ésimo
+  menor é extraído com np.partition em grupos de tamanho parecido.
+"""
+
+import numpy as np
+
+# Limite de pares (consulta, candidata) por lote: controla a memória
+MAX_PAIRS = 8_000_000
+# Linhas do bloco 3x3; as três células de uma linha são contíguas na ordem das chaves
+_ROWS = (-1, 0, 1)
+
+
+class GridIndex:
+    """Buckets em grade (um nível por tamanho de célula, construídos sob demanda)."""
+
+    def __init__(self, xs, ys):
+        self.xs = np.ascontiguousarray(xs, dtype=np.float64)
+        self.ys = np.ascontiguousarray(ys, dtype=np.float64)
+        self.n = int(self.xs.size)
+        if self.n == 0:
+            raise ValueError("Índice espacial sem pontos")
+        self.x0 = float(self.xs.min())
+        self.y0 = float(self.ys.min())
+        self.span = max(float(self.xs.max()) - self.x0, float(self.ys.max()) - self.y0, 1e-9)
+        # Nível 0: célula 2^-16 da extensão; nível l: sqrt(2)^l vezes maior (degraus
+        # menores que 2x deixam o bloco 3x3 mais justo ao k-ésimo vizinho)
+        self.base_cell = self.span / 65536.0
+        self._levels = {}
+
+    def _cell(self, level):
+        return self.base_cell * (2.0 ** (0.5 * level))
+
+    def _level(self, level):
+        """Buckets do nível (com cache): chaves e coordenadas na ordem das células.
+
+        Returns:
+            tuple: (chaves ordenadas, xs ordenados, ys ordenados, colunas,
+            tabela de início por célula ou None quando a grade é esparsa demais)
+        """
+        cached = self._levels.get(level)
+        if cached is not None:
+            return cached
+        cell = self._cell(level)
+        ix = np.floor((self.xs - self.x0) / cell).astype(np.int64) + 1
+        iy = np.floor((self.ys - self.y0) / cell).astype(np.int64) + 1
+        ncols = int(ix.max()) + 2
+        n_cells = (int(iy.max()) + 2) * ncols
+        keys = iy * ncols + ix
+        order = np.argsort(keys)
+        table = None
+        if n_cells <= 8 * self.n + 1_000_000:
+            # Grade densa: início de cada célula em O(1), sem busca binária
+            table = np.zeros(n_cells + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=n_cells), out=table[1:])
+        # Coordenadas copiadas na ordem das células: candidatas ficam contíguas na memória
+        cached = (keys[order], self.xs[order], self.ys[order], ncols, table)
+        self._levels[level] = cached
+        return cached
+
+    def _start_levels(self, qx, qy, k):
+        """Nível inicial de cada consulta pela densidade de um histograma grosso."""
+        bins = 256
+        cell = self.span / bins
+        hist, _, _ = np.histogram2d(
+            self.xs, self.ys, bins=bins,
+            range=[[self.x0, self.x0 + self.span], [self.y0, self.y0 + self.span]],
+        )
+        cx = np.clip(((qx - self.x0) / cell).astype(np.int64), 0, bins - 1)
+        cy = np.clip(((qy - self.y0) / cell).astype(np.int64), 0, bins - 1)
+        local = np.maximum(hist[cx, cy], 1.0) / (cell * cell)
+        predicted = np.sqrt(k / (np.pi * local))
+        levels = np.ceil(2.0 * np.log2(np.maximum(predicted, self.base_cell) / self.base_cell))
+        return levels.astype(np.int64)
+
+    def knn_distance(self, qx, qy, k: int, exclude_self: bool = False,
+                     max_distance: float = np.inf) -> np.ndarray:
+        """
+        Distância ao k-ésimo vizinho mais próximo de cada consulta
+
+        Args:
+            qx, qy: Coordenadas das consultas (dentro da extensão dos pontos)
+            k: Ordem do vizinho (1 = mais próximo)
+            exclude_self: Consultas são os próprios pontos (ignora a distância 0 a si mesmo)
+            max_distance: Distâncias maiores não interessam (viram inf sem subir de nível)
+
+        Returns:
+            np.ndarray: Distâncias (float64); inf se houver menos de k pontos ou se
+            a distância passar de max_distance
+        """
+        qx = np.asarray(qx, dtype=np.float64)
+        qy = np.asarray(qy, dtype=np.float64)
+        kk = int(k) + (1 if exclude_self else 0)
+        result = np.full(qx.size, np.inf)
+        if kk > self.n or qx.size == 0:
+            return result
+
+        top_level = int(np.ceil(2.0 * np.log2(self.span / self.base_cell))) + 1
+        levels = np.minimum(self._start_levels(qx, qy, kk), top_level)
+        pending = np.arange(qx.size)
+        while pending.size:
+            next_pending = []
+            for level in np.unique(levels[pending]):
+                ids = pending[levels[pending] == level]
+                unresolved = self._resolve(qx, qy, ids, int(level), kk, level >= top_level, result)
+                if self._cell(int(level)) >= max_distance:
+                    # Menos de k pontos a até uma célula (>= max_distance): fica inf
+                    continue
+                if unresolved.size:
+                    levels[unresolved] = level + 1
+                    next_pending.append(unresolved)
+            pending = np.concatenate(next_pending) if next_pending else np.empty(0, dtype=np.int64)
+        return result
+
+    def _resolve(self, qx, qy, ids, level, kk, final, result):
+        """Resolve as consultas `ids` no nível dado; devolve as que precisam subir."""
+        sorted_keys, sorted_xs, sorted_ys, ncols, table = self._level(level)
+        cell = self._cell(level)
+        cx = np.floor((qx[ids] - self.x0) / cell).astype(np.int64) + 1
+        cy = np.floor((qy[ids] - self.y0) / cell).astype(np.int64) + 1
+        first_keys = np.stack([(cy + dy) * ncols + (cx - 1) for dy in _ROWS], axis=1)
+        if table is not None:
+            first_keys = np.clip(first_keys, 0, table.size - 4)
+            starts = table[first_keys]
+            counts = table[first_keys + 3] - starts
+        else:
+            starts = np.searchsorted(sorted_keys, first_keys, side="left")
+            counts = np.searchsorted(sorted_keys, first_keys + 2, side="right") - starts
+        totals = counts.sum(axis=1)
+
+        enough = totals >= kk
+        unresolved = [ids[~enough]]
+        ready = np.flatnonzero(enough)
+        # Lotes de consultas com total de candidatas parecido (pouco desperdício no preenchimento)
+        ready = ready[np.argsort(totals[ready], kind="stable")]
+        batch_start = 0
+        while batch_start < ready.size:
+            width = int(totals[ready[batch_start]])
+            span = max(1, min(ready.size - batch_start, MAX_PAIRS // max(width, 1)))
+            stop = batch_start + span
+            # Grupo termina quando o total dobra em relação ao primeiro
+            limit = np.searchsorted(totals[ready[batch_start:stop]], 2 * width, side="right")
+            stop = batch_start + max(1, int(limit))
+            batch = ready[batch_start:stop]
+            kth = self._kth(qx, qy, ids, batch, starts, counts, totals, sorted_xs, sorted_ys, kk)
+            ok = final | (kth <= cell)
+            result[ids[batch[ok]]] = kth[ok]
+            unresolved.append(ids[batch[~ok]])
+            batch_start = stop
+        return np.concatenate(unresolved)
+
+    def _kth(self, qx, qy, ids, batch, starts, counts, totals, sorted_xs, sorted_ys, kk):
+        """Distância à k-ésima candidata mais próxima de cada consulta do lote."""
+        width = int(totals[batch].max())
+        flat_counts = counts[batch].ravel()
+        n_pairs = int(flat_counts.sum())
+        per_query = totals[batch]
+        pair = np.arange(n_pairs)
+        # Posição da candidata na ordem das células: início da faixa + deslocamento na faixa
+        first = np.cumsum(flat_counts) - flat_counts
+        cand = pair + np.repeat(starts[batch].ravel() - first, flat_counts)
+        # Posição na tabela (consulta, coluna) preenchida com inf
+        query_first = np.cumsum(per_query) - per_query
+        slot = pair + np.repeat(np.arange(batch.size) * width - query_first, per_query)
+
+        dx = sorted_xs[cand] - np.repeat(qx[ids[batch]], per_query)
+        dy = sorted_ys[cand] - np.repeat(qy[ids[batch]], per_query)
+        table = np.full((batch.size, width), np.inf)
+        table.reshape(-1)[slot] = dx * dx + dy * dy
+        return np.sqrt(np.partition(table, kk - 1, axis=1)[:, kk - 1])
@@ -0,0 +1,174 @@
+"""
+Estimativa de densidade espaço-tempo (STKDE) num cubo de voxels (x, y, t)
+
+Ideia central:
+- Kernel separável: cada ponto contribui com K_espaço(distância) x K_tempo(Δt).
+  Numa fatia de tempo t_k, o ponto entra com peso K_tempo(t_k - t_i) e o resto
+  é o carimbo espacial de sempre (`KdeEngine.splat`).
+- Os pontos são ordenados pelo tempo uma vez; cada ponto alcança só as fatias a
+  menos de uma largura de banda temporal, encontradas por busca binária.
+- O cubo é calculado em blocos de fatias consecutivas que cabem no orçamento de
+  memória: pares (ponto, fatia) de um bloco vão numa única chamada de
+  `splat(bands=...)`, cada par somando na banda da sua fatia.
+- Saída bruta: produto dos kernels sem normalização (pico 1 x 1 por ponto).
+  Saída escalada: kernel espacial escalado x kernel temporal que integra 1 no
+  tempo (densidade por unidade de área e por `time_scale` segundos).
+"""
+
+import numpy as np
+
+from .engine import KdeEngine
+from .kernels import (
+    KERNEL_QUARTIC,
+    KERNEL_TRIANGULAR,
+    KERNEL_UNIFORM,
+    KERNEL_TRIWEIGHT,
+    OUTPUT_SCALED,
+    OUTPUT_RAW,
+    normalize_kernel,
+)
+from .temporal import MAX_FRAMES
+
+# Limite de pares (ponto, fatia) montados de uma vez (controla memória temporária)
+PAIR_BATCH = 2_000_000
+
+# Constante que faz o perfil 1D de cada kernel integrar 1 em [-1, 1]
+_TEMPORAL_NORM = {
+    KERNEL_QUARTIC: 15.0 / 16.0,
+    KERNEL_TRIANGULAR: 1.0,
+    KERNEL_UNIFORM: 0.5,
+    KERNEL_TRIWEIGHT: 35.0 / 32.0,
+}
+
+
+def slice_times(t_min: float, t_max: float, step: float, start=None, end=None):
+    """
+    Instante central de cada fatia do cubo, de `start` a `end` a cada `step`
+
+    Raises:
+        ValueError: Passo não positivo ou fatias demais
+    """
+    step = float(step)
+    if step <= 0:
+        raise ValueError("O passo entre fatias precisa ser positivo")
+    first = float(t_min if start is None else start)
+    last = float(t_max if end is None else end)
+    count = max(1, int(np.floor((last - first) / step + 1e-9)) + 1)
+    if count > MAX_FRAMES:
+        raise ValueError(f"O cubo teria {count} fatias (máximo {MAX_FRAMES}): aumente o passo")
+    return first + step * np.arange(count, dtype=np.float64)
+
+
+def temporal_kernel_values(dt, bandwidth: float, kernel=KERNEL_QUARTIC,
+                           output_value: int = OUTPUT_RAW, time_scale: float = 1.0):
+    """
+    Perfil 1D do kernel na diferença de tempo (0 fora da largura de banda)
+
+    O triangular é o triângulo puro (o decaimento só vale no espaço). Na saída
+    escalada o perfil integra 1 no tempo, medido em unidades de `time_scale`
+    segundos.
+    """
+    kernel = normalize_kernel(kernel)
+    u = np.abs(np.asarray(dt, dtype=np.float64)) / float(bandwidth)
+    if kernel == KERNEL_QUARTIC:
+        values = (1.0 - u * u) ** 2
+    elif kernel == KERNEL_TRIANGULAR:
+        values = 1.0 - u
+    elif kernel == KERNEL_UNIFORM:
+        values = np.ones_like(u)
+    elif kernel == KERNEL_TRIWEIGHT:
+        values = (1.0 - u * u) ** 3
+    else:
+        values = 1.0 - u * u
+    factor = 1.0
+    if int(output_value) == OUTPUT_SCALED:
+        factor = _TEMPORAL_NORM.get(kernel, 0.75) * float(time_scale) / float(bandwidth)
+    return np.where(u <= 1.0, values * factor, 0.0)
+
+
+def chunk_slices(grid, n_slices: int, memory_budget_mb: float) -> int:
+    """Fatias por bloco: o bloco (fatias x grade em float64) ocupa até metade do orçamento."""
+    slice_mb = 8.0 * grid.rows * grid.cols / 1048576.0
+    return int(max(1, min(n_slices, (float(memory_budget_mb) / 2.0) // max(slice_mb, 1e-9))))
+
+
+def space_time_density(xs, ys, ts, grid, radius: float, bandwidth: float, times,
+                       kernel=0, weights=None, output_value: int = OUTPUT_RAW,
+                       decay: float = 0.0, time_scale: float = 1.0,
+                       memory_budget_mb: float = 512, progress=None):
+    """
+    Gera as fatias do cubo de densidade espaço-tempo, em ordem
+
+    Args:
+        xs, ys: Coordenadas dos pontos
+        ts: Tempo de cada ponto (NaN = sem data, ignorado)
+        grid: Grade espacial comum às fatias
+        radius: Raio do kernel espacial
+        bandwidth: Largura de banda temporal (mesma unidade de ts)
+        times: Instante de cada fatia (crescente, passo constante; ver slice_times)
+        kernel, weights, output_value, decay: Como em KdeEngine.splat
+        time_scale: Segundos da unidade de tempo da saída escalada
+        memory_budget_mb: Teto de memória do bloco de fatias
+        progress: Chamado como progress(fração) a cada bloco; pode lançar
+            KdeCancelled para interromper
+
+    Yields:
+        tuple: (índice, instante, pontos que contribuem, densidade (rows, cols));
+        o bloco é reutilizado: grave a fatia (ou copie) antes do próximo bloco
+    """
+    kernel = normalize_kernel(kernel)
+    bandwidth = float(bandwidth)
+    if bandwidth <= 0:
+        raise ValueError("A largura de banda temporal precisa ser positiva")
+    ts = np.asarray(ts, dtype=np.float64)
+    valid = np.isfinite(ts)
+    if not valid.any():
+        raise ValueError("Nenhum ponto com data/hora válida")
+    order = np.flatnonzero(valid)[np.argsort(ts[valid], kind="stable")]
+    xs = np.asarray(xs, dtype=np.float64)[order]
+    ys = np.asarray(ys, dtype=np.float64)[order]
+    ts = ts[order]
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[order]
+
+    times = np.asarray(times, dtype=np.float64)
+    n_slices = times.size
+    step = float(times[1] - times[0]) if n_slices > 1 else 1.0
+    per_chunk = chunk_slices(grid, n_slices, memory_budget_mb)
+    cube = np.zeros((per_chunk,) + grid.shape, dtype=np.float64)
+    # Fatias alcançadas por ponto (estimativa) para dimensionar os lotes de pares
+    reach = int(np.ceil(2.0 * bandwidth / step)) + 1
+    block = max(1, PAIR_BATCH // reach)
+
+    for k0 in range(0, n_slices, per_chunk):
+        k1 = min(n_slices, k0 + per_chunk)
+        chunk = cube[:k1 - k0]
+        chunk.fill(0.0)
+        counts = np.zeros(k1 - k0, dtype=np.int64)
+        lo = int(np.searchsorted(ts, times[k0] - bandwidth, side="left"))
+        hi = int(np.searchsorted(ts, times[k1 - 1] + bandwidth, side="right"))
+        for b0 in range(lo, hi, block):
+            b1 = min(hi, b0 + block)
+            t = ts[b0:b1]
+            first = np.maximum(k0, np.ceil((t - bandwidth - times[0]) / step - 1e-9).astype(np.int64))
+            last = np.minimum(k1 - 1, np.floor((t + bandwidth - times[0]) / step + 1e-9).astype(np.int64))
+            n = np.maximum(0, last - first + 1)
+            total = int(n.sum())
+            if total == 0:
+                continue
+            # Um par por (ponto, fatia alcançada)
+            point = np.repeat(np.arange(b0, b1), n)
+            slice_k = np.repeat(first, n) + (np.arange(total) - np.repeat(np.cumsum(n) - n, n))
+            tw = temporal_kernel_values(times[slice_k] - ts[point], bandwidth, kernel,
+                                        output_value, time_scale)
+            keep = tw != 0.0
+            point, slice_k, tw = point[keep], slice_k[keep], tw[keep]
+            if point.size == 0:
+                continue
+            pair_w = tw if w is None else tw * w[point]
+            KdeEngine.splat(xs[point], ys[point], grid, radius, kernel, pair_w,
+                            output_value, decay, out=chunk, bands=slice_k - k0)
+            counts += np.bincount(slice_k - k0, minlength=k1 - k0)
+        if progress is not None:
+            progress(k1 / float(n_slices))
+        for j in range(k1 - k0):
+            yield k0 + j, float(times[k0 + j]), int(counts[j]), chunk[j]
@@ -0,0 +1,117 @@
+"""
+Séries temporais de densidade por janela deslizante
+
+Ideia central:
+- Os pontos são ordenados pelo tempo uma única vez; a janela [início, fim) de
+  cada quadro vira um intervalo contíguo do array ordenado (busca binária).
+- De um quadro para o seguinte só mudam as pontas: os pontos que saíram da
+  janela têm o carimbo subtraído e os que entraram, somado. O custo por quadro
+  é proporcional aos pontos que mudaram, não aos que estão na janela.
+- Quando recalcular sai mais barato (janelas disjuntas, passo maior que a
+  largura), o quadro é refeito do zero.
+- Resíduos de arredondamento das subtrações viram 0 (limite relativo ao pico
+  do carimbo), como no recálculo incremental por filtro.
+
+Tempos em segundos (float, ex.: época Unix); a unidade só precisa ser a mesma
+de largura e passo.
+"""
+
+import numpy as np
+
+from .engine import KdeEngine
+from .kernels import FOOTPRINT_CACHE, OUTPUT_RAW, normalize_kernel
+
+# Teto de quadros de uma série (bandas do GeoTIFF)
+MAX_FRAMES = 10000
+
+
+def frame_starts(t_min: float, t_max: float, width: float, step: float, start=None, end=None):
+    """
+    Início de cada quadro
+
+    O primeiro quadro começa em `start` (padrão: o primeiro ponto) e o último é
+    o primeiro cuja janela alcança `end` (padrão: o último ponto).
+
+    Raises:
+        ValueError: Largura/passo não positivos ou quadros demais
+    """
+    width, step = float(width), float(step)
+    if width <= 0 or step <= 0:
+        raise ValueError("Largura e passo da janela precisam ser positivos")
+    first = float(t_min if start is None else start)
+    last = float(t_max if end is None else end)
+    count = max(1, int(np.ceil((last - first - width) / step + 1e-9)) + 1)
+    if count > MAX_FRAMES:
+        raise ValueError(f"A série teria {count} quadros (máximo {MAX_FRAMES}): aumente o passo")
+    return first + step * np.arange(count, dtype=np.float64)
+
+
+def sliding_window_density(xs, ys, ts, grid, radius: float, width: float, step: float,
+                           kernel=0, weights=None, output_value: int = OUTPUT_RAW,
+                           decay: float = 0.0, starts=None, progress=None):
+    """
+    Gera a densidade de cada quadro da série
+
+    Args:
+        xs, ys: Coordenadas dos pontos
+        ts: Tempo de cada ponto (NaN = sem data, ignorado)
+        grid: Grade comum aos quadros
+        radius: Raio do kernel
+        width: Largura da janela (mesma unidade de ts)
+        step: Passo entre quadros
+        kernel, weights, output_value, decay: Como em KdeEngine.splat
+        starts: Início de cada quadro (padrão: frame_starts do primeiro ao último ponto)
+        progress: Chamado como progress(fração) a cada quadro; pode lançar
+            KdeCancelled para interromper
+
+    Yields:
+        tuple: (índice, início, fim, pontos na janela, densidade (rows, cols));
+        a grade é reutilizada: grave-a (ou copie) antes do próximo quadro
+    """
+    kernel = normalize_kernel(kernel)
+    ts = np.asarray(ts, dtype=np.float64)
+    valid = np.isfinite(ts)
+    if not valid.any():
+        raise ValueError("Nenhum ponto com data/hora válida")
+    order = np.flatnonzero(valid)[np.argsort(ts[valid], kind="stable")]
+    xs = np.asarray(xs, dtype=np.float64)[order]
+    ys = np.asarray(ys, dtype=np.float64)[order]
+    ts = ts[order]
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[order]
+
+    starts = frame_starts(ts[0], ts[-1], width, step) if starts is None else np.asarray(starts, dtype=np.float64)
+    peak = FOOTPRINT_CACHE.get(kernel, radius, grid.pixel_size, None, output_value, decay).values
+    eps = 1e-9 * float(np.abs(peak).max()) * (1.0 if w is None else max(1.0, float(np.abs(w).max())))
+
+    def stamp(lo, hi, sign, out):
+        if hi <= lo:
+            return
+        if w is None:
+            sel_w = None if sign > 0 else np.full(hi - lo, -1.0)
+        else:
+            sel_w = w[lo:hi] if sign > 0 else -w[lo:hi]
+        KdeEngine.splat(xs[lo:hi], ys[lo:hi], grid, radius, kernel, sel_w,
+                        output_value, decay, out=out)
+
+    density = np.zeros(grid.shape, dtype=np.float64)
+    lo = hi = 0
+    for index, t0 in enumerate(starts):
+        t1 = t0 + float(width)
+        new_lo = int(np.searchsorted(ts, t0, side="left"))
+        new_hi = int(np.searchsorted(ts, t1, side="left"))
+        leaving = (lo, min(new_lo, hi))
+        entering = (max(hi, new_lo), new_hi)
+        changed = max(0, leaving[1] - leaving[0]) + max(0, entering[1] - entering[0])
+        if index == 0 or changed >= new_hi - new_lo:
+            # Recalcular do zero custa menos (ou é o primeiro quadro)
+            density.fill(0.0)
+            stamp(new_lo, new_hi, 1, density)
+        else:
+            stamp(*leaving, -1, density)
+            stamp(*entering, 1, density)
+            if leaving[1] > leaving[0]:
+                density[np.abs(density) <= eps] = 0.0
+        lo, hi = new_lo, new_hi
+        if progress is not None:
+            progress((index + 1) / float(len(starts)))
+        yield index, float(t0), float(t1), hi - lo, density
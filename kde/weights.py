@@ -0,0 +1,56 @@
+"""
+Política de pesos: o que fazer com pesos nulos/inválidos e negativos
+
+Os pesos chegam como array float64 com NaN onde o valor era nulo ou não
+numérico. Os padrões (nulo conta como 1, negativo é mantido) preservam o
+comportamento anterior do plugin.
+"""
+
+import numpy as np
+
+NULL_ONE = "one"        # nulo conta como peso 1 (padrão)
+NULL_DROP = "drop"      # ponto com peso nulo é ignorado
+NEGATIVE_KEEP = "keep"  # negativo subtrai densidade (padrão)
+NEGATIVE_CLIP = "clip"  # negativo vira 0
+NEGATIVE_DROP = "drop"  # ponto com peso negativo é ignorado
+
+NULL_POLICIES = (NULL_ONE, NULL_DROP)
+NEGATIVE_POLICIES = (NEGATIVE_KEEP, NEGATIVE_CLIP, NEGATIVE_DROP)
+
+
+def apply_weight_policy(weights, null_policy: str = NULL_ONE, negative_policy: str = NEGATIVE_KEEP):
+    """
+    Aplica as políticas de nulos e negativos
+
+    Args:
+        weights: Pesos (NaN = nulo/inválido) ou None
+        null_policy: NULL_ONE ou NULL_DROP
+        negative_policy: NEGATIVE_KEEP, NEGATIVE_CLIP ou NEGATIVE_DROP
+
+    Returns:
+        tuple: (pesos float64, máscara dos pontos mantidos ou None se todos ficam)
+    """
+    if weights is None:
+        return None, None
+    if null_policy not in NULL_POLICIES:
+        raise ValueError(f"Política de peso nulo desconhecida: {null_policy}")
+    if negative_policy not in NEGATIVE_POLICIES:
+        raise ValueError(f"Política de peso negativo desconhecida: {negative_policy}")
+
+    weights = np.array(weights, dtype=np.float64)
+    nulls = ~np.isfinite(weights)
+    keep = np.ones(weights.size, dtype=bool)
+    if null_policy == NULL_DROP:
+        keep &= ~nulls
+    else:
+        weights[nulls] = 1.0
+
+    negatives = weights < 0
+    if negative_policy == NEGATIVE_DROP:
+        keep &= ~negatives
+    elif negative_policy == NEGATIVE_CLIP:
+        weights[negatives] = 0.0
+
+    if keep.all():
+        return weights, None
+    return weights[keep], keep
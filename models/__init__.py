@@ -5,5 +5,6 @@ Contém classes de dados e estruturas
 
 from .layer_validator import LayerValidator
 from .heatmap_parameters import HeatmapParameters
+from .temporal_parameters import TemporalParameters
 
-__all__ = ['LayerValidator', 'HeatmapParameters']
+__all__ = ['LayerValidator', 'HeatmapParameters', 'TemporalParameters']
@@ -3,8 +3,8 @@ Modelo para parâmetros do heatmap
 Contém configurações e otimizações de parâmetros
 """
 
-from dataclasses import dataclass
-from typing import Dict, Any
+from dataclasses import dataclass, fields
+from typing import Dict, Any, Tuple
 from qgis.core import QgsProject, QgsPointXY
 from qgis.core import QgsUnitTypes, QgsDistanceArea
 
@@ -21,66 +21,98 @@ class HeatmapParameters:
     decay: int
     output_value: int
     description: str
+    # Motor de cálculo: "native" (carimbos NumPy), "fft" (convolução), "tiled",
+    # "parallel" (blocos em vários processos), "processing" ou "auto" (planejador
+    # por custo previsto)
+    engine: str = "native"
+    # Teto de memória (MB) para o cálculo em blocos
+    memory_budget_mb: int = 512
+    # Processos do motor paralelo (0 = todos os núcleos)
+    workers: int = 0
+    # Peso por expressão do QGIS (tem prioridade sobre weight_field; só motor nativo)
+    weight_expression: str = ""
+    # Política para pesos nulos ("one" | "drop") e negativos ("keep" | "clip" | "drop")
+    weight_null: str = "one"
+    weight_negative: str = "keep"
+    # KDE adaptativo: raio de cada ponto = distância ao k-ésimo vizinho, limitada
+    # ao raio informado (0 = raio fixo; só motor nativo)
+    adaptive_k: int = 0
+    # Camadas em graus no motor nativo: "local" calcula em metros num CRS LAEA local,
+    # "warp" faz o mesmo e reprojeta o GeoTIFF para o CRS da camada, "off" usa graus
+    reproject: str = "local"
+
+    @property
+    def is_weighted(self) -> bool:
+        return bool(self.weight_expression or self.weight_field)
     
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> 'HeatmapParameters':
+        """
+        Monta os parâmetros a partir de um dicionário (manifesto, JSON)
+
+        Campos obrigatórios ausentes recebem os mesmos padrões do diálogo;
+        chaves desconhecidas são erro (evita erros de digitação silenciosos).
+
+        Raises:
+            ValueError: Chave desconhecida ou raio/pixel ausente
+        """
+        known = {f.name for f in fields(cls)}
+        unknown = sorted(set(values) - known)
+        if unknown:
+            raise ValueError(f"Parâmetros desconhecidos: {', '.join(unknown)}")
+        if 'radius' not in values or 'pixel_size' not in values:
+            raise ValueError("Informe 'radius' e 'pixel_size' (em metros)")
+        defaults = {
+            'transparent': 60,
+            'weight_field': '',
+            'kernel': "Quartic",
+            'decay': 0,
+            'output_value': 0,
+            'description': '',
+        }
+        return cls(**{**defaults, **values})
+
     @classmethod
     def get_optimized_parameters(cls, feature_count: int) -> 'HeatmapParameters':
         """
-        Retorna parâmetros otimizados baseado no número de features
+        Retorna parâmetros iniciais para execução sem diálogo
+        
+        Motor e pixel não saem mais de faixas fixas de contagem: o motor é
+        escolhido pelo planejador (engine="auto") e o pixel é ajustado ao
+        tempo previsto depois que o raio é definido (ver HeatmapService).
         
         Args:
             feature_count: Número de features na camada
         
         Returns:
-            HeatmapParameters: Parâmetros otimizados
+            HeatmapParameters: Parâmetros iniciais
         """
         # Corrigir contagem inválida (-1 ou None)
         if feature_count is None or feature_count < 0:
             feature_count = 0
             print("Aviso: Não foi possível contar as features, usando parâmetros padrão")
         
-        if feature_count > 10000:
-            return cls(
-                radius=75,
-                pixel_size=3.0,
-                transparent=60,
-                weight_field='',
-                kernel= "Quartic",
-                decay=0,
-                output_value=0,  # Raw
-                description='Muitos pontos - Performance otimizada'
-            )
-        elif feature_count > 1000:
-            return cls(
-                radius=50,
-                pixel_size=2.0,
-                transparent=60,
-                weight_field='',
-                kernel= "Quartic",
-                decay=0,
-                output_value=0,
-                description='Muitos pontos - Qualidade média'
-            )
-        else:
-            return cls(
-                radius=30,
-                pixel_size=1.0,
-                transparent=60,
-                weight_field='',
-                kernel= "Quartic",
-                decay=0,
-                output_value=0,
-                description='Poucos pontos - Alta qualidade'
-            )
+        return cls(
+            radius=50,
+            pixel_size=2.0,
+            transparent=60,
+            weight_field='',
+            kernel= "Quartic",
+            decay=0,
+            output_value=0,  # Raw
+            description=f'{feature_count} pontos - motor e pixel pelo custo previsto',
+            engine="auto",
+        )
     
-    def to_processing_params(self, input_layer) -> Dict[str, Any]:
+    def to_map_units(self, input_layer) -> Tuple[float, float]:
         """
-        Converte para parâmetros do processing do QGIS
-        
+        Converte raio e pixel (metros) para as unidades do mapa da camada
+
         Args:
             input_layer: Camada de entrada
-        
+
         Returns:
-            Dict: Parâmetros para processing.runAndLoadResults
+            Tuple: (raio, pixel) nas unidades do CRS da camada
         """
         # Converter valores em metros para unidades da camada quando necessário
         radius_mu = float(self.radius)
@@ -122,6 +154,19 @@ class HeatmapParameters:
         except Exception:
             radius_mu = float(self.radius)
             pixel_mu = float(self.pixel_size)
+        return radius_mu, pixel_mu
+
+    def to_processing_params(self, input_layer) -> Dict[str, Any]:
+        """
+        Converte para parâmetros do processing do QGIS
+        
+        Args:
+            input_layer: Camada de entrada
+        
+        Returns:
+            Dict: Parâmetros para processing.runAndLoadResults
+        """
+        radius_mu, pixel_mu = self.to_map_units(input_layer)
 
         return {
             'INPUT': input_layer,
@@ -77,12 +77,20 @@ class LayerValidator:
             except Exception:
                 pass
 
+            # Pontos já lidos para o heatmap: a contagem sai dos arrays em cache
+            from ..services.point_array_service import PointArrayService
+            arrays = PointArrayService.cached(layer)
+            if arrays is not None:
+                print(f"Número de features (arrays em cache): {arrays.count}")
+                return arrays.count
+
             feature_count = layer.featureCount()
             # Quando a contagem é 0 ou negativa, há provedores que atrasam; validar manualmente
             if feature_count is None or feature_count <= 0:
                 manual = 0
                 try:
-                    manual = sum(1 for _ in layer.getFeatures())
+                    # Leitura única que já deixa x/y em cache para o cálculo
+                    manual = PointArrayService.get(layer).count
                 except Exception:
                     manual = feature_count or 0
                 if manual is not None:
@@ -0,0 +1,46 @@
+"""
+Modelo para parâmetros da série temporal do heatmap
+A parte espacial (raio, pixel, kernel, pesos) continua em HeatmapParameters
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+# Unidades oferecidas no diálogo (segundos por unidade)
+TIME_UNITS = {
+    "minutos": 60.0,
+    "horas": 3600.0,
+    "dias": 86400.0,
+    "semanas": 7 * 86400.0,
+}
+
+
+@dataclass
+class TemporalParameters:
+    """Janela deslizante sobre um campo de data/hora (tempos em segundos)."""
+
+    time_field: str
+    # Largura da janela de cada quadro e passo entre quadros
+    window_s: float
+    step_s: float
+    # Limites da série em segundos desde a época (None = primeiro/último ponto)
+    start_s: Optional[float] = None
+    end_s: Optional[float] = None
+    # Cubo STKDE: largura de banda temporal (None = metade da janela); o passo
+    # entre fatias é step_s
+    bandwidth_s: Optional[float] = None
+    # Segundos da unidade escolhida (densidade escalada do cubo é por unidade de tempo)
+    unit_s: float = TIME_UNITS["dias"]
+
+    @classmethod
+    def from_units(cls, time_field: str, window: float, step: float, unit: str = "dias",
+                   bandwidth: Optional[float] = None) -> 'TemporalParameters':
+        """Cria os parâmetros com largura, passo e banda temporal na unidade indicada ("horas", "dias"...)."""
+        factor = TIME_UNITS.get(str(unit).lower(), TIME_UNITS["dias"])
+        return cls(time_field=time_field, window_s=float(window) * factor, step_s=float(step) * factor,
+                   bandwidth_s=None if bandwidth is None else float(bandwidth) * factor, unit_s=factor)
+
+    @property
+    def temporal_bandwidth_s(self) -> float:
+        """Largura de banda temporal do cubo STKDE, em segundos."""
+        return float(self.bandwidth_s) if self.bandwidth_s else float(self.window_s) / 2.0
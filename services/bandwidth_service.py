@@ -0,0 +1,65 @@
+"""
+Escolha do raio do heatmap a partir dos próprios pontos
+
+Usa os arrays em cache (PointArrayService) e a máscara do filtro, calcula o
+raio em unidades do mapa com `kde.bandwidth` e devolve em metros, a unidade
+dos parâmetros do plugin.
+"""
+
+import numpy as np
+
+from ..models.heatmap_parameters import HeatmapParameters
+from .filter_service import FilterService
+from .point_array_service import PointArrayService
+
+# Rótulos do diálogo (o seletor "auto" é a estimativa por densidade já existente)
+METHOD_LABELS = {
+    "fixed": "Manual",
+    "auto": "Automático (densidade)",
+    "silverman": "Silverman",
+    "scott": "Scott",
+    "nn": "Vizinho mais próximo",
+    "lcv": "Validação cruzada",
+}
+
+
+class BandwidthService:
+    """Seletores de raio sobre os pontos (filtrados) da camada."""
+
+    @staticmethod
+    def map_units_per_meter(layer) -> float:
+        """Fator metros -> unidades do mapa, pela mesma conversão dos parâmetros."""
+        probe = HeatmapParameters(radius=1000, pixel_size=1.0, transparent=0, weight_field='',
+                                  kernel=0, decay=0, output_value=0, description='')
+        radius_mu, _ = probe.to_map_units(layer)
+        return radius_mu / 1000.0 if radius_mu > 0 else 1.0
+
+    @staticmethod
+    def estimate(layer, method, filter_expr=None, kernel=0):
+        """
+        Calcula o raio pelo seletor escolhido
+
+        Args:
+            layer: Camada de pontos
+            method: "silverman", "scott", "nn" ou "lcv"
+            filter_expr: Filtro do diálogo (opcional)
+            kernel: Kernel do heatmap (usado pela validação cruzada)
+
+        Returns:
+            tuple: (raio em metros, dict com método, amostra, pontos e segundos)
+        """
+        from ..kde.bandwidth import select_bandwidth
+        from ..kde.kernels import normalize_kernel
+
+        arrays = PointArrayService.get(layer)
+        xs, ys = arrays.xs, arrays.ys
+        mask = FilterService.mask(layer, filter_expr)
+        if mask is not None:
+            xs, ys = xs[mask], ys[mask]
+        radius_mu, info = select_bandwidth(xs, ys, method, normalize_kernel(kernel))
+        radius_m = radius_mu / BandwidthService.map_units_per_meter(layer)
+        if not np.isfinite(radius_m) or radius_m <= 0:
+            raise ValueError("Não foi possível estimar o raio (pontos coincidentes?)")
+        print(f"[CTCO] Raio {METHOD_LABELS.get(method, method)}: {radius_m:.1f} m "
+              f"(amostra {info['sample']}/{info['points']}, {info['seconds']:.2f}s)")
+        return float(radius_m), info
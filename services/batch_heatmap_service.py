@@ -0,0 +1,159 @@
+"""
+Heatmaps em lote sobre uma grade comum (comparações entre filtros/camadas)
+
+Ideia central:
+- Cada camada é lida uma única vez (PointArrayService); as variantes de filtro
+  são máscaras sobre os mesmos arrays.
+- Uma só grade para todas as saídas: extensão da união dos pontos, origem
+  alinhada a múltiplos do pixel. Os GeoTIFFs ficam alinhados pixel a pixel e
+  podem entrar direto na calculadora raster (diferenças, razões).
+- As variantes são calculadas em paralelo (`ParallelKde.iter_variants`), cada
+  processo com a grade inteira de uma variante.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class BatchVariant:
+    """Uma saída do lote: camada e filtro (opcional)."""
+
+    layer: object
+    filter_expr: str = None
+    name: str = ""
+
+
+def _safe_name(text) -> str:
+    name = "".join(c if c.isalnum() or c in ("-", "_", ".") else "_" for c in str(text).strip())
+    return name or "heatmap"
+
+
+class BatchHeatmapService:
+    """Executa variantes de heatmap com grade compartilhada."""
+
+    @staticmethod
+    def prepare(variants, parameters):
+        """
+        Lê os pontos de cada variante e monta a grade comum (thread da interface)
+
+        Returns:
+            tuple: (lista de (xs, ys, pesos), KdeGrid, raio, kernel, WKT do cálculo, WKT das camadas)
+
+        Raises:
+            ValueError: Camadas em CRS diferentes ou nenhum ponto no lote
+        """
+        from ..kde.grid import KdeGrid
+        from ..kde.kernels import normalize_kernel
+        from .native_heatmap_service import NativeHeatmapService
+        from .projection_service import ProjectionService
+
+        first = variants[0].layer
+        layer_wkt = first.crs().toWkt()
+        for variant in variants[1:]:
+            if variant.layer.crs() != first.crs():
+                raise ValueError(f"Camadas em CRS diferentes: '{first.name()}' e "
+                                 f"'{variant.layer.name()}'; reprojete antes do lote")
+
+        radius_mu, pixel_mu = parameters.to_map_units(first)
+        point_sets = []
+        for variant in variants:
+            xs, ys, weights = NativeHeatmapService.read_points(variant.layer, parameters,
+                                                               filter_expr=variant.filter_expr)
+            point_sets.append((xs, ys, weights))
+        sizes = [xs.size for xs, _, _ in point_sets]
+        if sum(sizes) == 0:
+            raise ValueError("Nenhum ponto nas variantes do lote")
+
+        all_xs = np.concatenate([xs for xs, _, _ in point_sets])
+        all_ys = np.concatenate([ys for _, ys, _ in point_sets])
+        crs_wkt = layer_wkt
+        if ProjectionService.needs_projection(first, parameters):
+            # Uma única LAEA para o lote inteiro (centros diferentes desalinhariam as saídas)
+            all_xs, all_ys, crs_wkt = ProjectionService.to_local_metric(first, all_xs, all_ys)
+            radius_mu, pixel_mu = float(parameters.radius), float(parameters.pixel_size)
+            bounds = np.cumsum([0] + sizes)
+            point_sets = [(all_xs[lo:hi], all_ys[lo:hi], weights)
+                          for (_, _, weights), lo, hi in zip(point_sets, bounds[:-1], bounds[1:])]
+
+        grid = KdeGrid.from_bounds(float(all_xs.min()), float(all_ys.min()),
+                                   float(all_xs.max()), float(all_ys.max()),
+                                   radius_mu, pixel_mu, snap=True)
+        return point_sets, grid, radius_mu, normalize_kernel(parameters.kernel), crs_wkt, layer_wkt
+
+    @staticmethod
+    def iter_densities(point_sets, grid, radius, kernel, parameters):
+        """Densidades das variantes (índice, grade), em paralelo quando compensa."""
+        from ..kde.engine import KdeEngine, ENGINE_FFT, ENGINE_NATIVE
+        from ..kde.parallel import ParallelKde
+
+        engine = parameters.engine if parameters.engine in (ENGINE_NATIVE, ENGINE_FFT) else ENGINE_NATIVE
+        if len(point_sets) > 1 and int(parameters.workers or 0) != 1:
+            yield from ParallelKde.iter_variants(
+                point_sets, grid, radius, kernel, parameters.output_value, parameters.decay,
+                memory_budget_mb=parameters.memory_budget_mb, workers=parameters.workers,
+                engine=engine,
+            )
+            return
+        for index, (xs, ys, weights) in enumerate(point_sets):
+            yield index, KdeEngine.compute(xs, ys, grid, radius, kernel=kernel, weights=weights,
+                                           output_value=parameters.output_value,
+                                           decay=parameters.decay, engine=engine)
+
+    @staticmethod
+    def run(variants, parameters, output_dir=None) -> list:
+        """
+        Calcula e grava um GeoTIFF por variante, todos na mesma grade
+
+        Args:
+            variants: Lista de BatchVariant
+            parameters: HeatmapParameters comuns ao lote
+            output_dir: Pasta das saídas (None = arquivos temporários)
+
+        Returns:
+            list: Um dict por variante, na ordem recebida:
+                {'OUTPUT': caminho, 'name': nome, 'points': pontos}
+        """
+        from .projection_service import REPROJECT_WARP
+        from .raster_writer import temporary_output_path, write_geotiff, warp_geotiff
+
+        if not variants:
+            return []
+        if parameters.adaptive_k:
+            print("[CTCO] Aviso: lote usa raio fixo (KDE adaptativo ignorado)")
+        start = time.perf_counter()
+        point_sets, grid, radius, kernel, crs_wkt, layer_wkt = BatchHeatmapService.prepare(variants, parameters)
+        read_s = time.perf_counter() - start
+        warp = crs_wkt != layer_wkt and parameters.reproject == REPROJECT_WARP
+
+        results = [None] * len(variants)
+        used = set()
+        for i, variant in enumerate(variants):
+            name = variant.name or f"{variant.layer.name()}_{i + 1}"
+            file_name = _safe_name(name)
+            while file_name in used:
+                file_name += "_"
+            used.add(file_name)
+            path = (os.path.join(output_dir, f"heatmap_{file_name}.tif") if output_dir
+                    else temporary_output_path(f"heatmap_{file_name}"))
+            results[i] = {'OUTPUT': path, 'name': name, 'points': int(point_sets[i][0].size)}
+
+        for index, density in BatchHeatmapService.iter_densities(point_sets, grid, radius, kernel, parameters):
+            out_path = results[index]['OUTPUT']
+            if warp:
+                # Mesma grade de origem e mesmo CRS de destino: saídas reprojetadas seguem alinhadas
+                local_path = write_geotiff(temporary_output_path(), density, grid, crs_wkt)
+                warp_geotiff(local_path, out_path, layer_wkt)
+                try:
+                    os.remove(local_path)
+                except OSError:
+                    pass
+            else:
+                write_geotiff(out_path, density, grid, crs_wkt)
+        print(f"[CTCO] Lote: {len(variants)} heatmaps em grade comum {grid.cols}x{grid.rows} "
+              f"(origem {grid.x_min:.3f}, {grid.y_max:.3f}; pixel {grid.pixel_size:g}), "
+              f"leitura {read_s:.2f}s, total {time.perf_counter() - start:.2f}s")
+        return results
@@ -0,0 +1,146 @@
+"""
+Heatmap por categoria em uma passada (raster multibanda)
+
+Ideia central:
+- O campo de categoria vem dos arrays em cache (PointArrayService), com os
+  mesmos filtro e política de pesos do heatmap comum.
+- Cada ponto recebe o índice da sua banda e `KdeEngine.splat(bands=...)`
+  soma todos os carimbos de uma vez: cada ponto é carimbado uma única vez,
+  na banda da sua categoria.
+- Banda 1 = total (soma das categorias), bandas 2.. = uma por categoria.
+  A correspondência banda -> categoria fica na descrição e nos metadados de
+  cada banda (CTCO_CATEGORY) e no metadado CTCO_BANDS do arquivo (JSON), que
+  o ColorService lê para simbolizar qualquer banda.
+"""
+
+import json
+import time
+
+import numpy as np
+
+# Categorias além do limite (as menos frequentes) vão para a banda "outros"
+MAX_CATEGORIES = 32
+NULL_LABEL = "(nulo)"
+OTHERS_LABEL = "(outros)"
+TOTAL_LABEL = "Total"
+
+
+def _label(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return NULL_LABEL
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def category_codes(values, max_categories: int = MAX_CATEGORIES):
+    """
+    Código de categoria por ponto
+
+    Args:
+        values: Coluna do campo (float64 com NaN ou object com None)
+        max_categories: Máximo de categorias próprias; o resto vira "outros"
+
+    Returns:
+        tuple: (códigos int64 a partir de 0, rótulos das categorias, contagem por categoria)
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        # Numérico: únicos direto no float (NaN = nulo, sempre por último)
+        uniques, codes, counts = np.unique(values, return_inverse=True, return_counts=True)
+        codes = codes.reshape(-1)
+        nan = np.isnan(uniques)
+        if nan.sum() > 1:
+            # Versões antigas do NumPy não agrupam NaN
+            first_nan = int(np.flatnonzero(nan)[0])
+            codes = np.minimum(codes, first_nan)
+            counts = np.r_[counts[:first_nan], counts[first_nan:].sum()]
+            uniques = uniques[:first_nan + 1]
+        names = [_label(float(v)) for v in uniques]
+    else:
+        labels = np.array([_label(v) for v in values.astype(object)], dtype=str)
+        names, codes, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        codes = codes.reshape(-1)
+        names = [str(n) for n in names]
+    if len(names) <= max_categories:
+        return codes.astype(np.int64), names, counts.astype(np.int64)
+
+    # Mantém as mais frequentes (ordem alfabética entre elas) e agrupa o restante
+    keep = np.sort(np.argsort(-counts, kind="stable")[:max_categories - 1])
+    remap = np.full(len(names), len(keep), dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+    new_codes = remap[codes]
+    new_names = [names[i] for i in keep] + [OTHERS_LABEL]
+    new_counts = np.bincount(new_codes, minlength=len(new_names)).astype(np.int64)
+    return new_codes, new_names, new_counts
+
+
+class CategoricalHeatmapService:
+    """Densidade separada por valor de um campo, em um único GeoTIFF multibanda."""
+
+    @staticmethod
+    def run(layer, parameters, split_field: str, output_path=None, filter_expr=None,
+            max_categories: int = MAX_CATEGORIES) -> dict:
+        """
+        Calcula a banda total e uma banda por categoria de `split_field`
+
+        Args:
+            layer: Camada de pontos
+            parameters: HeatmapParameters (raio, pixel, kernel, pesos)
+            split_field: Campo que define as categorias
+            output_path: GeoTIFF de destino (None = arquivo temporário)
+            filter_expr: Filtro aplicado antes da separação
+            max_categories: Limite de bandas de categoria
+
+        Returns:
+            dict: {'OUTPUT': caminho, 'bands': [{'band', 'category', 'points'}, ...]}
+        """
+        from ..kde.engine import KdeEngine
+        from ..kde.kernels import normalize_kernel
+        from .native_heatmap_service import NativeHeatmapService
+        from .projection_service import ProjectionService
+        from .raster_writer import temporary_output_path, write_multiband_geotiff
+
+        start = time.perf_counter()
+        if parameters.engine not in ("native", "fft", "auto") or parameters.adaptive_k:
+            print("[CTCO] Aviso: separação por campo usa o motor nativo com raio fixo")
+        radius_mu, pixel_mu = parameters.to_map_units(layer)
+        xs, ys, weights, values = NativeHeatmapService.read_points(
+            layer, parameters, filter_expr=filter_expr, attributes=[split_field]
+        )
+        if xs.size == 0:
+            raise ValueError("Nenhum ponto para calcular o heatmap")
+        crs_wkt = layer.crs().toWkt()
+        if ProjectionService.needs_projection(layer, parameters):
+            xs, ys, crs_wkt = ProjectionService.to_local_metric(layer, xs, ys)
+            radius_mu, pixel_mu = float(parameters.radius), float(parameters.pixel_size)
+        codes, names, counts = category_codes(values, max_categories)
+        read_s = time.perf_counter() - start
+
+        grid = KdeEngine.grid_for_points(xs, ys, radius_mu, pixel_mu)
+        needed_mb = 8.0 * (len(names) + 1) * grid.rows * grid.cols / 1048576.0
+        if needed_mb > parameters.memory_budget_mb:
+            raise ValueError(f"{len(names)} categorias nesta grade precisam de ~{needed_mb:.0f} MB "
+                             f"(orçamento {parameters.memory_budget_mb} MB): aumente o pixel, "
+                             f"o orçamento ou filtre as categorias")
+        density = np.zeros((len(names) + 1,) + grid.shape, dtype=np.float64)
+        # Categorias nas bandas 1..n; a banda 0 (total) é a soma, sem carimbar de novo
+        KdeEngine.splat(xs, ys, grid, radius_mu, normalize_kernel(parameters.kernel), weights,
+                        parameters.output_value, parameters.decay, out=density, bands=codes + 1)
+        np.sum(density[1:], axis=0, out=density[0])
+
+        bands = [{'band': 1, 'category': TOTAL_LABEL, 'points': int(xs.size)}]
+        bands += [{'band': i + 2, 'category': name, 'points': int(count)}
+                  for i, (name, count) in enumerate(zip(names, counts))]
+        out_path = output_path or temporary_output_path("heatmap_categorias")
+        write_multiband_geotiff(
+            out_path, density, grid, crs_wkt,
+            descriptions=[b['category'] for b in bands],
+            metadata={'CTCO_SPLIT_FIELD': split_field,
+                      'CTCO_BANDS': json.dumps(bands, ensure_ascii=False)},
+            band_metadata=[{'CTCO_CATEGORY': b['category'], 'CTCO_POINTS': b['points']} for b in bands],
+        )
+        print(f"[CTCO] Heatmap por '{split_field}': {len(names)} categorias + total, "
+              f"{xs.size} pontos, grade {grid.cols}x{grid.rows}, leitura {read_s:.2f}s, "
+              f"total {time.perf_counter() - start:.2f}s")
+        return {'OUTPUT': out_path, 'bands': bands, 'split_field': split_field}
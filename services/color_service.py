@@ -64,7 +64,7 @@ class ColorService:
         shader.setRasterShaderFunction(color_ramp)
         
         # Aplicar diretamente
-        layer.setRenderer(QgsSingleBandPseudoColorRenderer(layer.dataProvider(), 1, shader))
+        layer.setRenderer(QgsSingleBandPseudoColorRenderer(layer.dataProvider(), ColorService.active_band(layer), shader))
         layer.triggerRepaint()
     
     @staticmethod
@@ -141,7 +141,8 @@ class ColorService:
         return color_ramp
     
     @staticmethod
-    def apply_color_ramp_to_layer(layer, color_ramp, min_val=None, max_val=None, opacity: float = 0.6):
+    def apply_color_ramp_to_layer(layer, color_ramp, min_val=None, max_val=None, opacity: float = 0.6,
+                                  band: int = None):
         """Aplica a rampa à camada com normalização para o range efetivo.
 
         Passos:
@@ -149,7 +150,9 @@ class ColorService:
         2) Define faixa efetiva: dinâmica (mean±k*std) ou min/max informados.
         3) Reescala itens 0..1 para [min,max] efetivo e aplica renderer.
         Por quê: melhora contraste e evita "mapa todo azul/vermelho".
+        `band` escolhe a banda simbolizada (None = banda ativa da camada, ver active_band).
         """
+        band = ColorService.active_band(layer) if band is None else int(band)
         try:
             # Debug: verificar tipo do color_ramp
             print(f"[CTCO] Debug: color_ramp type = {type(color_ramp)}")
@@ -163,9 +166,9 @@ class ColorService:
             try:
                 # Usar flags completos e considerar a extensão atual
                 from qgis.core import QgsRasterBandStats
-                stats = provider.bandStatistics(1, QgsRasterBandStats.All, layer.extent(), 0)
+                stats = provider.bandStatistics(band, QgsRasterBandStats.All, layer.extent(), 0)
             except Exception:
-                stats = provider.bandStatistics(1)
+                stats = provider.bandStatistics(band)
             stats_min = stats.minimumValue
             stats_max = stats.maximumValue
             stats_mean = getattr(stats, 'mean', None)
@@ -173,11 +176,11 @@ class ColorService:
 
             # Capturar NoData e tipo de banda para diagnóstico
             try:
-                no_data_val = provider.sourceNoDataValue(1)
+                no_data_val = provider.sourceNoDataValue(band)
             except Exception:
                 no_data_val = None
             try:
-                band_type = provider.dataType(1)
+                band_type = provider.dataType(band)
             except Exception:
                 band_type = None
 
@@ -217,7 +220,7 @@ class ColorService:
             # Criar shader e renderer
             shader = QgsRasterShader()
             shader.setRasterShaderFunction(scaled_ramp)
-            renderer = QgsSingleBandPseudoColorRenderer(provider, 1, shader)
+            renderer = QgsSingleBandPseudoColorRenderer(provider, band, shader)
             renderer.setClassificationMin(effective_min)
             renderer.setClassificationMax(effective_max)
             try:
@@ -241,14 +244,15 @@ class ColorService:
                 
                 shader = QgsRasterShader()
                 shader.setRasterShaderFunction(color_ramp)
-                renderer = QgsSingleBandPseudoColorRenderer(provider, 1, shader)
+                renderer = QgsSingleBandPseudoColorRenderer(provider, band, shader)
                 layer.setRenderer(renderer)
                 layer.triggerRepaint()
             except Exception as e2:
                 print(f"Erro no fallback: {e2}")
 
     @staticmethod
-    def apply_colormap(layer, name, min_val=None, max_val=None, scale_mode: str = "linear", opacity: float = 0.6):
+    def apply_colormap(layer, name, min_val=None, max_val=None, scale_mode: str = "linear", opacity: float = 0.6,
+                       band: int = None):
         """
         Aplica rampa de cores pelo nome, com opção de escala.
         
@@ -258,6 +262,7 @@ class ColorService:
             min_val: Valor mínimo para classificação (opcional)
             max_val: Valor máximo para classificação (opcional)
             scale_mode: "linear" ou "log" (melhora contraste em altas intensidades)
+            band: Banda simbolizada (None = banda ativa; rasters por categoria têm várias)
         """
         try:
             # Normalizar nome para aceitar diferentes capitalizações e aliases
@@ -310,7 +315,10 @@ class ColorService:
                 base_ramp = ColorService._create_color_ramp(adjusted)
                 print(f"[CTCO] Debug apply_colormap log: base_ramp type = {type(base_ramp)}")
 
-            # min/max deixam de ser configuráveis pelo usuário; usar normalização dinâmica
+            # min/max deixam de ser configuráveis pelo usuário; usar normalização dinâmica,
+            # exceto em séries (faixa fixa gravada na camada: quadros comparáveis entre si)
+            if min_val is None and max_val is None:
+                min_val, max_val = ColorService.fixed_range(layer)
             # Logar stops da rampa antes de aplicar
             try:
                 items_dbg = base_ramp.colorRampItemList()
@@ -319,7 +327,8 @@ class ColorService:
             except Exception:
                 pass
 
-            ColorService.apply_color_ramp_to_layer(layer, base_ramp, min_val=None, max_val=None, opacity = opacity)
+            ColorService.apply_color_ramp_to_layer(layer, base_ramp, min_val=min_val, max_val=max_val, opacity = opacity,
+                                                   band=band)
 
             # Registrar propriedades na camada para permitir "Resetar Cores" à configuração original/atual
             try:
@@ -337,6 +346,81 @@ class ColorService:
         except Exception as e:
             print(f"Erro ao aplicar rampa '{name}': {e}")
     
+    @staticmethod
+    def active_band(layer) -> int:
+        """Banda exibida da camada (propriedade `ctco_band`; 1 por padrão)."""
+        try:
+            band = int(layer.customProperty("ctco_band", 1) or 1)
+            count = layer.bandCount()
+            return band if 1 <= band <= count else 1
+        except Exception:
+            return 1
+
+    @staticmethod
+    def fixed_range(layer):
+        """Faixa (min, max) fixa da camada (propriedade `ctco_range`) ou (None, None)."""
+        try:
+            raw = layer.customProperty("ctco_range", None)
+            if raw:
+                low, high = (float(v) for v in str(raw).split(","))
+                if high > low:
+                    return low, high
+        except Exception:
+            pass
+        return None, None
+
+    @staticmethod
+    def category_bands(layer) -> list:
+        """
+        Correspondência banda -> categoria de um heatmap separado por campo
+
+        Lê a propriedade `ctco_bands` da camada ou, se ausente (raster aberto
+        de outro projeto), o metadado CTCO_BANDS gravado no GeoTIFF.
+
+        Returns:
+            list: [{'band', 'category', 'points'}, ...] (vazia para heatmaps simples)
+        """
+        import json
+
+        raw = None
+        try:
+            raw = layer.customProperty("ctco_bands", None)
+        except Exception:
+            pass
+        if not raw:
+            try:
+                from osgeo import gdal
+                ds = gdal.Open(layer.source())
+                raw = ds.GetMetadataItem("CTCO_BANDS") if ds is not None else None
+                ds = None
+            except Exception:
+                raw = None
+        try:
+            return list(json.loads(raw)) if raw else []
+        except (TypeError, ValueError):
+            return []
+
+    @staticmethod
+    def show_band(layer, band: int):
+        """Troca a banda exibida mantendo paleta, escala e opacidade da camada."""
+        layer.setCustomProperty("ctco_band", int(band))
+        ColorService.apply_colormap(
+            layer,
+            name=layer.customProperty("ctco_palette", "BCYR"),
+            scale_mode=layer.customProperty("ctco_scale", "linear"),
+            opacity=float(layer.customProperty("ctco_opacity", 0.6)),
+            band=int(band),
+        )
+
+    @staticmethod
+    def show_category(layer, category) -> bool:
+        """Exibe a banda de uma categoria pelo rótulo; False se a categoria não existir."""
+        for entry in ColorService.category_bands(layer):
+            if str(entry.get('category')) == str(category):
+                ColorService.show_band(layer, int(entry['band']))
+                return True
+        return False
+
     @staticmethod
     def get_available_colormaps():
         """
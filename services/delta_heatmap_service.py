@@ -0,0 +1,180 @@
+"""
+Recálculo incremental quando só o filtro muda
+
+Ideia central:
+- Depois de um cálculo nativo (grade inteira), a densidade float64 fica retida
+  junto com a máscara de pontos selecionados. Só a densidade do carimbo exato
+  (motor "native") é retida: a da FFT difere do carimbo por arredondamento da
+  binagem, e somar/subtrair carimbos exatos sobre ela deixaria resíduos.
+- Se o próximo pedido tem os mesmos parâmetros e a mesma camada, e só o filtro
+  mudou, comparamos as máscaras: quem saiu da seleção tem o carimbo subtraído
+  e quem entrou tem o carimbo somado. O custo é proporcional aos pontos que
+  mudaram, não à seleção inteira.
+- O raster mantém a grade do cálculo retido; se um ponto novo cair fora dela
+  (filtro ampliado para outra região), o cálculo completo é refeito.
+
+Somente uma grade fica retida (a do último cálculo), limitada a MAX_RETAINED_MB.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass, replace
+
+import numpy as np
+
+from .filter_service import FilterService
+from .point_array_service import PointArrayService
+
+MAX_RETAINED_MB = 256
+
+
+@dataclass
+class RetainedDensity:
+    """Densidade do último cálculo e a seleção que a produziu."""
+
+    signature: str
+    arrays: object
+    grid: object
+    density: np.ndarray
+    selected: np.ndarray
+    radius: float
+    kernel: int
+    eps: float
+
+
+class DeltaHeatmapService:
+    """Retém a última densidade e aplica diferenças de seleção sobre ela."""
+
+    _retained = None
+
+    @staticmethod
+    def signature(layer, parameters) -> str:
+        """
+        Tudo que define a densidade, exceto o filtro
+
+        Usa o motor resolvido: "auto" conta como "native", o único retido.
+        """
+        from ..kde.engine import ENGINE_NATIVE
+        from ..kde.planner import ENGINE_AUTO
+
+        if parameters.engine == ENGINE_AUTO:
+            parameters = replace(parameters, engine=ENGINE_NATIVE)
+        return json.dumps({'layer': layer.id(), 'parameters': asdict(parameters)},
+                          sort_keys=True, default=str)
+
+    @staticmethod
+    def selection(layer, parameters, filter_expr):
+        """
+        Pontos da camada inteira com a seleção atual
+
+        Returns:
+            tuple: (xs, ys, pesos com o tamanho da camada ou None, máscara selecionada)
+        """
+        from ..kde.weights import apply_weight_policy
+        from .native_heatmap_service import NativeHeatmapService
+
+        xs, ys, raw = NativeHeatmapService.extract_points(
+            layer, parameters.weight_field, False, parameters.weight_expression
+        )
+        selected = FilterService.mask(layer, filter_expr)
+        selected = np.ones(xs.size, dtype=bool) if selected is None else selected.copy()
+        weights = None
+        if raw is not None:
+            kept, keep = apply_weight_policy(raw, parameters.weight_null, parameters.weight_negative)
+            if keep is None:
+                weights = kept
+            else:
+                weights = np.zeros(xs.size)
+                weights[keep] = kept
+                selected &= keep
+        return xs, ys, weights, selected
+
+    @staticmethod
+    def retain(layer, parameters, filter_expr, grid, density, radius, kernel):
+        """
+        Guarda a densidade recém-calculada para recálculos incrementais
+
+        `parameters` são os do cálculo (`job.parameters`, motor já resolvido);
+        densidades de outro motor que não o "native" não são retidas.
+        """
+        from ..kde.engine import ENGINE_NATIVE
+        from ..kde.kernels import FOOTPRINT_CACHE
+
+        DeltaHeatmapService._retained = None
+        if parameters.engine != ENGINE_NATIVE:
+            return
+        if density.nbytes > MAX_RETAINED_MB * 1024 * 1024:
+            return
+        try:
+            _, _, _, selected = DeltaHeatmapService.selection(layer, parameters, filter_expr)
+            peak = FOOTPRINT_CACHE.get(kernel, radius, grid.pixel_size, None,
+                                       parameters.output_value, parameters.decay).values
+            DeltaHeatmapService._retained = RetainedDensity(
+                signature=DeltaHeatmapService.signature(layer, parameters),
+                arrays=PointArrayService.get(layer),
+                grid=grid,
+                density=np.asarray(density, dtype=np.float64),
+                selected=selected,
+                radius=float(radius),
+                kernel=int(kernel),
+                eps=1e-9 * float(np.abs(peak).max()) if peak.size else 0.0,
+            )
+        except Exception as e:
+            print(f"[CTCO] Densidade não retida para recálculo incremental: {e}")
+
+    @staticmethod
+    def try_update(layer, parameters, filter_expr, out_path, crs_wkt=""):
+        """
+        Atualiza a densidade retida com a diferença de seleção, se compensar
+
+        Returns:
+            dict: {'OUTPUT': caminho, 'engine': "native"} ou None para seguir com o
+            cálculo completo
+        """
+        from ..kde.engine import ENGINE_NATIVE, KdeEngine
+        from .raster_writer import write_geotiff
+
+        retained = DeltaHeatmapService._retained
+        if retained is None or retained.signature != DeltaHeatmapService.signature(layer, parameters):
+            return None
+        if retained.arrays is not PointArrayService.get(layer):
+            # Camada editada ou subset alterado: máscaras antigas não se alinham mais
+            DeltaHeatmapService._retained = None
+            return None
+
+        start = time.perf_counter()
+        xs, ys, weights, selected = DeltaHeatmapService.selection(layer, parameters, filter_expr)
+        left = retained.selected & ~selected
+        joined = selected & ~retained.selected
+        n_changed = int(left.sum() + joined.sum())
+        if n_changed >= int(selected.sum()):
+            return None
+        grid, radius = retained.grid, retained.radius
+        if joined.any():
+            jx, jy = xs[joined], ys[joined]
+            inside = ((jx.min() - radius >= grid.x_min) and (jx.max() + radius <= grid.x_max)
+                      and (jy.min() - radius >= grid.y_min) and (jy.max() + radius <= grid.y_max))
+            if not inside:
+                return None
+
+        try:
+            for mask, sign in ((left, -1.0), (joined, 1.0)):
+                if not mask.any():
+                    continue
+                w = np.ones(int(mask.sum())) if weights is None else weights[mask]
+                KdeEngine.splat(xs[mask], ys[mask], grid, radius, retained.kernel, sign * w,
+                                parameters.output_value, parameters.decay, out=retained.density)
+            retained.density[np.abs(retained.density) < retained.eps] = 0.0
+            retained.selected = selected
+            write_geotiff(out_path, retained.density, grid, crs_wkt)
+        except Exception:
+            # Grade parcialmente atualizada não serve mais de base
+            DeltaHeatmapService._retained = None
+            raise
+        print(f"[CTCO] Recálculo incremental: -{int(left.sum())} / +{int(joined.sum())} pontos "
+              f"em {time.perf_counter() - start:.2f}s")
+        return {'OUTPUT': out_path, 'engine': ENGINE_NATIVE}
+
+    @staticmethod
+    def clear():
+        DeltaHeatmapService._retained = None
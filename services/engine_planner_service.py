@@ -0,0 +1,229 @@
+"""
+Planejador de motor: escolhe o motor pelo custo previsto e aprende com as execuções
+
+Ideia central:
+- Com `engine="auto"`, o cálculo nativo pede ao `kde.planner.CostModel` a
+  previsão de tempo e memória de cada motor para os pontos, a grade e o raio
+  reais, e usa o mais rápido que cabe no orçamento de memória.
+- Antes de ler os pontos, `engine_for_layer` faz o mesmo com a extensão e a
+  contagem da camada para decidir entre o Processing e o motor nativo.
+- Cada execução registra previsto x real e recalibra o fator de escala do
+  motor; o modelo fica num JSON ao lado do cache de resultados e sobrevive a
+  reinícios do QGIS.
+"""
+
+import json
+import math
+import os
+import threading
+
+
+def nice_ceil(value: float) -> float:
+    """Arredonda para cima com 2 algarismos significativos (0.0123 -> 0.013, 1234 -> 1300)."""
+    value = float(value)
+    if value <= 0:
+        return value
+    scale = 10.0 ** (math.floor(math.log10(value)) - 1)
+    return round(math.ceil(value / scale - 1e-9) * scale, 12)
+
+
+class EnginePlanner:
+    """Decisão de motor por modelo de custo, com calibração persistente."""
+
+    _model = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def model_path() -> str:
+        from qgis.core import QgsApplication
+
+        folder = os.path.join(QgsApplication.qgisSettingsDirPath(), "ctco_cache")
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, "cost_model.json")
+
+    @staticmethod
+    def model():
+        """Modelo de custo em uso (carregado do disco na primeira vez)."""
+        from ..kde.planner import CostModel
+
+        with EnginePlanner._lock:
+            if EnginePlanner._model is None:
+                data = None
+                try:
+                    with open(EnginePlanner.model_path(), "r", encoding="utf-8") as fh:
+                        data = json.load(fh)
+                except (OSError, ValueError):
+                    pass
+                except Exception as e:
+                    print(f"[CTCO] Modelo de custo indisponível, usando o padrão: {e}")
+                EnginePlanner._model = CostModel.from_dict(data)
+            return EnginePlanner._model
+
+    @staticmethod
+    def _save():
+        model = EnginePlanner._model
+        if model is None:
+            return
+        try:
+            path = EnginePlanner.model_path()
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(model.to_dict(), fh, indent=2)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[CTCO] Falha ao salvar o modelo de custo: {e}")
+
+    @staticmethod
+    def _workers(parameters) -> int:
+        from ..kde.parallel import ParallelKde
+
+        workers = int(parameters.workers or 0)
+        return workers if workers > 0 else ParallelKde.default_workers()
+
+    @staticmethod
+    def features(parameters, points: int, rows: int, cols: int, radius: float, pixel_size: float) -> dict:
+        from ..kde.planner import plan_features
+
+        return plan_features(points, rows, cols, radius, pixel_size,
+                             EnginePlanner._workers(parameters), parameters.memory_budget_mb)
+
+    @staticmethod
+    def plan(parameters, points: int, grid, radius: float, engines=None):
+        """Plano para uma grade já conhecida (motores nativos por padrão)."""
+        from ..kde.engine import ENGINE_FFT, ENGINE_NATIVE, ENGINE_PARALLEL, ENGINE_TILED
+
+        features = EnginePlanner.features(parameters, points, grid.rows, grid.cols, radius, grid.pixel_size)
+        engines = engines or (ENGINE_NATIVE, ENGINE_FFT, ENGINE_TILED, ENGINE_PARALLEL)
+        plan = EnginePlanner.model().plan(features, engines)
+        print(f"[CTCO] Planejador: {points} pontos, grade {grid.cols}x{grid.rows} -> {plan.describe()}")
+        return plan
+
+    @staticmethod
+    def _native_only(parameters) -> bool:
+        """Recursos que o Processing ignoraria (peso por expressão, políticas, adaptativo)."""
+        weight_policy = parameters.is_weighted and (parameters.weight_null != "one"
+                                                    or parameters.weight_negative != "keep")
+        return bool(parameters.weight_expression or int(parameters.adaptive_k or 0) or weight_policy)
+
+    @staticmethod
+    def layer_features(layer, parameters, feature_count: int, bounds=None) -> dict:
+        """Grandezas do custo a partir da extensão da camada, sem ler os pontos."""
+        from ..kde.grid import KdeGrid
+
+        radius_mu, pixel_mu = parameters.to_map_units(layer)
+        if bounds is None:
+            extent = layer.extent()
+            bounds = (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum())
+        grid = KdeGrid.from_bounds(*bounds, radius_mu, pixel_mu)
+        return EnginePlanner.features(parameters, max(0, int(feature_count or 0)), grid.rows, grid.cols,
+                                      radius_mu, pixel_mu)
+
+    @staticmethod
+    def engine_for_layer(layer, parameters, feature_count: int, bounds=None) -> str:
+        """
+        Decide entre Processing e nativo antes de ler os pontos
+
+        Usa a extensão da camada (ou `bounds` = (x_min, y_min, x_max, y_max) do
+        filtro) e a contagem de pontos. Devolve "processing" ou "auto" (o motor
+        nativo exato é escolhido no `prepare`, já com a grade real).
+        """
+        from ..kde.engine import ENGINE_PROCESSING
+        from ..kde.planner import ENGINE_AUTO, PLANNABLE
+        from .native_heatmap_service import NativeHeatmapService
+
+        if not NativeHeatmapService.is_available():
+            return ENGINE_PROCESSING
+        if EnginePlanner._native_only(parameters):
+            return ENGINE_AUTO
+        from .projection_service import ProjectionService
+
+        if ProjectionService.needs_projection(layer, parameters):
+            # Processing calcularia em graus: só o nativo mede o raio em metros
+            return ENGINE_AUTO
+        try:
+            features = EnginePlanner.layer_features(layer, parameters, feature_count, bounds)
+            plan = EnginePlanner.model().plan(features, PLANNABLE)
+            print(f"[CTCO] Planejador: {features['points']} pontos, grade {features['cols']}x"
+                  f"{features['rows']} (extensão da camada) -> {plan.describe()}")
+        except Exception as e:
+            print(f"[CTCO] Planejador indisponível, usando o motor nativo: {e}")
+            return ENGINE_AUTO
+        return ENGINE_PROCESSING if plan.engine == ENGINE_PROCESSING else ENGINE_AUTO
+
+    @staticmethod
+    def fit_pixel_size(layer, parameters, feature_count: int, bounds=None, max_seconds=None,
+                       max_memory_mb=None, engines=None, min_pixel=None, max_raster_mb=None) -> float:
+        """
+        Menor pixel (metros) cujo cálculo previsto cabe em `max_seconds` e na memória
+
+        `engines` restringe os motores (padrão: os que o cálculo pode usar);
+        `min_pixel` (metros) limita o detalhe quando tudo é barato.
+        O pixel sai arredondado para cima com 2 algarismos significativos.
+        """
+        radius_mu, pixel_mu = parameters.to_map_units(layer)
+        # Metros -> unidades do mapa (mesma razão para raio e pixel)
+        factor = pixel_mu / float(parameters.pixel_size)
+        if bounds is None:
+            extent = layer.extent()
+            bounds = (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum())
+        x_min, y_min, x_max, y_max = bounds
+        pixel = EnginePlanner.model().fit_pixel_size(
+            max(0, int(feature_count or 0)), x_max - x_min, y_max - y_min, radius_mu,
+            EnginePlanner._workers(parameters), parameters.memory_budget_mb,
+            max_seconds=max_seconds, max_memory_mb=max_memory_mb,
+            engines=engines or EnginePlanner.candidate_engines(parameters),
+            min_pixel=None if min_pixel is None else float(min_pixel) * factor,
+            max_raster_mb=max_raster_mb,
+        ) / factor
+        return nice_ceil(pixel)
+
+    @staticmethod
+    def candidate_engines(parameters) -> tuple:
+        """Motores que o cálculo pode usar: todos no automático, senão só o escolhido."""
+        from ..kde.planner import ENGINE_AUTO, PLANNABLE
+
+        if parameters.engine != ENGINE_AUTO:
+            return (parameters.engine,)
+        if EnginePlanner._native_only(parameters):
+            return tuple(e for e in PLANNABLE if e != "processing")
+        return PLANNABLE
+
+    @staticmethod
+    def preview(layer, parameters, feature_count: int, bounds=None) -> dict:
+        """
+        Previsão antes de rodar: grade, GeoTIFF, carimbo, motor, tempo e memória
+
+        Returns:
+            dict: {'cols', 'rows', 'raster_mb', 'footprint_px', 'footprint_cells',
+                'engine', 'seconds', 'memory_mb', 'fits'}
+        """
+        from ..kde.planner import RASTER_BYTES
+
+        features = EnginePlanner.layer_features(layer, parameters, feature_count, bounds)
+        plan = EnginePlanner.model().plan(features, EnginePlanner.candidate_engines(parameters))
+        return {
+            'cols': features['cols'],
+            'rows': features['rows'],
+            'raster_mb': RASTER_BYTES * features['cols'] * features['rows'] / 1048576.0,
+            'footprint_px': 2 * features['half'] + 1,
+            'footprint_cells': int(round(features['footprint'])),
+            'engine': plan.engine,
+            'seconds': plan.estimate.seconds,
+            'memory_mb': plan.estimate.memory_mb,
+            'fits': plan.estimate.fits,
+        }
+
+    @staticmethod
+    def record(engine: str, features: dict, actual_s: float, predicted_s=None):
+        """Registra o tempo real de uma execução e recalibra o motor."""
+        model = EnginePlanner.model()
+        with EnginePlanner._lock:
+            scale = model.calibrate(engine, features, actual_s)
+            EnginePlanner._save()
+        predicted = "" if predicted_s is None else f"previsto {predicted_s:.2f}s, "
+        print(f"[CTCO] Planejador: motor {engine} {predicted}real {actual_s:.2f}s "
+              f"(fator de escala {scale:.2f}, {model.runs.get(engine, 0)} execuções)")
+
+    @staticmethod
+    def record_plan(plan, actual_s: float):
+        EnginePlanner.record(plan.engine, plan.features, actual_s, plan.estimate.seconds)
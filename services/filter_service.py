@@ -0,0 +1,350 @@
+"""
+Filtro vetorizado e não destrutivo para o heatmap
+
+Ideia central:
+- As cláusulas montadas pelo diálogo (comparações, IS [NOT] NULL, [NOT] LIKE/
+  ILIKE, IN, AND/OR/NOT e parênteses) são compiladas para máscaras NumPy sobre
+  os atributos em cache do PointArrayService.
+- A camada do usuário nunca é alterada (nada de setSubsetString).
+- Lógica de três valores como no QGIS: comparação com nulo é "desconhecida" e
+  não seleciona o ponto, nem sob NOT.
+- O que o compilador não entende (funções, aritmética, tipos mistos) é
+  avaliado pelo próprio QGIS com `QgsFeatureRequest.setFilterExpression`.
+"""
+
+import re
+
+import numpy as np
+
+from qgis.core import QgsFeatureRequest
+
+from .point_array_service import PointArrayService
+
+
+class UnsupportedFilter(Exception):
+    """Expressão fora do subconjunto compilável (usar a avaliação do QGIS)."""
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<quoted>"(?:[^"]|"")*")
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<op><=|>=|<>|!=|==|=|<|>)
+    | (?P<paren>[(),])
+    | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"AND", "OR", "NOT", "IS", "NULL", "LIKE", "ILIKE", "IN"}
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise UnsupportedFilter(f"trecho não reconhecido: {text[pos:pos + 20]!r}")
+        kind = match.lastgroup
+        raw = match.group(kind)
+        if kind == "quoted":
+            tokens.append(("field", raw[1:-1].replace('""', '"')))
+        elif kind == "string":
+            tokens.append(("value", raw[1:-1].replace("''", "'")))
+        elif kind == "number":
+            tokens.append(("value", float(raw)))
+        elif kind == "word":
+            upper = raw.upper()
+            tokens.append(("kw", upper) if upper in _KEYWORDS else ("field", raw))
+        else:
+            tokens.append((kind, raw))
+        pos = match.end()
+    return tokens
+
+
+class FilterCompiler:
+    """Analisador descendente recursivo do subconjunto de expressões do diálogo."""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(str(text or ""))
+        self.pos = 0
+
+    @staticmethod
+    def parse(text):
+        """
+        Converte a expressão em árvore de tuplas
+
+        Raises:
+            UnsupportedFilter: Se a expressão sair do subconjunto suportado
+        """
+        compiler = FilterCompiler(text)
+        if not compiler.tokens:
+            raise UnsupportedFilter("expressão vazia")
+        node = compiler._or()
+        if compiler.pos != len(compiler.tokens):
+            raise UnsupportedFilter(f"sobrou {compiler.tokens[compiler.pos]}")
+        return node
+
+    @staticmethod
+    def fields(node):
+        """Campos referenciados pela árvore."""
+        if node[0] in ("and", "or"):
+            return FilterCompiler.fields(node[1]) | FilterCompiler.fields(node[2])
+        if node[0] == "not":
+            return FilterCompiler.fields(node[1])
+        return {node[1]}
+
+    def _peek(self, kind=None, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        if kind is not None and token[0] != kind:
+            return None
+        if value is not None and token[1] != value:
+            return None
+        return token
+
+    def _take(self, kind=None, value=None):
+        token = self._peek(kind, value)
+        if token is None:
+            raise UnsupportedFilter(f"esperado {value or kind}")
+        self.pos += 1
+        return token
+
+    def _or(self):
+        node = self._and()
+        while self._peek("kw", "OR"):
+            self.pos += 1
+            node = ("or", node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._peek("kw", "AND"):
+            self.pos += 1
+            node = ("and", node, self._not())
+        return node
+
+    def _not(self):
+        if self._peek("kw", "NOT"):
+            self.pos += 1
+            return ("not", self._not())
+        if self._peek("paren", "("):
+            self.pos += 1
+            node = self._or()
+            self._take("paren", ")")
+            return node
+        return self._predicate()
+
+    def _predicate(self):
+        field = self._take("field")[1]
+        if self._peek("kw", "IS"):
+            self.pos += 1
+            negate = bool(self._peek("kw", "NOT"))
+            if negate:
+                self.pos += 1
+            self._take("kw", "NULL")
+            return ("null", field, negate)
+        negate = bool(self._peek("kw", "NOT"))
+        if negate:
+            self.pos += 1
+        if self._peek("kw", "LIKE") or self._peek("kw", "ILIKE"):
+            insensitive = self._take("kw")[1] == "ILIKE"
+            pattern = self._take("value")[1]
+            if not isinstance(pattern, str):
+                raise UnsupportedFilter("LIKE com número")
+            return ("like", field, pattern, insensitive, negate)
+        if self._peek("kw", "IN"):
+            self.pos += 1
+            self._take("paren", "(")
+            values = [self._take("value")[1]]
+            while self._peek("paren", ","):
+                self.pos += 1
+                values.append(self._take("value")[1])
+            self._take("paren", ")")
+            return ("in", field, values, negate)
+        if negate:
+            raise UnsupportedFilter("NOT fora de LIKE/IN")
+        op = self._take("op")[1]
+        value = self._take("value")[1]
+        return ("cmp", field, op, value)
+
+
+def _like_regex(pattern, insensitive):
+    parts = []
+    for char in pattern:
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts) + r"\Z", re.DOTALL | (re.IGNORECASE if insensitive else 0))
+
+
+def _text_column(column):
+    """Garante coluna de texto (object com str/None); outros tipos não são compilados."""
+    if column.dtype != object:
+        raise UnsupportedFilter("comparação de texto com campo numérico")
+    for value in column:
+        if value is not None and not isinstance(value, str):
+            raise UnsupportedFilter("campo com tipos não textuais")
+    return column
+
+
+def _by_unique(column, predicate):
+    """Aplica o predicado uma vez por valor distinto (colunas de texto repetem muito)."""
+    known = np.array([v is not None for v in column], dtype=bool)
+    result = np.zeros(column.size, dtype=bool)
+    if known.any():
+        uniques, inverse = np.unique(column[known].astype(str), return_inverse=True)
+        hits = np.array([bool(predicate(u)) for u in uniques], dtype=bool)
+        result[known] = hits[inverse]
+    return result, known
+
+
+_NUMERIC_OPS = {
+    "=": np.equal, "==": np.equal, "!=": np.not_equal, "<>": np.not_equal,
+    "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+}
+
+
+def evaluate(node, column):
+    """
+    Avalia a árvore com lógica de três valores
+
+    Args:
+        node: Árvore de FilterCompiler.parse
+        column: Função nome_do_campo -> array alinhado aos pontos
+
+    Returns:
+        tuple: (verdadeiro, conhecido) como máscaras booleanas
+    """
+    kind = node[0]
+    if kind == "and":
+        at, ak = evaluate(node[1], column)
+        bt, bk = evaluate(node[2], column)
+        return at & bt, (ak & bk) | (ak & ~at) | (bk & ~bt)
+    if kind == "or":
+        at, ak = evaluate(node[1], column)
+        bt, bk = evaluate(node[2], column)
+        return at | bt, (ak & bk) | at | bt
+    if kind == "not":
+        t, k = evaluate(node[1], column)
+        return k & ~t, k
+
+    values = column(node[1])
+    if kind == "null":
+        if values.dtype == object:
+            nulls = np.array([v is None for v in values], dtype=bool)
+        else:
+            nulls = np.isnan(values)
+        return (~nulls if node[2] else nulls), np.ones(values.size, dtype=bool)
+
+    if kind == "like":
+        regex = _like_regex(node[2], node[3])
+        hits, known = _by_unique(_text_column(values), regex.match)
+        return (known & ~hits if node[4] else hits), known
+
+    if kind == "in":
+        wanted = node[2]
+        if all(isinstance(v, float) for v in wanted) and values.dtype != object:
+            hits = np.isin(values, np.asarray(wanted, dtype=np.float64))
+            known = ~np.isnan(values)
+        elif all(isinstance(v, str) for v in wanted):
+            wanted = set(wanted)
+            hits, known = _by_unique(_text_column(values), lambda v: v in wanted)
+        else:
+            raise UnsupportedFilter("IN com tipos mistos")
+        return (known & ~hits if node[3] else hits & known), known
+
+    # Comparação
+    op, value = node[2], node[3]
+    if isinstance(value, float):
+        if values.dtype == object:
+            raise UnsupportedFilter("comparação numérica com campo de texto")
+        known = ~np.isnan(values)
+        with np.errstate(invalid="ignore"):
+            return _NUMERIC_OPS[op](values, value) & known, known
+    text = _text_column(values)
+    compare = _NUMERIC_OPS[op]
+    return _by_unique(text, lambda v: compare(v, value))
+
+
+class FilterService:
+    """Máscaras de filtro alinhadas aos PointArrays da camada."""
+
+    # (id da camada, expressão) -> (arrays usados, máscara)
+    _masks = {}
+
+    @staticmethod
+    def mask(layer, expression_text):
+        """
+        Pontos da camada que satisfazem a expressão
+
+        Args:
+            layer: Camada de pontos (não é modificada)
+            expression_text: Expressão de filtro; vazia = todos os pontos
+
+        Returns:
+            np.ndarray: Máscara booleana alinhada a PointArrayService.get(layer),
+            ou None quando não há filtro
+        """
+        if not expression_text or not str(expression_text).strip():
+            return None
+        expression_text = str(expression_text).strip()
+        arrays = PointArrayService.get(layer)
+        key = (layer.id(), expression_text)
+        cached = FilterService._masks.get(key)
+        if cached is not None and cached[0] is arrays:
+            return cached[1]
+
+        try:
+            mask = FilterService._compiled_mask(layer, expression_text)
+        except UnsupportedFilter as e:
+            print(f"[CTCO] Filtro avaliado pelo QGIS ({e}): {expression_text}")
+            mask = FilterService._request_mask(layer, expression_text, arrays.fids)
+
+        # Máscaras guardadas só enquanto os arrays da camada forem os mesmos
+        FilterService._masks = {k: v for k, v in FilterService._masks.items()
+                                if k[0] != layer.id() or v[0] is arrays}
+        FilterService._masks[key] = (arrays, mask)
+        return mask
+
+    @staticmethod
+    def count(layer, expression_text) -> int:
+        """Quantidade de pontos que passam no filtro (todos se vazio)."""
+        mask = FilterService.mask(layer, expression_text)
+        if mask is None:
+            return PointArrayService.get(layer).count
+        return int(mask.sum())
+
+    @staticmethod
+    def bounds(layer, expression_text):
+        """Extensão (x_min, y_min, x_max, y_max) dos pontos filtrados ou None."""
+        return PointArrayService.get(layer).extent(FilterService.mask(layer, expression_text))
+
+    @staticmethod
+    def _compiled_mask(layer, expression_text):
+        node = FilterCompiler.parse(expression_text)
+        names = FilterCompiler.fields(node)
+        field_names = set(layer.fields().names())
+        unknown = names - field_names
+        if unknown:
+            raise UnsupportedFilter(f"campos desconhecidos: {', '.join(sorted(unknown))}")
+        arrays = PointArrayService.get(layer, sorted(names))
+        truth, _ = evaluate(node, lambda name: arrays.attributes[name])
+        return truth
+
+    @staticmethod
+    def _request_mask(layer, expression_text, point_fids):
+        """Fallback: o QGIS seleciona as feições (o provedor pode traduzir para SQL)."""
+        request = QgsFeatureRequest()
+        request.setFilterExpression(expression_text)
+        if request.filterExpression() is not None and request.filterExpression().hasParserError():
+            raise ValueError(f"Filtro inválido: {request.filterExpression().parserErrorString()}")
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setNoAttributes()
+        fids = np.fromiter((f.id() for f in layer.getFeatures(request)), dtype=np.int64)
+        return np.isin(point_fids, fids)
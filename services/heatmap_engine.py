@@ -0,0 +1,232 @@
+"""
+API sem interface gráfica para gerar heatmaps (scripts, tarefas agendadas)
+
+Ideia central:
+- Nada de iface, QMessageBox ou QFileDialog: entra uma fonte (caminho/URI OGR
+  ou QgsVectorLayer), HeatmapParameters e o GeoTIFF de saída; sai um relatório
+  de tempos por job.
+- O cálculo é o mesmo do diálogo (NativeHeatmapService.prepare/execute, com o
+  recálculo incremental quando só o filtro muda).
+- Uma camada por fonte fica aberta no processo: jobs que compartilham a fonte
+  reaproveitam os PointArrays em cache (e o cache de pontos em disco entre
+  processos e execuções).
+- `run_many` distribui os jobs num pool de processos, agrupados por fonte.
+
+Fora do QGIS, rode com o Python distribuído com o QGIS (ex.: OSGeo4W Shell);
+`QGIS_PREFIX_PATH` indica a instalação, se necessário.
+"""
+
+import os
+import time
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Aplicação QGIS sem interface criada por ensure_qgis (mantida viva no processo)
+_APP = []
+
+
+def _run_chunk(jobs):
+    """Processo de trabalho: executa jobs (mesma fonte) em sequência."""
+    return [HeatmapEngine.run_job(job) for job in jobs]
+
+
+class HeatmapEngine:
+    """Heatmaps sem interface: uma função por job e um executor em lote."""
+
+    # fonte -> QgsVectorLayer aberta neste processo
+    _layers = {}
+
+    @staticmethod
+    def ensure_qgis():
+        """Inicializa o QGIS sem interface, se o processo ainda não tiver uma aplicação."""
+        from qgis.core import QgsApplication
+
+        if QgsApplication.instance() is not None:
+            return
+        prefix = os.environ.get("QGIS_PREFIX_PATH")
+        if prefix:
+            QgsApplication.setPrefixPath(prefix, True)
+        app = QgsApplication([], False)
+        app.initQgis()
+        _APP.append(app)
+
+    @staticmethod
+    def open_source(source):
+        """
+        Camada de pontos da fonte (aberta uma vez por processo)
+
+        Args:
+            source: QgsVectorLayer ou URI OGR (ex.: "dados.gpkg|layername=pontos")
+
+        Raises:
+            ValueError: Fonte inválida ou sem geometria de pontos
+        """
+        from qgis.core import QgsVectorLayer, QgsWkbTypes
+
+        if isinstance(source, QgsVectorLayer):
+            return source
+        key = str(source)
+        layer = HeatmapEngine._layers.get(key)
+        if layer is not None:
+            return layer
+        HeatmapEngine.ensure_qgis()
+        name = os.path.splitext(os.path.basename(key.split("|")[0]))[0] or "pontos"
+        layer = QgsVectorLayer(key, name, "ogr")
+        if not layer.isValid():
+            raise ValueError(f"Fonte inválida ou inacessível: {key}")
+        if layer.geometryType() != QgsWkbTypes.PointGeometry:
+            raise ValueError(f"A fonte não é uma camada de pontos: {key}")
+        HeatmapEngine._layers[key] = layer
+        return layer
+
+    @staticmethod
+    def run(source, parameters, output_path, filter_expr=None, progress=None) -> dict:
+        """
+        Gera o heatmap da fonte em `output_path`
+
+        Args:
+            source: QgsVectorLayer ou URI OGR
+            parameters: HeatmapParameters
+            output_path: GeoTIFF de destino
+            filter_expr: Filtro sobre os atributos (a fonte não é alterada)
+            progress: Chamado como progress(fração); pode lançar KdeCancelled
+
+        Returns:
+            dict: Relatório do job (saída, pontos, grade e tempos em segundos)
+        """
+        from ..kde.engine import ENGINE_NATIVE, ENGINE_PROCESSING
+        from .delta_heatmap_service import DeltaHeatmapService
+        from .native_heatmap_service import NativeHeatmapService
+
+        start = time.perf_counter()
+        layer = HeatmapEngine.open_source(source)
+        open_s = time.perf_counter() - start
+        if parameters.engine == ENGINE_PROCESSING:
+            # O Processing depende do framework de algoritmos da interface
+            print("[CTCO] Aviso: motor processing indisponível sem interface; usando o nativo")
+            parameters = replace(parameters, engine=ENGINE_NATIVE)
+        folder = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(folder, exist_ok=True)
+
+        report = {
+            'source': layer.source(),
+            'output': output_path,
+            'filter': filter_expr or "",
+            # Motor que de fato calculou (resolvido abaixo; "auto" nunca fica no relatório)
+            'engine': parameters.engine,
+            'open_s': round(open_s, 4),
+        }
+        compute_start = time.perf_counter()
+        if NativeHeatmapService.try_incremental(layer, parameters, filter_expr, output_path) is not None:
+            # Diferença de seleção sobre a última densidade (carimbo exato)
+            report.update(engine="incremental", mode="incremental", read_s=0.0)
+        else:
+            job = NativeHeatmapService.prepare(layer, parameters, filter_expr)
+            compute_start = time.perf_counter()
+            NativeHeatmapService.execute(job, output_path, None, progress)
+            if job.density is not None:
+                DeltaHeatmapService.retain(layer, job.parameters, filter_expr, job.grid, job.density,
+                                           job.radius, job.kernel)
+                job.density = None
+            report.update(engine=job.parameters.engine, mode="full", read_s=round(job.read_s, 4),
+                          points=int(job.xs.size), grid=[int(job.grid.cols), int(job.grid.rows)])
+        report['compute_s'] = round(time.perf_counter() - compute_start, 4)
+        report['total_s'] = round(time.perf_counter() - start, 4)
+        return report
+
+    @staticmethod
+    def run_job(job: dict) -> dict:
+        """
+        Executa um job do manifesto sem propagar erros
+
+        Args:
+            job: {'index', 'source', 'output', 'parameters' (dict), 'filter' (opcional)}
+
+        Returns:
+            dict: Relatório com 'status' ("ok" ou "error")
+        """
+        from ..models.heatmap_parameters import HeatmapParameters
+
+        start = time.perf_counter()
+        report = {'index': job.get('index'), 'name': job.get('name', ""), 'pid': os.getpid()}
+        try:
+            parameters = HeatmapParameters.from_dict(dict(job.get('parameters') or {}))
+            report.update(HeatmapEngine.run(job['source'], parameters, job['output'], job.get('filter')))
+            report['status'] = "ok"
+        except Exception as e:
+            report.update(status="error", error=f"{type(e).__name__}: {e}",
+                          source=str(job.get('source')), output=job.get('output'),
+                          total_s=round(time.perf_counter() - start, 4))
+            print(f"[CTCO] Job {job.get('index')} falhou: {e}")
+        return report
+
+    @staticmethod
+    def plan_chunks(jobs, workers: int):
+        """
+        Agrupa os jobs por fonte e divide cada grupo entre os processos
+
+        Cada grupo recebe processos em proporção ao número de jobs, no máximo
+        `workers` ao todo por fonte; dentro de um pedaço a ordem do manifesto é
+        mantida (filtros em sequência aproveitam o recálculo incremental).
+
+        Returns:
+            list: Listas de jobs, uma por tarefa do pool
+        """
+        groups = {}
+        for job in jobs:
+            groups.setdefault(str(job['source']), []).append(job)
+        chunks = []
+        for group in groups.values():
+            share = max(1, min(len(group), round(workers * len(group) / max(1, len(jobs)))))
+            size = -(-len(group) // share)
+            chunks.extend(group[i:i + size] for i in range(0, len(group), size))
+        # Pedaços maiores primeiro: o pool termina mais equilibrado
+        return sorted(chunks, key=len, reverse=True)
+
+    @staticmethod
+    def run_many(jobs, workers: int = 0, on_report=None) -> list:
+        """
+        Executa vários jobs em um pool de processos
+
+        Args:
+            jobs: Jobs no formato de `run_job`
+            workers: Processos (0 = todos os núcleos; 1 = no próprio processo)
+            on_report: Chamado com o relatório de cada job ao terminar
+
+        Returns:
+            list: Relatórios na ordem dos jobs
+        """
+        from multiprocessing import get_context
+        from ..kde.parallel import ParallelKde, _python_executable
+
+        jobs = [dict(job, index=job.get('index', i)) for i, job in enumerate(jobs)]
+        workers = int(workers) if workers and int(workers) > 0 else ParallelKde.default_workers()
+        workers = max(1, min(workers, len(jobs)))
+        notify = on_report if on_report is not None else (lambda report: None)
+        reports = {}
+
+        if workers == 1:
+            HeatmapEngine.ensure_qgis()
+            for job in jobs:
+                reports[job['index']] = report = HeatmapEngine.run_job(job)
+                notify(report)
+        else:
+            # Dentro do pool, o motor paralelo abriria outro pool por job
+            for job in jobs:
+                params = job.setdefault('parameters', {})
+                if params.get('engine') == "parallel":
+                    params['engine'] = "tiled"
+                elif params.get('engine') == "auto":
+                    # Planejador com um processo por job: nunca escolhe o paralelo
+                    params['workers'] = 1
+            ctx = get_context("spawn")
+            ctx.set_executable(_python_executable())
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=HeatmapEngine.ensure_qgis) as executor:
+                futures = [executor.submit(_run_chunk, chunk)
+                           for chunk in HeatmapEngine.plan_chunks(jobs, workers)]
+                for future in as_completed(futures):
+                    for report in future.result():
+                        reports[report['index']] = report
+                        notify(report)
+        return [reports[job['index']] for job in jobs]
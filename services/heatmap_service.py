@@ -5,6 +5,9 @@ Contém lógica de negócio para processamento de heatmaps
 
 import os
 import tempfile
+import time
+from dataclasses import replace
+
 import processing
 from qgis.core import QgsMapLayer, QgsWkbTypes, QgsProject, QgsRasterLayer
 from qgis.PyQt.QtWidgets import QMessageBox, QProgressDialog, QProgressBar, QFileDialog
@@ -15,6 +18,17 @@ from ..models.heatmap_parameters import HeatmapParameters
 from .color_service import ColorService
 from .heatmap_utils import estimate_dynamic_radius, resolve_output_layer
 from .export_service import ExportService
+from .native_heatmap_service import NativeHeatmapService
+from .result_cache_service import HeatmapResultCache
+from .live_heatmap_service import LiveHeatmapService
+from .viewport_heatmap_service import ViewportHeatmapService
+from .filter_service import FilterService
+from .bandwidth_service import BandwidthService
+
+# Tempo previsto alvo (s) do pixel automático quando o heatmap roda sem diálogo
+AUTO_TIME_TARGET_S = 5.0
+# Detalhe máximo do pixel automático (pixels por raio)
+AUTO_PIXELS_PER_RADIUS = 50
 
 
 class HeatmapService:
@@ -108,72 +122,118 @@ class HeatmapService:
                 QMessageBox.warning(None, "Aviso", error_msg)
                 return
             
-            # Aplicar filtro se fornecido (na camada original)
+            # Filtro não destrutivo: máscara sobre os arrays em cache (a camada não é alterada)
             filtered_layer = layer
             filter_expr = (config or {}).get("filter_expr") if config else None
+            filter_bounds = None
             if filter_expr:
                 try:
-                    prev_subset = ""
-                    try:
-                        if hasattr(layer, 'subsetString'):
-                            prev_subset = layer.subsetString() or ""
-                    except Exception:
-                        prev_subset = ""
-                    # Tentar aplicar diretamente como subset do provedor
-                    if hasattr(layer, 'setSubsetString'):
-                        layer.setSubsetString(str(filter_expr))
-                        filtered_layer = layer
-                        print(f"Subset aplicado na camada original: {filter_expr}")
-                    else:
-                        raise Exception("Camada não suporta subsetString")
+                    feature_count = FilterService.count(layer, filter_expr)
+                    filter_bounds = FilterService.bounds(layer, filter_expr)
+                    print(f"Filtro aplicado sem alterar a camada ({feature_count} pontos): {filter_expr}")
                 except Exception as e:
-                    print(f"Falha ao aplicar subsetString; tentando extrair por expressão: {e}")
-                    # Fallback: usar camada temporária filtrada (não altera original)
-                    try:
-                        import processing
-                        params = {
-                            'INPUT': layer,
-                            'EXPRESSION': str(filter_expr),
-                            'OUTPUT': 'TEMPORARY_OUTPUT'
-                        }
-                        res = processing.run("native:extractbyexpression", params)
-                        cand = res.get('OUTPUT')
-                        if cand is not None:
-                            filtered_layer = cand
-                            print(f"Filtro (fallback) aplicado por expressão: {filter_expr}")
-                    except Exception as e2:
-                        print(f"Falha no fallback de filtro '{filter_expr}': {e2}")
+                    QMessageBox.warning(None, "Aviso", f"Filtro inválido: {e}")
+                    return
+            else:
+                feature_count = LayerValidator.get_feature_count(filtered_layer)
 
             # Validação mínima de pontos (>= 3) na camada filtrada
-            feature_count = LayerValidator.get_feature_count(filtered_layer)
             if feature_count is not None and feature_count < 3:
                 QMessageBox.warning(None, "Aviso", "Filtro resultou em menos de 3 pontos. Ajuste o filtro.")
                 return
 
             # Obter parâmetros (do diálogo ou otimizados)
             if config:
-                parameters = HeatmapParameters(
-                    radius=config.get("radius", 50),
-                    pixel_size=config.get("pixel_size", 1),
-                    transparent=config.get("transparent", 60),
-                    weight_field='',
-                    kernel=config.get("kernel", 0),
-                    decay=0,
-                    output_value=0,
-                    description='Parâmetros personalizados'
-                )
+                parameters = HeatmapService._parameters_from_config(config)
             else:
                 parameters = HeatmapParameters.get_optimized_parameters(feature_count)
 
             # Sugerir/ajustar raio dinamicamente por densidade
+            bandwidth = (config or {}).get("bandwidth", "fixed")
             try:
-                if not config or "radius" not in config:
-                    parameters.radius = estimate_dynamic_radius(filtered_layer, feature_count)
+                if not config or "radius" not in config or bandwidth == "auto":
+                    parameters.radius = estimate_dynamic_radius(filtered_layer, feature_count, filter_bounds)
             except Exception:
                 pass
+            # Seletores estatísticos (Silverman, Scott, vizinhos, validação cruzada)
+            if bandwidth not in ("fixed", "auto"):
+                try:
+                    radius_m, _ = BandwidthService.estimate(filtered_layer, bandwidth, filter_expr, parameters.kernel)
+                    parameters.radius = max(1, int(round(radius_m)))
+                except Exception as e:
+                    print(f"[CTCO] Seletor de raio '{bandwidth}' falhou, mantendo {parameters.radius} m: {e}")
             
+            if not config:
+                # Sem diálogo: menor pixel cujo cálculo previsto cabe no tempo alvo
+                try:
+                    from .engine_planner_service import EnginePlanner
+                    parameters.pixel_size = EnginePlanner.fit_pixel_size(
+                        filtered_layer, parameters, feature_count, filter_bounds,
+                        max_seconds=AUTO_TIME_TARGET_S, min_pixel=parameters.radius / AUTO_PIXELS_PER_RADIUS)
+                except Exception as e:
+                    print(f"[CTCO] Pixel automático indisponível, mantendo {parameters.pixel_size} m: {e}")
+
+            if parameters.engine == "auto":
+                from .engine_planner_service import EnginePlanner
+                # Processing x nativo pelo custo previsto; o motor nativo exato sai no prepare
+                parameters.engine = EnginePlanner.engine_for_layer(layer, parameters, feature_count,
+                                                                   filter_bounds)
+
+            if parameters.adaptive_k and ((config or {}).get("viewport") or (config or {}).get("live")):
+                # Raios dependem de todos os vizinhos: não cabem em recálculos locais
+                print("[CTCO] Aviso: modos ao vivo e de exploração usam raio fixo (adaptativo ignorado)")
+
+            # Série temporal: um quadro (banda) por janela deslizante do campo de data/hora
+            if (config or {}).get("time_field") and NativeHeatmapService.is_available():
+                HeatmapService._run_temporal(layer, parameters, filter_expr, config)
+                return
+
+            # Separar por campo: uma banda por categoria + banda total, numa só passada
+            split_field = (config or {}).get("split_field")
+            if split_field and NativeHeatmapService.is_available():
+                HeatmapService._run_categorical(layer, parameters, split_field, filter_expr, config)
+                return
+
+            # Modo vista: densidade só da área visível, recalculada a cada pan/zoom
+            if (config or {}).get("viewport") and NativeHeatmapService.is_available():
+                if ViewportHeatmapService.attach(filtered_layer, parameters, config) is not None:
+                    return
+
+            # Cache de resultados: mesma fonte + filtro + parâmetros => reaproveita o GeoTIFF
+            output_path = HeatmapService._resolve_output_path(layer, config)
+            cache_keys = {}
+            cached_path = None
+            if (config or {}).get("use_cache", True) and not (config or {}).get("live") and HeatmapResultCache.is_enabled():
+                try:
+                    # Uma chave por motor: "auto" aceita o resultado de qualquer motor nativo
+                    cache_keys = HeatmapResultCache.engine_keys(filtered_layer, parameters, filter_expr)
+                    for cache_key in cache_keys.values():
+                        cached_path = HeatmapResultCache.lookup(cache_key)
+                        if cached_path:
+                            break
+                except Exception as e:
+                    print(f"[CTCO] Cache de heatmaps indisponível: {e}")
+
+            # Prévia progressiva: a mensagem modal atrasaria justamente a primeira imagem
+            progressive = bool((config or {}).get("progressive")) and not (config or {}).get("live")
+            preview_handler = None
+            if progressive and not cached_path:
+                preview_handler = HeatmapService._PreviewLayers(layer.name(), config or {})
+
+            # Motor nativo em segundo plano: a interface segue livre e a tarefa pode ser cancelada
+            if not cached_path and HeatmapService._runs_in_background(config, parameters):
+                handled = HeatmapService._submit_background(
+                    layer, filtered_layer, parameters, feature_count, output_path,
+                    filter_expr, cache_keys, preview_handler, config or {}
+                )
+                if handled:
+                    # As prévias passam a ser da tarefa (removidas quando ela termina)
+                    preview_handler = None
+                    return
+
             # Mostrar mensagem de processamento
-            HeatmapService._show_processing_message(feature_count, parameters)
+            if not cached_path and preview_handler is None:
+                HeatmapService._show_processing_message(feature_count, parameters)
             
             # Indicador de progresso não intrusivo na barra do QGIS
             progress = None
@@ -211,91 +271,26 @@ class HeatmapService:
                 except Exception:
                     progress = None
 
-            # Executar algoritmo (usando a camada filtrada)
-            result = HeatmapService._execute_heatmap_algorithm(filtered_layer, parameters, feature_count)
+            # Executar algoritmo (usando a camada filtrada); o motor nativo grava direto no destino
+            live_session = None
+            if (config or {}).get("live") and NativeHeatmapService.is_available():
+                # Modo ao vivo: grade mantida em memória e atualizada a cada edição da camada
+                live_session, result = LiveHeatmapService.attach(
+                    filtered_layer, parameters, filter_expr, output_path=output_path
+                )
+            elif cached_path:
+                result = {'OUTPUT': HeatmapResultCache.materialize(cached_path, output_path)}
+            else:
+                result = HeatmapService._execute_heatmap_algorithm(
+                    filtered_layer, parameters, feature_count, output_path=output_path,
+                    on_preview=preview_handler, filter_expr=filter_expr
+                )
+                result = HeatmapService._store_result(cache_keys, result, filtered_layer.source(),
+                                                      filter_expr, parameters, output_path)
             
             # Aplicar rampa de cores (padrão: BCYR). Para testar 0-30, use min_val/max_val do config
             if result and 'OUTPUT' in result:
-                output_ref = result['OUTPUT']
-                print(f"OUTPUT bruto do processing: {type(output_ref)} -> {output_ref}")
-
-                output_layer = resolve_output_layer(output_ref)
-                # Garantir que apenas UMA camada seja adicionada ao projeto
-                try:
-                    if hasattr(output_layer, 'id'):
-                        prj = QgsProject.instance()
-                        if prj.mapLayer(output_layer.id()) is None:
-                            prj.addMapLayer(output_layer)
-                except Exception:
-                    pass
-
-                # Se usuário informou uma pasta de saída, salvar cópia do raster lá
-                try:
-                    out_dir = (config or {}).get("output_dir") if config else None
-                    if out_dir and isinstance(output_layer, QgsRasterLayer) and os.path.isdir(out_dir):
-                        # Determinar nome base do arquivo
-                        user_name = (config or {}).get("output_filename") if config else None
-                        if user_name:
-                            # Remover caminho, manter somente o nome e sanitizar caracteres inválidos básicos
-                            user_name = os.path.basename(str(user_name)).strip()
-                            # Substituir separadores e caracteres indesejados
-                            safe_name = "".join([c if c.isalnum() or c in ("-", "_", ".", " ") else "_" for c in user_name])
-                            # Garantir extensão .tif
-                            if not safe_name.lower().endswith(".tif"):
-                                safe_name += ".tif"
-                            base_name = safe_name
-                        else:
-                            base_base = os.path.basename(getattr(layer, 'name', lambda: 'layer')() if hasattr(layer, 'name') else 'layer')
-                            base_name = f"heatmap_{base_base}.tif"
-                        out_path = os.path.join(out_dir, base_name)
-                        from qgis.core import QgsRasterFileWriter
-                        prov = output_layer.dataProvider()
-                        src_path = output_layer.source()
-                        # Tenta copiar fisicamente criando novo raster no destino
-                        ok = False
-                        try:
-                            writer = QgsRasterFileWriter(out_path)
-                            ok = writer.writeRaster(output_layer.dataProvider().clone(), output_layer.width(), output_layer.height(), output_layer.extent(), output_layer.crs()) == QgsRasterFileWriter.NoError
-                        except Exception:
-                            ok = False
-                        if not ok:
-                            try:
-                                import shutil
-                                if os.path.exists(src_path):
-                                    shutil.copy2(src_path, out_path)
-                                    ok = True
-                            except Exception:
-                                ok = False
-                        if ok:
-                            try:
-                                saved_layer = QgsRasterLayer(out_path, os.path.basename(out_path))
-                                if saved_layer.isValid():
-                                    prj = QgsProject.instance()
-                                    # Remover a camada temporária (se já estiver no projeto)
-                                    try:
-                                        if hasattr(output_layer, 'id') and prj.mapLayer(output_layer.id()) is not None:
-                                            prj.removeMapLayer(output_layer.id())
-                                    except Exception:
-                                        pass
-                                    prj.addMapLayer(saved_layer)
-                                    output_layer = saved_layer
-                                    print(f"Heatmap salvo em: {out_path}")
-                            except Exception:
-                                pass
-                except Exception as _e:
-                    print(f"Não foi possível salvar cópia do heatmap: {_e}")
-
-                # Aplicar após o carregamento com pequenas tentativas
-                HeatmapService._apply_palette_with_retry(output_layer, config or {}, attempts=6, delay_ms=150)
-
-                # Registrar propriedades iniciais para reset
-                try:
-                    palette_name = (config or {}).get("palette", "BCYR")
-                    scale_mode = (config or {}).get("scale", "linear")
-                    output_layer.setCustomProperty("ctco_initial_palette", palette_name)
-                    output_layer.setCustomProperty("ctco_initial_scale", scale_mode)
-                except Exception:
-                    pass
+                HeatmapService._load_result(result, output_path, config, live_session, preview_handler)
             
             try:
                 if progress:
@@ -309,6 +304,11 @@ class HeatmapService:
             QMessageBox.critical(None, "Erro", f"Erro ao executar heatmap: {str(e)}")
             print(f"Erro detalhado: {e}")
         finally:
+            try:
+                if preview_handler is not None:
+                    preview_handler.clear()
+            except Exception:
+                pass
             try:
                 if bar_widget is not None:
                     from qgis.utils import iface
@@ -322,30 +322,509 @@ class HeatmapService:
                 pass
 
     @staticmethod
-    def _execute_heatmap_algorithm(layer, parameters, feature_count):
+    def run_batch(variants, config=None):
+        """
+        Gera vários heatmaps (filtros e/ou camadas) numa grade comum alinhada
+
+        Args:
+            variants: Lista de BatchVariant (camada, filtro, nome)
+            config: Configuração do diálogo (raio, pixel, kernel, paleta, output_dir)
+
+        Returns:
+            list: Camadas raster carregadas, na ordem das variantes
         """
-        Executa o algoritmo de heatmap com base no número de features
+        from .batch_heatmap_service import BatchHeatmapService
+
+        config = dict(config or {})
+        if not variants:
+            QMessageBox.warning(None, "Aviso", "Nenhuma variante informada para o lote.")
+            return []
+        for variant in variants:
+            is_valid, error_msg = LayerValidator.validate_layer(
+                variant.layer,
+                required_type=QgsMapLayer.VectorLayer,
+                required_geometry=QgsWkbTypes.PointGeometry
+            )
+            if not is_valid:
+                QMessageBox.warning(None, "Aviso", error_msg)
+                return []
+        if not NativeHeatmapService.is_available():
+            QMessageBox.warning(None, "Aviso", "O lote requer NumPy e GDAL no ambiente do QGIS.")
+            return []
+
+        parameters = HeatmapService._parameters_from_config(config)
+        output_dir = config.get("output_dir")
+        if output_dir and not os.path.isdir(output_dir):
+            output_dir = None
+        try:
+            results = BatchHeatmapService.run(variants, parameters, output_dir)
+        except Exception as e:
+            QMessageBox.critical(None, "Erro", f"Erro ao gerar heatmaps em lote: {e}")
+            return []
+
+        layers = []
+        for result in results:
+            output_layer = HeatmapService._load_result(result, result['OUTPUT'], config)
+            try:
+                output_layer.setName(f"Heatmap {result['name']}")
+            except Exception:
+                pass
+            layers.append(output_layer)
+        HeatmapService._notify(f"{len(layers)} heatmaps gerados na mesma grade (alinhados pixel a pixel).")
+        return layers
+
+    @staticmethod
+    def _run_categorical(layer, parameters, split_field, filter_expr, config):
+        """Heatmap multibanda por categoria; a banda total fica ativa ao carregar."""
+        import json
+        from .categorical_heatmap_service import CategoricalHeatmapService
+
+        output_path = HeatmapService._resolve_output_path(layer, config)
+        try:
+            result = CategoricalHeatmapService.run(layer, parameters, split_field,
+                                                   output_path, filter_expr)
+        except Exception as e:
+            QMessageBox.warning(None, "Aviso", f"Não foi possível separar por '{split_field}': {e}")
+            return None
+        output_layer = HeatmapService._load_result(result, output_path, config)
+        try:
+            output_layer.setCustomProperty("ctco_bands", json.dumps(result['bands'], ensure_ascii=False))
+            output_layer.setCustomProperty("ctco_split_field", split_field)
+            output_layer.setCustomProperty("ctco_band", 1)
+            output_layer.setName(f"Heatmap {layer.name()} por {split_field}")
+        except Exception:
+            pass
+        HeatmapService._notify(f"Heatmap por '{split_field}': {len(result['bands']) - 1} categorias "
+                               f"+ total (banda 1).")
+        return output_layer
+
+    @staticmethod
+    def _run_temporal(layer, parameters, filter_expr, config):
+        """Série por janela deslizante ou cubo STKDE; em segundo plano quando o diálogo pede."""
+        from qgis.core import Qgis
+        from ..models.temporal_parameters import TemporalParameters
+        from .heatmap_task_service import HeatmapTask, HeatmapTaskService
+        from .temporal_heatmap_service import TEMPORAL_STKDE, TEMPORAL_WINDOW, TemporalHeatmapService
+
+        mode = TEMPORAL_STKDE if config.get("time_mode") == TEMPORAL_STKDE else TEMPORAL_WINDOW
+        temporal = TemporalParameters.from_units(
+            config["time_field"], config.get("time_window", 1), config.get("time_step", 1),
+            config.get("time_unit", "dias"), bandwidth=config.get("time_bandwidth")
+        )
+        output_path = HeatmapService._resolve_output_path(layer, config)
+        try:
+            job = TemporalHeatmapService.prepare(layer, parameters, temporal, filter_expr, mode)
+        except Exception as e:
+            QMessageBox.warning(None, "Aviso", f"Não foi possível montar a série temporal: {e}")
+            return
+        name = layer.name()
+
+        def deliver(result):
+            output_layer = HeatmapService._load_result(result, output_path, config)
+            # Escala fixa em todos os quadros (definida antes da paleta, aplicada em seguida)
+            output_layer.setCustomProperty("ctco_range", f"0,{result['max']}")
+            output_layer.setCustomProperty("ctco_band", 1)
+            output_layer.setName(f"Heatmap {name} por {temporal.time_field}")
+            per_band = TemporalHeatmapService.bind_temporal(output_layer, result['frames'])
+            binding = "intervalo por banda" if per_band else "troca de banda pelo plugin"
+            kind = "Cubo STKDE" if job.mode == TEMPORAL_STKDE else "Série"
+            HeatmapService._notify(f"{kind} de {len(result['frames'])} quadros pronto; use o controlador "
+                                   f"temporal ({binding}).", Qgis.Success)
+
+        if not HeatmapService._runs_in_background(config, parameters):
+            try:
+                deliver(TemporalHeatmapService.execute(job, output_path))
+            except Exception as e:
+                QMessageBox.critical(None, "Erro", f"Erro ao calcular a série temporal: {e}")
+            return
+
+        def on_finished(task, ok):
+            try:
+                if ok and task.result:
+                    deliver(task.result)
+                elif task.isCanceled():
+                    HeatmapService._notify(f"Série temporal de '{name}' cancelada.", Qgis.Warning)
+                else:
+                    QMessageBox.critical(None, "Erro", f"Erro ao calcular a série temporal: {task.error}")
+            except Exception as e:
+                QMessageBox.critical(None, "Erro", f"Erro ao carregar a série temporal: {e}")
+
+        HeatmapTaskService.submit(HeatmapTask(f"Série temporal: {name}", job, output_path, on_finished,
+                                              execute=TemporalHeatmapService.execute))
+        HeatmapService._notify(f"Série de {len(job.starts)} quadros de '{name}' em segundo plano; "
+                               f"acompanhe ou cancele na barra de tarefas.", duration=3)
+
+    @staticmethod
+    def _parameters_from_config(config):
+        """HeatmapParameters a partir da configuração do diálogo."""
+        return HeatmapParameters(
+            radius=config.get("radius", 50),
+            pixel_size=config.get("pixel_size", 1),
+            transparent=config.get("transparent", 60),
+            weight_field=config.get("weight_field") or '',
+            kernel=config.get("kernel", 0),
+            decay=0,
+            output_value=0,
+            description='Parâmetros personalizados',
+            engine=config.get("engine", "auto"),
+            memory_budget_mb=config.get("memory_budget_mb", 512),
+            workers=config.get("workers", 0),
+            weight_expression=config.get("weight_expression") or '',
+            weight_null=config.get("weight_null", "one"),
+            weight_negative=config.get("weight_negative", "keep"),
+            adaptive_k=int(config.get("adaptive_k", 0) or 0),
+            reproject=config.get("reproject", "local")
+        )
+
+    @staticmethod
+    def _store_result(cache_keys, result, source, filter_expr, parameters, output_path):
+        """
+        Guarda o GeoTIFF no cache de resultados; sem pasta escolhida, usa a cópia do cache
+
+        A entrada vai para a chave do motor que calculou (`result['engine']`);
+        resultado de um motor fora das chaves do pedido não é guardado.
+        """
+        if not cache_keys or not result or 'OUTPUT' not in result:
+            return result
+        engine = result.get('engine') or parameters.engine
+        cache_key = cache_keys.get(engine)
+        if not cache_key:
+            return result
+        stored = HeatmapResultCache.store(cache_key, result['OUTPUT'], {
+            'source': source,
+            'filter': filter_expr,
+            'parameters': replace(parameters, engine=engine),
+        })
+        # Sem pasta escolhida, a camada aponta para o cache (persiste entre sessões)
+        if stored and not output_path:
+            return {'OUTPUT': stored}
+        return result
+
+    @staticmethod
+    def _runs_in_background(config, parameters) -> bool:
+        """Motor nativo sem modo ao vivo/vista roda como QgsTask (config "background")."""
+        config = config or {}
+        return (bool(config.get("background", True)) and not config.get("live")
+                and parameters.engine != "processing" and NativeHeatmapService.is_available())
+
+    @staticmethod
+    def _notify(text, level=None, duration=5):
+        """Mensagem não modal na barra do QGIS (console como alternativa)."""
+        try:
+            from qgis.core import Qgis
+            from qgis.utils import iface
+            iface.messageBar().pushMessage("CTCO", text, level=Qgis.Info if level is None else level,
+                                           duration=duration)
+        except Exception:
+            print(f"[CTCO] {text}")
+
+    @staticmethod
+    def _submit_background(layer, filtered_layer, parameters, feature_count, output_path,
+                           filter_expr, cache_keys, preview_handler, config):
+        """
+        Lê os pontos agora e calcula a densidade numa QgsTask
+
+        Returns:
+            bool: True se o heatmap foi entregue ou enfileirado; False para
+            seguir pelo caminho síncrono
+        """
+        from qgis.core import Qgis
+        from .delta_heatmap_service import DeltaHeatmapService
+        from .heatmap_task_service import HeatmapTask, HeatmapTaskService
+        from .raster_writer import temporary_output_path
+
+        out_path = output_path or temporary_output_path()
+        try:
+            # Só o filtro mudou: a diferença é rápida e roda aqui mesmo
+            result = NativeHeatmapService.try_incremental(filtered_layer, parameters, filter_expr, out_path)
+            if result is not None:
+                result = HeatmapService._store_result(cache_keys, result, filtered_layer.source(),
+                                                      filter_expr, parameters, output_path)
+                HeatmapService._load_result(result, output_path, config, preview_handler=preview_handler)
+                HeatmapService._notify("Mapa de calor atualizado.", Qgis.Success)
+                return True
+            job = NativeHeatmapService.prepare(filtered_layer, parameters, filter_expr)
+        except Exception as e:
+            print(f"[CTCO] Heatmap em segundo plano indisponível, calculando agora: {e}")
+            return False
+
+        source = filtered_layer.source()
+        name = layer.name()
+
+        def on_finished(task, ok):
+            try:
+                if ok and task.result:
+                    if task.job.density is not None:
+                        DeltaHeatmapService.retain(filtered_layer, task.job.parameters, filter_expr,
+                                                   task.job.grid, task.job.density, task.job.radius,
+                                                   task.job.kernel)
+                        task.job.density = None
+                    result = HeatmapService._store_result(cache_keys, task.result, source,
+                                                          filter_expr, parameters, output_path)
+                    HeatmapService._load_result(result, output_path, config, preview_handler=preview_handler)
+                    HeatmapService._notify(f"Mapa de calor de '{name}' criado.", Qgis.Success)
+                elif task.isCanceled():
+                    HeatmapService._notify(f"Mapa de calor de '{name}' cancelado.", Qgis.Warning)
+                else:
+                    # Mesmo comportamento do caminho síncrono: falha do nativo cai no Processing
+                    print(f"[CTCO] Motor nativo falhou em segundo plano, usando Processing: {task.error}")
+                    fallback = replace(parameters, engine="processing")
+                    result = HeatmapService._execute_heatmap_algorithm(
+                        filtered_layer, fallback, feature_count, output_path=output_path,
+                        filter_expr=filter_expr
+                    )
+                    if result and 'OUTPUT' in result:
+                        HeatmapService._load_result(result, output_path, config)
+            except Exception as e:
+                QMessageBox.critical(None, "Erro", f"Erro ao executar heatmap: {str(e)}")
+            finally:
+                if preview_handler is not None:
+                    preview_handler.clear()
+
+        task = HeatmapTask(f"Mapa de calor: {name}", job, out_path, on_finished,
+                           with_previews=preview_handler is not None)
+        if preview_handler is not None:
+            task.preview_ready.connect(preview_handler)
+        HeatmapTaskService.submit(task)
+        HeatmapService._notify(f"Mapa de calor de '{name}' em segundo plano "
+                               f"({feature_count} pontos); acompanhe ou cancele na barra de tarefas.",
+                               duration=3)
+        return True
+
+    @staticmethod
+    def _load_result(result, output_path, config, live_session=None, preview_handler=None):
+        """
+        Adiciona o raster do resultado ao projeto e aplica a simbologia
+
+        Args:
+            result: {'OUTPUT': caminho ou camada}
+            output_path: Destino escolhido pelo usuário (None = temporário)
+            config: Configuração do diálogo (paleta, escala, transparência)
+            live_session: Sessão ao vivo a ligar ao raster (opcional)
+            preview_handler: Prévias a remover depois do resultado final (opcional)
+
+        Returns:
+            Camada raster carregada
+        """
+        output_ref = result['OUTPUT']
+        print(f"OUTPUT bruto do processing: {type(output_ref)} -> {output_ref}")
+
+        output_layer = resolve_output_layer(output_ref)
+        # Garantir que apenas UMA camada seja adicionada ao projeto
+        try:
+            if hasattr(output_layer, 'id'):
+                prj = QgsProject.instance()
+                if prj.mapLayer(output_layer.id()) is None:
+                    prj.addMapLayer(output_layer)
+        except Exception:
+            pass
+
+        # Se usuário informou uma pasta de saída, salvar cópia do raster lá
+        try:
+            out_path = output_path
+            already_saved = False
+            try:
+                already_saved = bool(out_path) and os.path.normcase(os.path.abspath(output_layer.source())) == os.path.normcase(os.path.abspath(out_path))
+            except Exception:
+                already_saved = False
+            if already_saved:
+                # Motor nativo gravou direto no destino: nada a copiar
+                print(f"Heatmap salvo em: {out_path}")
+            elif out_path and isinstance(output_layer, QgsRasterLayer):
+                from qgis.core import QgsRasterFileWriter
+                prov = output_layer.dataProvider()
+                src_path = output_layer.source()
+                # Tenta copiar fisicamente criando novo raster no destino
+                ok = False
+                try:
+                    writer = QgsRasterFileWriter(out_path)
+                    ok = writer.writeRaster(output_layer.dataProvider().clone(), output_layer.width(), output_layer.height(), output_layer.extent(), output_layer.crs()) == QgsRasterFileWriter.NoError
+                except Exception:
+                    ok = False
+                if not ok:
+                    try:
+                        import shutil
+                        if os.path.exists(src_path):
+                            shutil.copy2(src_path, out_path)
+                            ok = True
+                    except Exception:
+                        ok = False
+                if ok:
+                    try:
+                        saved_layer = QgsRasterLayer(out_path, os.path.basename(out_path))
+                        if saved_layer.isValid():
+                            prj = QgsProject.instance()
+                            # Remover a camada temporária (se já estiver no projeto)
+                            try:
+                                if hasattr(output_layer, 'id') and prj.mapLayer(output_layer.id()) is not None:
+                                    prj.removeMapLayer(output_layer.id())
+                            except Exception:
+                                pass
+                            prj.addMapLayer(saved_layer)
+                            output_layer = saved_layer
+                            print(f"Heatmap salvo em: {out_path}")
+                    except Exception:
+                        pass
+        except Exception as _e:
+            print(f"Não foi possível salvar cópia do heatmap: {_e}")
+
+        if live_session is not None:
+            live_session.bind_raster(output_layer)
+        if preview_handler is not None:
+            preview_handler.clear()
+
+        # Aplicar após o carregamento com pequenas tentativas
+        HeatmapService._apply_palette_with_retry(output_layer, config or {}, attempts=6, delay_ms=150)
+
+        # Registrar propriedades iniciais para reset
+        try:
+            palette_name = (config or {}).get("palette", "BCYR")
+            scale_mode = (config or {}).get("scale", "linear")
+            output_layer.setCustomProperty("ctco_initial_palette", palette_name)
+            output_layer.setCustomProperty("ctco_initial_scale", scale_mode)
+        except Exception:
+            pass
+        return output_layer
+
+    @staticmethod
+    def _resolve_output_path(layer, config):
+        """
+        Determina o GeoTIFF de destino escolhido pelo usuário
+
+        Args:
+            layer: Camada de pontos original (nome usado no arquivo padrão)
+            config: Dicionário de configuração do diálogo
+
+        Returns:
+            str: Caminho de saída ou None (arquivo temporário)
+        """
+        out_dir = (config or {}).get("output_dir") if config else None
+        if not out_dir or not os.path.isdir(out_dir):
+            return None
+        # Determinar nome base do arquivo
+        user_name = (config or {}).get("output_filename") if config else None
+        if user_name:
+            # Remover caminho, manter somente o nome e sanitizar caracteres inválidos básicos
+            user_name = os.path.basename(str(user_name)).strip()
+            # Substituir separadores e caracteres indesejados
+            safe_name = "".join([c if c.isalnum() or c in ("-", "_", ".", " ") else "_" for c in user_name])
+            # Garantir extensão .tif
+            if not safe_name.lower().endswith(".tif"):
+                safe_name += ".tif"
+            base_name = safe_name
+        else:
+            base_base = os.path.basename(getattr(layer, 'name', lambda: 'layer')() if hasattr(layer, 'name') else 'layer')
+            base_name = f"heatmap_{base_base}.tif"
+        return os.path.join(out_dir, base_name)
+
+    class _PreviewLayers:
+        """Exibe as prévias grossas, cada uma substituindo a anterior no projeto."""
+
+        def __init__(self, layer_name, config):
+            self.layer_name = layer_name
+            self.config = config
+            self.layer_id = None
+
+        def __call__(self, path, factor):
+            preview = QgsRasterLayer(path, f"Heatmap {self.layer_name} (prévia 1/{factor})")
+            if not preview.isValid():
+                return
+            QgsProject.instance().addMapLayer(preview)
+            self.clear()
+            self.layer_id = preview.id()
+            # Simbologia aplicada na hora: a prévia já aparece com a paleta final
+            try:
+                ColorService.apply_colormap(preview,
+                                            name=self.config.get("palette", "BCYR"),
+                                            scale_mode=self.config.get("scale", "linear"))
+                preview.setOpacity(max(0.0, min(100.0, float(self.config.get("transparent", 60)))) / 100.0)
+            except Exception as e:
+                print(f"Falha ao aplicar paleta na prévia: {e}")
+            # O cálculo roda na thread da interface: desenhar antes de seguir para a próxima passada
+            try:
+                from qgis.utils import iface
+                canvas = iface.mapCanvas()
+                canvas.refresh()
+                QCoreApplication.processEvents()
+                if hasattr(canvas, 'waitWhileRendering'):
+                    canvas.waitWhileRendering()
+            except Exception:
+                pass
+
+        def clear(self):
+            """Remove a prévia atual do projeto (se ainda existir)."""
+            if self.layer_id is None:
+                return
+            try:
+                prj = QgsProject.instance()
+                if prj.mapLayer(self.layer_id) is not None:
+                    prj.removeMapLayer(self.layer_id)
+            except Exception:
+                pass
+            self.layer_id = None
+
+    @staticmethod
+    def _execute_heatmap_algorithm(layer, parameters, feature_count, output_path=None, on_preview=None,
+                                   filter_expr=None):
+        """
+        Executa o heatmap pelo motor nativo ou, como fallback, pelo Processing
         
         Args:
-            layer: Camada de entrada
+            layer: Camada de entrada (original, sem filtro aplicado)
             parameters: Parâmetros do heatmap
             feature_count: Número de features
+            output_path: GeoTIFF de destino (None = temporário)
+            on_preview: Callback das prévias progressivas (somente motor nativo)
+            filter_expr: Expressão de filtro
         
         Returns:
             dict: Resultado do processing
         """
-        if feature_count > 5000:
+        # Motor nativo (NumPy) evita o round trip do Processing; em falha, volta ao Processing
+        if parameters.engine != "processing" and NativeHeatmapService.is_available():
             try:
-                # Tentar algoritmo mais rápido primeiro (sem auto-load)
-                return processing.run("native:heatmapkerneldensityestimation", 
-                                      parameters.to_processing_params(layer))
-            except Exception:
-                # Se falhar, usar o algoritmo original (sem auto-load)
-                return processing.run("qgis:heatmapkerneldensityestimation", 
-                                      parameters.to_processing_params(layer))
-        else:
-            return processing.run("qgis:heatmapkerneldensityestimation", 
-                                  parameters.to_processing_params(layer))
+                return NativeHeatmapService.run(layer, parameters, output_path=output_path,
+                                                on_preview=on_preview, filter_expr=filter_expr)
+            except Exception as e:
+                print(f"[CTCO] Motor nativo falhou, usando Processing: {e}")
+
+        if filter_expr:
+            # O Processing precisa de uma camada: cópia filtrada em memória (a original fica intacta)
+            res = processing.run("native:extractbyexpression", {
+                'INPUT': layer,
+                'EXPRESSION': str(filter_expr),
+                'OUTPUT': 'TEMPORARY_OUTPUT'
+            })
+            layer = res.get('OUTPUT') or layer
+
+        if parameters.weight_expression:
+            # O Processing só aceita campo de peso: expressão e políticas ficam de fora
+            print("[CTCO] Aviso: peso por expressão não é suportado pelo Processing; calculando sem peso")
+        if parameters.adaptive_k:
+            print("[CTCO] Aviso: KDE adaptativo não é suportado pelo Processing; usando raio fixo")
+
+        from .engine_planner_service import EnginePlanner
+
+        start = time.perf_counter()
+        result = processing.run(HeatmapService._processing_algorithm(), parameters.to_processing_params(layer))
+        result = dict(result or {}, engine="processing")
+        try:
+            features = EnginePlanner.layer_features(layer, parameters, feature_count)
+            EnginePlanner.record("processing", features, time.perf_counter() - start)
+        except Exception as e:
+            print(f"[CTCO] Planejador: execução do Processing não registrada: {e}")
+        return result
+
+    @staticmethod
+    def _processing_algorithm() -> str:
+        """Id do algoritmo de KDE registrado no Processing (o mesmo código C++ nos dois nomes)."""
+        from qgis.core import QgsApplication
+
+        registry = QgsApplication.processingRegistry()
+        for algorithm_id in ("native:heatmapkerneldensityestimation", "qgis:heatmapkerneldensityestimation"):
+            if registry.algorithmById(algorithm_id) is not None:
+                return algorithm_id
+        return "qgis:heatmapkerneldensityestimation"
     
     @staticmethod
     def _show_processing_message(feature_count, parameters):
@@ -0,0 +1,110 @@
+"""
+Heatmap em segundo plano (QgsTask)
+
+Ideia central:
+- A leitura da camada (arrays em cache) acontece na thread da interface, em
+  `NativeHeatmapService.prepare`; a tarefa recebe só dados (NativeJob).
+- `NativeHeatmapService.execute` roda na thread da tarefa com progresso real
+  por lote de pontos ou por bloco gravado; o callback de progresso lança
+  KdeCancelled quando o usuário cancela no gerenciador de tarefas do QGIS.
+- Ao terminar, `finished` (thread da interface) devolve o resultado a quem
+  submeteu, que adiciona a camada e aplica a simbologia.
+
+Várias tarefas podem ficar na fila e rodar ao mesmo tempo: o QgsTaskManager
+distribui entre as threads disponíveis.
+"""
+
+from qgis.core import QgsApplication, QgsTask
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .native_heatmap_service import NativeHeatmapService
+
+
+class HeatmapTask(QgsTask):
+    """Cálculo nativo de um heatmap fora da thread da interface."""
+
+    # Prévias grossas (caminho, fator) entregues na thread da interface
+    preview_ready = pyqtSignal(str, int)
+
+    def __init__(self, description, job, output_path, on_finished, with_previews=False, execute=None):
+        """
+        Args:
+            description: Texto exibido no gerenciador de tarefas
+            job: NativeJob preparado na thread da interface
+            output_path: GeoTIFF de destino
+            on_finished: Chamado como on_finished(tarefa, sucesso) na thread da interface
+            with_previews: Emite preview_ready a cada prévia grossa
+            execute: Cálculo alternativo, chamado como execute(job, caminho, progresso)
+                (ex.: TemporalHeatmapService.execute); None = motor nativo
+        """
+        super().__init__(description, QgsTask.CanCancel)
+        self.job = job
+        self.output_path = output_path
+        self.on_finished = on_finished
+        self.with_previews = with_previews
+        self.execute = execute
+        self.result = None
+        self.error = None
+
+    def _progress(self, fraction):
+        if self.isCanceled():
+            from ..kde.engine import KdeCancelled
+            raise KdeCancelled()
+        self.setProgress(max(0.0, min(100.0, 100.0 * float(fraction))))
+
+    def run(self):
+        from ..kde.engine import KdeCancelled
+
+        on_preview = self.preview_ready.emit if self.with_previews else None
+        try:
+            if self.execute is not None:
+                self.result = self.execute(self.job, self.output_path, self._progress)
+            else:
+                self.result = NativeHeatmapService.execute(self.job, self.output_path, on_preview, self._progress)
+            return True
+        except KdeCancelled:
+            print(f"[CTCO] Tarefa cancelada: {self.description()}")
+            return False
+        except Exception as e:
+            self.error = e
+            return False
+
+    def finished(self, result):
+        HeatmapTaskService.forget(self)
+        try:
+            self.on_finished(self, bool(result))
+        except Exception as e:
+            print(f"[CTCO] Falha ao concluir o heatmap: {e}")
+        # Dados da tarefa liberados (arrays de pontos e densidade)
+        self.job = None
+
+
+class HeatmapTaskService:
+    """Fila de heatmaps em segundo plano (mantém as tarefas vivas até terminarem)."""
+
+    _tasks = []
+
+    @staticmethod
+    def submit(task):
+        HeatmapTaskService._tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+        return task
+
+    @staticmethod
+    def forget(task):
+        try:
+            HeatmapTaskService._tasks.remove(task)
+        except ValueError:
+            pass
+
+    @staticmethod
+    def active():
+        return list(HeatmapTaskService._tasks)
+
+    @staticmethod
+    def cancel_all():
+        for task in list(HeatmapTaskService._tasks):
+            try:
+                task.cancel()
+            except Exception:
+                pass
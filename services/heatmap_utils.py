@@ -6,10 +6,18 @@ from qgis.core import QgsMapLayer, QgsProject, QgsRasterLayer
 import os
 
 
-def estimate_dynamic_radius(layer, feature_count: int) -> int:
+def estimate_dynamic_radius(layer, feature_count: int, bounds=None) -> int:
     try:
-        extent = layer.extent()
-        area_m2 = max(1.0, extent.width() * extent.height())
+        # Extensão real dos pontos (filtrados, se informada) quando já lidos
+        if bounds is None:
+            from .point_array_service import PointArrayService
+            arrays = PointArrayService.cached(layer)
+            bounds = arrays.extent() if arrays is not None else None
+        if bounds is not None:
+            area_m2 = max(1.0, (bounds[2] - bounds[0]) * (bounds[3] - bounds[1]))
+        else:
+            extent = layer.extent()
+            area_m2 = max(1.0, extent.width() * extent.height())
         points = max(1, feature_count or 1)
         density = points / area_m2
         import math
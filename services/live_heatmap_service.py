@@ -0,0 +1,284 @@
+"""
+Heatmap "ao vivo": atualização incremental durante a edição da camada de pontos
+
+Ideia central:
+- A grade de densidade (float64) fica em memória junto com o raster de saída.
+- Ao adicionar/mover/apagar um ponto, somamos ou subtraímos apenas o carimbo
+  daquele ponto (custo O(carimbo), não O(pontos x grade)). Editar um atributo
+  (peso ou campo do filtro) troca o carimbo da feição da mesma forma.
+- Somente a janela alterada é regravada no GeoTIFF (sem compressão, escrita no
+  lugar) e a camada raster é redesenhada.
+
+Limitação: pontos novos fora da grade original são recortados à extensão
+calculada na criação; para ampliar a área, gere o heatmap novamente.
+"""
+
+import numpy as np
+
+from qgis.core import QgsExpression, QgsExpressionContext, QgsExpressionContextUtils, QgsFeatureRequest
+from qgis.PyQt.QtCore import QObject
+
+from .native_heatmap_service import NativeHeatmapService
+from .point_array_service import PointArrayService
+from .raster_writer import temporary_output_path, update_window, write_geotiff
+
+
+class LiveHeatmap(QObject):
+    """Sessão ao vivo ligando uma camada de pontos a um heatmap raster."""
+
+    def __init__(self, layer, parameters, filter_expr=None, parent=None):
+        super().__init__(parent)
+        self.layer = layer
+        self.parameters = parameters
+        self.filter_expr = filter_expr or None
+        self.raster_layer = None
+        self.output_path = None
+        self.grid = None
+        self.density = None
+        self._radius = None
+        self._kernel = 0
+        self._eps = 0.0
+        # Pontos da leitura inicial, ordenados por fid (multipontos repetem o fid)
+        self._fids = None
+        self._xs = self._ys = self._ws = None
+        # Alterações posteriores: fid -> (xs, ys, ws); fids removidos
+        self._overlay = {}
+        self._deleted = set()
+        self._connected = False
+
+    def start(self, output_path=None) -> str:
+        """Calcula a densidade inicial, grava o raster e passa a ouvir as edições."""
+        from ..kde.engine import KdeEngine
+        from ..kde.kernels import FOOTPRINT_CACHE, normalize_kernel
+
+        self._radius, pixel = self.parameters.to_map_units(self.layer)
+        self._kernel = normalize_kernel(self.parameters.kernel)
+        xs, ys, ws, fids = NativeHeatmapService.read_points(
+            self.layer, self.parameters, return_fids=True, filter_expr=self.filter_expr
+        )
+        order = np.argsort(fids, kind="stable")
+        self._fids, self._xs, self._ys = fids[order], xs[order], ys[order]
+        self._ws = np.ones_like(self._xs) if ws is None else ws[order]
+
+        self.grid = KdeEngine.grid_for_points(xs, ys, self._radius, pixel)
+        self.density = KdeEngine.splat(
+            self._xs, self._ys, self.grid, self._radius, self._kernel, self._ws,
+            self.parameters.output_value, self.parameters.decay,
+        )
+        # Resíduo numérico de somar/subtrair o mesmo carimbo vira 0 (NoData)
+        peak = FOOTPRINT_CACHE.get(self._kernel, self._radius, pixel, None,
+                                   self.parameters.output_value, self.parameters.decay).values
+        self._eps = 1e-9 * float(np.abs(peak).max()) if peak.size else 0.0
+
+        self.output_path = output_path or temporary_output_path("heatmap_live")
+        write_geotiff(self.output_path, self.density, self.grid, self.layer.crs().toWkt(), compress=False)
+        self._connect()
+        return self.output_path
+
+    def bind_raster(self, raster_layer):
+        """Associa a camada raster carregada (para recarregar e redesenhar)."""
+        self.raster_layer = raster_layer
+        try:
+            raster_layer.setCustomProperty("ctco_live_source", self.layer.id())
+            raster_layer.willBeDeleted.connect(self.detach)
+        except Exception:
+            pass
+
+    def _connect(self):
+        if self._connected:
+            return
+        self.layer.featureAdded.connect(self._on_feature_added)
+        self.layer.featureDeleted.connect(self._on_feature_deleted)
+        self.layer.geometryChanged.connect(self._on_geometry_changed)
+        self.layer.attributeValueChanged.connect(self._on_attribute_changed)
+        self.layer.afterCommitChanges.connect(self._on_commit)
+        self.layer.afterRollBack.connect(self._on_commit)
+        self.layer.willBeDeleted.connect(self.detach)
+        self._connected = True
+
+    def detach(self):
+        """Para de ouvir a camada (o raster permanece como está)."""
+        if not self._connected:
+            return
+        for signal, slot in (
+            (self.layer.featureAdded, self._on_feature_added),
+            (self.layer.featureDeleted, self._on_feature_deleted),
+            (self.layer.geometryChanged, self._on_geometry_changed),
+            (self.layer.attributeValueChanged, self._on_attribute_changed),
+            (self.layer.afterCommitChanges, self._on_commit),
+            (self.layer.afterRollBack, self._on_commit),
+            (self.layer.willBeDeleted, self.detach),
+        ):
+            try:
+                signal.disconnect(slot)
+            except Exception:
+                pass
+        self._connected = False
+        LiveHeatmapService.forget(self)
+
+    # --- contribuições por feição -------------------------------------------------
+
+    def _stored_points(self, fid):
+        """Pontos atualmente somados na grade para o fid (arrays vazios se nenhum)."""
+        if fid in self._overlay:
+            return self._overlay[fid]
+        empty = (np.empty(0), np.empty(0), np.empty(0))
+        if fid in self._deleted or self._fids is None:
+            return empty
+        lo = np.searchsorted(self._fids, fid, side="left")
+        hi = np.searchsorted(self._fids, fid, side="right")
+        if lo == hi:
+            return empty
+        return self._xs[lo:hi], self._ys[lo:hi], self._ws[lo:hi]
+
+    def _feature_points(self, fid, geometry=None):
+        """Pontos (e peso) da feição como está agora na camada, respeitando o filtro."""
+        request = QgsFeatureRequest(fid)
+        feature = next(self.layer.getFeatures(request), None)
+        if feature is None:
+            return np.empty(0), np.empty(0), np.empty(0)
+        if self.filter_expr:
+            expr = QgsExpression(str(self.filter_expr))
+            context = QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(self.layer))
+            context.setFeature(feature)
+            if not expr.evaluate(context):
+                return np.empty(0), np.empty(0), np.empty(0)
+        geom = geometry if geometry is not None else feature.geometry()
+        if geom is None or geom.isEmpty():
+            return np.empty(0), np.empty(0), np.empty(0)
+        points = geom.asMultiPoint() if geom.isMultipart() else [geom.asPoint()]
+        xs = np.array([p.x() for p in points], dtype=np.float64)
+        ys = np.array([p.y() for p in points], dtype=np.float64)
+        if not self.parameters.is_weighted:
+            return xs, ys, np.ones(xs.size)
+        from ..kde.weights import apply_weight_policy
+
+        expression, context = NativeHeatmapService._prepare_weight_expression(
+            self.layer, self.parameters.weight_expression
+        )
+        weight = NativeHeatmapService.feature_weight(feature, self.parameters.weight_field, expression, context)
+        ws, keep = apply_weight_policy(np.full(xs.size, weight), self.parameters.weight_null,
+                                       self.parameters.weight_negative)
+        if keep is not None:
+            xs, ys = xs[keep], ys[keep]
+        return xs, ys, ws
+
+    def _apply(self, xs, ys, ws, sign):
+        """Soma (sign=+1) ou subtrai (sign=-1) os carimbos e devolve a janela suja."""
+        from ..kde.engine import KdeEngine
+
+        if xs.size == 0:
+            return None
+        KdeEngine.splat(xs, ys, self.grid, self._radius, self._kernel, sign * ws,
+                        self.parameters.output_value, self.parameters.decay, out=self.density)
+        return KdeEngine.footprint_window(xs, ys, self.grid, self._radius)
+
+    def _flush(self, windows):
+        """Regrava as janelas sujas no GeoTIFF e redesenha somente a camada do heatmap."""
+        windows = [w for w in windows if w is not None]
+        if not windows:
+            return
+        # Janelas gravadas separadamente: mover um ponto para longe não suja o meio do caminho
+        for row0, row1, col0, col1 in windows:
+            block = self.density[row0:row1, col0:col1]
+            block[np.abs(block) < self._eps] = 0.0
+            update_window(self.output_path, block, row0, col0)
+        if self.raster_layer is not None:
+            try:
+                provider = self.raster_layer.dataProvider()
+                reload_fn = getattr(provider, 'reloadData', None) or getattr(provider, 'reload', None)
+                if reload_fn:
+                    reload_fn()
+                self.raster_layer.triggerRepaint()
+            except Exception as e:
+                print(f"[CTCO] Falha ao redesenhar heatmap ao vivo: {e}")
+
+    # --- sinais da camada -------------------------------------------------------------
+
+    def _on_feature_added(self, fid):
+        try:
+            xs, ys, ws = self._feature_points(fid)
+            self._overlay[fid] = (xs, ys, ws)
+            self._flush([self._apply(xs, ys, ws, 1.0)])
+        except Exception as e:
+            print(f"[CTCO] Heatmap ao vivo (inclusão {fid}): {e}")
+
+    def _on_feature_deleted(self, fid):
+        try:
+            xs, ys, ws = self._stored_points(fid)
+            self._overlay.pop(fid, None)
+            self._deleted.add(fid)
+            self._flush([self._apply(xs, ys, ws, -1.0)])
+        except Exception as e:
+            print(f"[CTCO] Heatmap ao vivo (exclusão {fid}): {e}")
+
+    def _on_geometry_changed(self, fid, geometry):
+        try:
+            old = self._stored_points(fid)
+            new = self._feature_points(fid, geometry)
+            self._overlay[fid] = new
+            self._flush([self._apply(*old, -1.0), self._apply(*new, 1.0)])
+        except Exception as e:
+            print(f"[CTCO] Heatmap ao vivo (geometria {fid}): {e}")
+
+    def _on_attribute_changed(self, fid, idx, value):
+        # Peso ou pertinência ao filtro podem mudar: troca o carimbo somado pelo atual
+        try:
+            old = self._stored_points(fid)
+            new = self._feature_points(fid)
+            self._overlay[fid] = new
+            self._flush([self._apply(*old, -1.0), self._apply(*new, 1.0)])
+        except Exception as e:
+            print(f"[CTCO] Heatmap ao vivo (atributo {fid}): {e}")
+
+    def _on_commit(self):
+        """Após salvar/descartar, ids temporários mudam: recarrega o índice fid -> pontos.
+
+        A densidade já está correta (geometria e atributos editados já trocaram
+        seus carimbos, e o rollback reemite os sinais de edição ao desfazer);
+        aqui só o mapeamento de feições é relido, sem recalcular a grade.
+        """
+        try:
+            PointArrayService.invalidate(self.layer.id())
+            xs, ys, ws, fids = NativeHeatmapService.read_points(
+                self.layer, self.parameters, return_fids=True, filter_expr=self.filter_expr
+            )
+            order = np.argsort(fids, kind="stable")
+            self._fids, self._xs, self._ys = fids[order], xs[order], ys[order]
+            self._ws = np.ones_like(self._xs) if ws is None else ws[order]
+            self._overlay.clear()
+            self._deleted.clear()
+        except Exception as e:
+            print(f"[CTCO] Heatmap ao vivo (sincronização): {e}")
+
+
+class LiveHeatmapService:
+    """Registro das sessões ao vivo ativas (mantém as referências Python vivas)."""
+
+    _sessions = []
+
+    @staticmethod
+    def attach(layer, parameters, filter_expr=None, output_path=None):
+        """
+        Cria o heatmap ao vivo para a camada
+
+        Returns:
+            tuple: (sessão, {'OUTPUT': caminho do GeoTIFF})
+        """
+        session = LiveHeatmap(layer, parameters, filter_expr)
+        path = session.start(output_path)
+        LiveHeatmapService._sessions.append(session)
+        print(f"[CTCO] Heatmap ao vivo ligado à camada '{layer.name()}'")
+        return session, {'OUTPUT': path}
+
+    @staticmethod
+    def forget(session):
+        try:
+            LiveHeatmapService._sessions.remove(session)
+        except ValueError:
+            pass
+
+    @staticmethod
+    def detach_all():
+        for session in list(LiveHeatmapService._sessions):
+            session.detach()
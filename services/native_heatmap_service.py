@@ -0,0 +1,406 @@
+"""
+Serviço do motor nativo de heatmap
+Liga a camada do QGIS ao KdeEngine (NumPy) e grava o resultado em GeoTIFF
+"""
+
+import os
+import time
+from dataclasses import dataclass, replace
+
+from qgis.core import QgsExpression, QgsExpressionContext, QgsExpressionContextUtils
+
+
+@dataclass
+class NativeJob:
+    """Dados de um cálculo nativo já lidos da camada (seguros para outra thread)."""
+
+    parameters: object
+    xs: object
+    ys: object
+    weights: object
+    grid: object
+    radius: float
+    kernel: int
+    crs_wkt: str
+    layer_wkt: str
+    incremental: bool = False
+    radii_key: tuple = None
+    arrays: object = None
+    read_s: float = 0.0
+    # Plano do motor automático (previsto x real é registrado ao final)
+    plan: object = None
+    # Densidade da grade inteira, para o recálculo incremental (preenchida por execute)
+    density: object = None
+
+
+class NativeHeatmapService:
+    """Executa o heatmap sem o round trip do Processing."""
+
+    # (chave, arrays da camada, raios) do último KDE adaptativo
+    _radii_cache = None
+
+    @staticmethod
+    def is_available() -> bool:
+        """Indica se NumPy e GDAL estão disponíveis no ambiente do QGIS."""
+        try:
+            import numpy  # noqa: F401
+            from osgeo import gdal  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    @staticmethod
+    def extract_points(layer, weight_field: str = '', return_fids: bool = False, weight_expression: str = ''):
+        """
+        Coordenadas (e pesos) da camada em arrays contíguos
+
+        Usa os arrays em cache do PointArrayService: a camada só é lida de novo
+        depois de editada ou de mudar o subset. Valores de peso nulos ou não
+        numéricos viram NaN (a política de pesos decide o que fazer com eles).
+
+        Args:
+            layer: Camada de pontos
+            weight_field: Campo de peso opcional
+            return_fids: Inclui o id da feição de cada ponto (multipontos repetem o id)
+            weight_expression: Expressão do QGIS para o peso (prioridade sobre o campo)
+
+        Returns:
+            tuple: (xs, ys, weights) com weights=None quando não há peso;
+            (xs, ys, weights, fids) quando return_fids=True
+        """
+        from .point_array_service import PointArrayService, to_float
+
+        if weight_expression:
+            arrays = PointArrayService.get(layer)
+            weights = to_float(PointArrayService.expression_values(layer, weight_expression))
+        elif weight_field:
+            arrays = PointArrayService.get(layer, [weight_field])
+            weights = arrays.numeric(weight_field)
+        else:
+            arrays = PointArrayService.get(layer)
+            weights = None
+
+        if return_fids:
+            return arrays.xs, arrays.ys, weights, arrays.fids
+        return arrays.xs, arrays.ys, weights
+
+    @staticmethod
+    def _prepare_weight_expression(layer, weight_expression):
+        """Compila a expressão de peso uma vez para a leitura (None se não houver)."""
+        if not weight_expression:
+            return None, None
+        expression = QgsExpression(str(weight_expression))
+        if expression.hasParserError():
+            raise ValueError(f"Expressão de peso inválida: {expression.parserErrorString()}")
+        context = QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+        expression.prepare(context)
+        return expression, context
+
+    @staticmethod
+    def feature_weight(feature, weight_field='', expression=None, context=None) -> float:
+        """Peso bruto de uma feição (NaN se nulo ou não numérico)."""
+        if expression is not None:
+            context.setFeature(feature)
+            value = expression.evaluate(context)
+        else:
+            value = feature[weight_field]
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return float("nan")
+
+    @staticmethod
+    def read_points(layer, parameters, return_fids: bool = False, filter_expr=None, attributes=()):
+        """
+        Lê os pontos com os pesos de `parameters` já tratados pela política
+
+        Pontos fora do filtro ou descartados pela política (peso nulo/negativo
+        com "drop") saem de todos os arrays.
+
+        Args:
+            attributes: Campos a devolver alinhados aos pontos (ao fim da tupla)
+
+        Returns:
+            tuple: Mesmo formato de extract_points, seguido das colunas de `attributes`
+        """
+        from ..kde.weights import apply_weight_policy
+        from .filter_service import FilterService
+        from .point_array_service import PointArrayService
+
+        data = NativeHeatmapService.extract_points(
+            layer, parameters.weight_field, return_fids, parameters.weight_expression
+        )
+        if attributes:
+            arrays = PointArrayService.get(layer, attributes)
+            data = tuple(data) + tuple(arrays.attributes[name] for name in attributes)
+        mask = FilterService.mask(layer, filter_expr)
+        if mask is not None:
+            data = tuple(None if arr is None else arr[mask] for arr in data)
+        weights, keep = apply_weight_policy(data[2], parameters.weight_null, parameters.weight_negative)
+        if keep is not None:
+            print(f"[CTCO] Pesos: {int((~keep).sum())} pontos descartados pela política "
+                  f"(nulo={parameters.weight_null}, negativo={parameters.weight_negative})")
+            data = tuple(None if arr is None else arr[keep] for arr in data)
+        return (data[0], data[1], weights) + tuple(data[3:])
+
+    @staticmethod
+    def run(layer, parameters, output_path=None, on_preview=None, filter_expr=None, progress=None) -> dict:
+        """
+        Calcula o heatmap da camada com o motor nativo
+
+        Args:
+            layer: Camada de pontos
+            parameters: HeatmapParameters
+            output_path: GeoTIFF de destino (None = arquivo temporário)
+            on_preview: Chamado como on_preview(caminho, fator) a cada prévia grossa
+                (pixel 8x, 4x, 2x) antes do cálculo final; None desliga as prévias
+            filter_expr: Filtro aplicado aos arrays (a camada não é alterada)
+            progress: Chamado como progress(fração); pode lançar KdeCancelled
+
+        Returns:
+            dict: {'OUTPUT': caminho do GeoTIFF, 'engine': motor que calculou}, no
+            mesmo formato do processing.run
+        """
+        from .delta_heatmap_service import DeltaHeatmapService
+        from .raster_writer import temporary_output_path
+
+        out_path = output_path or temporary_output_path()
+        result = NativeHeatmapService.try_incremental(layer, parameters, filter_expr, out_path)
+        if result is not None:
+            return result
+        job = NativeHeatmapService.prepare(layer, parameters, filter_expr)
+        result = NativeHeatmapService.execute(job, out_path, on_preview, progress)
+        if job.density is not None:
+            DeltaHeatmapService.retain(layer, job.parameters, filter_expr, job.grid, job.density,
+                                       job.radius, job.kernel)
+            job.density = None
+        return result
+
+    @staticmethod
+    def try_incremental(layer, parameters, filter_expr, out_path):
+        """Recálculo pela diferença de seleção, quando o cálculo permite (senão None)."""
+        from .delta_heatmap_service import DeltaHeatmapService
+
+        if not NativeHeatmapService._is_incremental(layer, parameters):
+            return None
+        # Mesmos parâmetros e só o filtro mudou: aplica a diferença na densidade retida
+        return DeltaHeatmapService.try_update(layer, parameters, filter_expr, out_path,
+                                              layer.crs().toWkt())
+
+    @staticmethod
+    def _is_incremental(layer, parameters) -> bool:
+        from ..kde.engine import ENGINE_NATIVE
+        from ..kde.planner import ENGINE_AUTO
+        from .projection_service import ProjectionService
+
+        # Só o carimbo exato admite somar/subtrair carimbos (FFT e blocos não servem de base);
+        # adaptativo e CRS local não se alinham aos arrays da camada
+        return (parameters.engine in (ENGINE_NATIVE, ENGINE_AUTO)
+                and not int(parameters.adaptive_k or 0)
+                and not ProjectionService.needs_projection(layer, parameters))
+
+    @staticmethod
+    def prepare(layer, parameters, filter_expr=None) -> NativeJob:
+        """
+        Tudo que precisa da camada, na thread da interface
+
+        Lê os pontos (arrays em cache), resolve unidades e CRS. O resultado é
+        só dado: `execute` pode rodar em outra thread sem tocar na camada.
+        """
+        from ..kde.engine import KdeEngine, ENGINE_NATIVE, ENGINE_TILED, ENGINE_PARALLEL
+        from ..kde.kernels import SUBPIXEL_TOLERANCE, normalize_kernel, subpixel_error_bound
+        from ..kde.planner import ENGINE_AUTO
+        from .engine_planner_service import EnginePlanner
+        from .point_array_service import PointArrayService
+        from .projection_service import ProjectionService
+
+        start = time.perf_counter()
+        adaptive = int(parameters.adaptive_k or 0) > 0
+        if adaptive and parameters.engine in (ENGINE_TILED, ENGINE_PARALLEL):
+            print("[CTCO] Aviso: KDE adaptativo usa a grade inteira; ignorando o cálculo em blocos")
+        radius_mu, pixel_mu = parameters.to_map_units(layer)
+        xs, ys, weights = NativeHeatmapService.read_points(layer, parameters, filter_expr=filter_expr)
+        layer_wkt = layer.crs().toWkt()
+        crs_wkt = layer_wkt
+        # Camada em graus: densidade calculada em metros num CRS local (LAEA)
+        if ProjectionService.needs_projection(layer, parameters):
+            xs, ys, crs_wkt = ProjectionService.to_local_metric(layer, xs, ys)
+            radius_mu, pixel_mu = float(parameters.radius), float(parameters.pixel_size)
+
+        grid = KdeEngine.grid_for_points(xs, ys, radius_mu, pixel_mu)
+        error = subpixel_error_bound(radius_mu, pixel_mu)
+        if error > SUBPIXEL_TOLERANCE:
+            print(f"[CTCO] Aviso: raio de {radius_mu / pixel_mu:.1f} pixels; erro por pixel de até "
+                  f"{error:.0%} do pico de um ponto (use um pixel menor)")
+        plan = None
+        if parameters.engine == ENGINE_AUTO:
+            # Motor pelo custo previsto na grade real (adaptativo sempre usa a grade inteira)
+            engine = ENGINE_NATIVE
+            if not adaptive:
+                plan = EnginePlanner.plan(parameters, xs.size, grid, radius_mu)
+                engine = plan.engine
+            parameters = replace(parameters, engine=engine)
+
+        radii_key = None
+        if adaptive:
+            radii_key = (layer.id(), str(filter_expr or ""), parameters.weight_field,
+                         parameters.weight_expression, parameters.weight_null,
+                         parameters.weight_negative, int(parameters.adaptive_k), parameters.reproject,
+                         float(radius_mu), float(pixel_mu))
+        return NativeJob(
+            parameters=parameters,
+            xs=xs,
+            ys=ys,
+            weights=weights,
+            grid=grid,
+            radius=radius_mu,
+            kernel=normalize_kernel(parameters.kernel),
+            crs_wkt=crs_wkt,
+            layer_wkt=layer_wkt,
+            # Motor já resolvido: "auto" que virou FFT ou blocos não é retido
+            incremental=(parameters.engine == ENGINE_NATIVE
+                         and NativeHeatmapService._is_incremental(layer, parameters)),
+            radii_key=radii_key,
+            arrays=PointArrayService.get(layer) if adaptive else None,
+            read_s=time.perf_counter() - start,
+            plan=plan,
+        )
+
+    @staticmethod
+    def execute(job: NativeJob, out_path, on_preview=None, progress=None) -> dict:
+        """
+        Calcula a densidade e grava o GeoTIFF (sem acessar a camada)
+
+        Args:
+            job: Resultado de `prepare`
+            out_path: GeoTIFF de destino
+            on_preview: Callback das prévias grossas
+            progress: Chamado como progress(fração) por lote/bloco; pode lançar
+                KdeCancelled para interromper
+
+        Returns:
+            dict: {'OUTPUT': caminho do GeoTIFF, 'engine': motor resolvido}
+        """
+        from ..kde.engine import KdeEngine, ENGINE_FFT, ENGINE_PARALLEL, ENGINE_NATIVE
+        from ..kde.kernels import FOOTPRINT_CACHE
+        from .projection_service import REPROJECT_WARP
+        from .raster_writer import temporary_output_path, write_geotiff, warp_geotiff, TiledGeoTiffWriter
+
+        start = time.perf_counter()
+        parameters, grid, radius, kernel = job.parameters, job.grid, job.radius, job.kernel
+        xs, ys, weights = job.xs, job.ys, job.weights
+        adaptive = job.radii_key is not None
+        full_grid = adaptive or parameters.engine in (ENGINE_NATIVE, ENGINE_FFT)
+        report = progress if progress is not None else (lambda fraction: None)
+
+        write_path = out_path
+        if job.crs_wkt != job.layer_wkt and parameters.reproject == REPROJECT_WARP:
+            write_path = temporary_output_path()
+        if on_preview is not None and not adaptive:
+            NativeHeatmapService._emit_previews(xs, ys, grid, radius, kernel, weights,
+                                                parameters, job.crs_wkt, on_preview, start)
+        report(0.0)
+        compute_start = time.perf_counter()
+        # Fração reservada à densidade; o restante é a gravação/reprojeção
+        compute_share = 0.9
+        if not full_grid:
+            if parameters.engine == ENGINE_PARALLEL:
+                from ..kde.parallel import ParallelKde
+                blocks = ParallelKde.iter_tiles(
+                    xs, ys, grid, radius, kernel, weights,
+                    parameters.output_value, parameters.decay,
+                    memory_budget_mb=parameters.memory_budget_mb,
+                    workers=parameters.workers,
+                )
+            else:
+                blocks = KdeEngine.iter_tiles(
+                    xs, ys, grid, radius, kernel, weights,
+                    parameters.output_value, parameters.decay,
+                    memory_budget_mb=parameters.memory_budget_mb,
+                    engine=ENGINE_NATIVE,
+                )
+            # Blocos vão direto para o GeoTIFF: memória limitada pelo orçamento, não pela grade
+            written = 0
+            with TiledGeoTiffWriter(write_path, grid, job.crs_wkt) as writer:
+                for row_off, col_off, block in blocks:
+                    writer.write_block(block, row_off, col_off)
+                    written += block.size
+                    report(compute_share * written / float(grid.rows * grid.cols))
+        else:
+            step = lambda fraction: report(compute_share * fraction)
+            if adaptive:
+                from ..kde.adaptive import adaptive_density
+                radii = NativeHeatmapService._adaptive_radii(job)
+                density = adaptive_density(xs, ys, grid, radius, kernel, weights,
+                                           parameters.output_value, parameters.decay, radii=radii,
+                                           progress=step)
+            else:
+                density = KdeEngine.compute(
+                    xs, ys, grid, radius,
+                    kernel=kernel,
+                    weights=weights,
+                    output_value=parameters.output_value,
+                    decay=parameters.decay,
+                    engine=parameters.engine,
+                    progress=step,
+                )
+            report(compute_share)
+            write_geotiff(write_path, density, grid, job.crs_wkt)
+            if job.incremental:
+                # Retida por quem chamou (na thread da interface), via DeltaHeatmapService.retain
+                job.density = density
+        if job.plan is not None:
+            from .engine_planner_service import EnginePlanner
+            EnginePlanner.record_plan(job.plan, time.perf_counter() - compute_start)
+        if write_path != out_path:
+            # Resultado pedido no CRS da camada: reprojeta o GeoTIFF calculado em metros
+            warp_geotiff(write_path, out_path, job.layer_wkt)
+            try:
+                os.remove(write_path)
+            except OSError:
+                pass
+        report(1.0)
+        cache = FOOTPRINT_CACHE.stats()
+        print(f"[CTCO] Cache de carimbos: {cache['hits']} acertos, {cache['misses']} construções, "
+              f"{cache['evictions']} despejos, {cache['bytes'] / 1048576:.1f} MB")
+        print(f"[CTCO] Motor {parameters.engine}: {xs.size} pontos, grade {grid.cols}x{grid.rows}, "
+              f"leitura {job.read_s:.2f}s, cálculo {time.perf_counter() - start:.2f}s")
+        return {'OUTPUT': out_path, 'engine': parameters.engine}
+
+    @staticmethod
+    def _adaptive_radii(job: NativeJob):
+        """
+        Raios por ponto do KDE adaptativo, em cache enquanto os pontos não mudam
+
+        A busca de vizinhos é a parte cara; trocar paleta, kernel ou tipo de
+        saída reaproveita os raios já calculados.
+        """
+        from ..kde.adaptive import adaptive_radii
+
+        cached = NativeHeatmapService._radii_cache
+        if (cached is not None and cached[0] == job.radii_key and cached[1] is job.arrays
+                and cached[2].size == job.xs.size):
+            return cached[2]
+        start = time.perf_counter()
+        k = int(job.parameters.adaptive_k)
+        radii = adaptive_radii(job.xs, job.ys, k, job.radius, job.grid.pixel_size)
+        print(f"[CTCO] Raios adaptativos (k={k}): {job.xs.size} pontos "
+              f"em {time.perf_counter() - start:.2f}s")
+        NativeHeatmapService._radii_cache = (job.radii_key, job.arrays, radii)
+        return radii
+
+    @staticmethod
+    def _emit_previews(xs, ys, grid, radius, kernel, weights, parameters, crs_wkt, on_preview, start):
+        """Grava e entrega as prévias grossas, da mais grossa para a mais fina."""
+        from ..kde.engine import KdeEngine
+        from .raster_writer import temporary_output_path, write_geotiff
+
+        for factor, coarse, density in KdeEngine.progressive_passes(
+                xs, ys, grid, radius, kernel, weights, parameters.output_value, parameters.decay):
+            path = write_geotiff(temporary_output_path("heatmap_preview"), density, coarse, crs_wkt)
+            print(f"[CTCO] Prévia 1/{factor}: grade {coarse.cols}x{coarse.rows} "
+                  f"em {time.perf_counter() - start:.2f}s")
+            try:
+                on_preview(path, factor)
+            except Exception as e:
+                print(f"[CTCO] Falha ao exibir prévia: {e}")
@@ -0,0 +1,312 @@
+"""
+Serviço de arrays de pontos: uma leitura da camada, vários consumidores
+
+Ideia central:
+- x, y e os atributos pedidos são lidos uma única vez (geometria + subconjunto
+  de atributos) para arrays NumPy contíguos; a contagem sai de graça.
+- Os arrays ficam em cache por camada e são invalidados em `dataChanged`
+  (edições, commit/rollback) e `subsetStringChanged` (filtro do provedor).
+  Os arrays guardam o carimbo do arquivo (mtime/tamanho) da leitura: se outro
+  processo regravar a fonte, nenhum sinal dispara, mas o carimbo muda e a
+  próxima `get` relê a camada.
+- Atributos pedidos depois são lidos sem geometria e alinhados pelo fid, sem
+  reler as coordenadas: execuções com e sem peso compartilham os mesmos x/y.
+
+Consumidores: contagem (LayerValidator), estimativa de raio, filtro e KDE.
+Fontes grandes também são guardadas em disco (PointDiskCache) e mapeadas de
+volta em sessões seguintes.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict
+
+import numpy as np
+
+from qgis.core import (
+    QgsExpression,
+    QgsExpressionContext,
+    QgsExpressionContextUtils,
+    QgsFeatureRequest,
+)
+from qgis.PyQt.QtCore import QVariant
+
+
+def _plain(value):
+    """Converte NULL/QVariant do PyQGIS em valor Python (None para nulo)."""
+    if isinstance(value, QVariant):
+        return None if value.isNull() else value.value()
+    return value
+
+
+def to_float(values) -> np.ndarray:
+    """Coluna como float64 (NaN onde nulo ou não numérico)."""
+    values = np.asarray(values)
+    if values.dtype != object:
+        return values.astype(np.float64, copy=False)
+    out = np.full(values.size, np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+@dataclass
+class PointArrays:
+    """Pontos da camada em arrays (multipontos repetem fid e atributos)."""
+
+    xs: np.ndarray
+    ys: np.ndarray
+    fids: np.ndarray
+    attributes: Dict[str, np.ndarray] = field(default_factory=dict)
+    # Carimbo da fonte na leitura (HeatmapResultCache.source_stamp; None = sem carimbo)
+    stamp: object = None
+
+    @property
+    def count(self) -> int:
+        return int(self.xs.size)
+
+    def extent(self, mask=None):
+        """(x_min, y_min, x_max, y_max) dos pontos (só os da máscara, se dada) ou None se vazio."""
+        xs, ys = (self.xs, self.ys) if mask is None else (self.xs[mask], self.ys[mask])
+        if xs.size == 0:
+            return None
+        return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+
+    def numeric(self, name: str) -> np.ndarray:
+        """Atributo como float64 (NaN onde nulo ou não numérico)."""
+        return to_float(self.attributes[name])
+
+
+class PointArrayService:
+    """Cache de PointArrays por camada (id da camada -> arrays)."""
+
+    _cache = {}
+    _connected = set()
+
+    @staticmethod
+    def get(layer, attributes=()) -> PointArrays:
+        """
+        Arrays da camada com (pelo menos) os atributos pedidos
+
+        Args:
+            layer: Camada de pontos (subset do provedor já aplicado)
+            attributes: Nomes de campos a incluir
+
+        Returns:
+            PointArrays: Arrays em cache (não modifique no lugar)
+        """
+        names = [name for name in dict.fromkeys(attributes) if name]
+        key = layer.id()
+        arrays = PointArrayService._cache.get(key)
+        stamp = PointArrayService._stamp(layer)
+        if arrays is not None and stamp is not None and arrays.stamp != stamp:
+            # Fonte regravada fora do QGIS (sem sinal da camada): arrays desatualizados
+            print(f"[CTCO] Fonte da camada '{layer.name()}' mudou no disco; relendo os pontos")
+            arrays = None
+        if arrays is None:
+            arrays = PointArrayService._load_or_read(layer, names)
+            arrays.stamp = stamp
+            PointArrayService._cache[key] = arrays
+            PointArrayService._watch(layer)
+        missing = [name for name in names if name not in arrays.attributes]
+        if missing:
+            extra = PointArrayService._read_attributes(layer, missing, arrays.fids)
+            arrays.attributes.update(extra)
+            PointArrayService._persist_attributes(layer, extra)
+        return arrays
+
+    @staticmethod
+    def cached(layer):
+        """Arrays já lidos da camada (sem ler nada) ou None."""
+        try:
+            return PointArrayService._cache.get(layer.id())
+        except Exception:
+            return None
+
+    @staticmethod
+    def expression_values(layer, expression_text: str) -> np.ndarray:
+        """
+        Avalia uma expressão por feição e alinha o resultado aos pontos
+
+        Returns:
+            np.ndarray: Valores (object) alinhados a `get(layer).fids`
+        """
+        arrays = PointArrayService.get(layer)
+        expression = QgsExpression(str(expression_text))
+        if expression.hasParserError():
+            raise ValueError(f"Expressão inválida: {expression.parserErrorString()}")
+        context = QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+        expression.prepare(context)
+
+        request = QgsFeatureRequest()
+        if not expression.needsGeometry():
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        columns = expression.referencedColumns()
+        if QgsFeatureRequest.ALL_ATTRIBUTES not in columns:
+            request.setSubsetOfAttributes(columns, layer.fields())
+
+        fids, values = [], []
+        for feature in layer.getFeatures(request):
+            context.setFeature(feature)
+            fids.append(feature.id())
+            values.append(_plain(expression.evaluate(context)))
+        return PointArrayService._align(np.asarray(fids, dtype=np.int64), values, arrays.fids)
+
+    @staticmethod
+    def invalidate(layer_id=None):
+        """Descarta os arrays de uma camada (ou de todas)."""
+        if layer_id is None:
+            PointArrayService._cache.clear()
+        else:
+            PointArrayService._cache.pop(layer_id, None)
+
+    @staticmethod
+    def _watch(layer):
+        """Liga a invalidação aos sinais da camada (uma vez por camada)."""
+        key = layer.id()
+        if key in PointArrayService._connected:
+            return
+        try:
+            layer.dataChanged.connect(lambda key=key: PointArrayService.invalidate(key))
+            layer.subsetStringChanged.connect(lambda key=key: PointArrayService.invalidate(key))
+            # Salvar/descartar edições troca os fids temporários
+            layer.afterCommitChanges.connect(lambda key=key: PointArrayService.invalidate(key))
+            layer.afterRollBack.connect(lambda key=key: PointArrayService.invalidate(key))
+            layer.willBeDeleted.connect(lambda key=key: PointArrayService._forget(key))
+            PointArrayService._connected.add(key)
+        except Exception as e:
+            print(f"[CTCO] Não foi possível acompanhar alterações da camada: {e}")
+
+    @staticmethod
+    def _stamp(layer):
+        """Carimbo de modificação da fonte (None em memória, em edição ou indisponível)."""
+        from .result_cache_service import HeatmapResultCache
+
+        try:
+            return HeatmapResultCache.source_stamp(layer)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _forget(layer_id):
+        PointArrayService.invalidate(layer_id)
+        PointArrayService._connected.discard(layer_id)
+
+    @staticmethod
+    def _disk_key(layer):
+        """Chave do cache em disco (None se desligado ou sem carimbo confiável)."""
+        from .point_cache_service import PointDiskCache
+
+        try:
+            return PointDiskCache.make_key(layer) if PointDiskCache.is_enabled() else None
+        except Exception as e:
+            print(f"[CTCO] Cache de pontos em disco indisponível: {e}")
+            return None
+
+    @staticmethod
+    def _load_or_read(layer, names) -> PointArrays:
+        """Mapeia a leitura guardada em disco ou lê a camada (e guarda para a próxima sessão)."""
+        from .point_cache_service import PointDiskCache
+
+        disk_key = PointArrayService._disk_key(layer)
+        loaded = PointDiskCache.load(disk_key) if disk_key else None
+        if loaded is not None:
+            xs, ys, fids, attributes = loaded
+            return PointArrays(xs=xs, ys=ys, fids=fids, attributes=dict(attributes))
+        arrays = PointArrayService._read(layer, names)
+        if disk_key:
+            PointDiskCache.store(disk_key, arrays.xs, arrays.ys, arrays.fids, arrays.attributes)
+        return arrays
+
+    @staticmethod
+    def _persist_attributes(layer, attributes):
+        from .point_cache_service import PointDiskCache
+
+        disk_key = PointArrayService._disk_key(layer)
+        if disk_key:
+            PointDiskCache.add_attributes(disk_key, attributes)
+
+    @staticmethod
+    def _read(layer, names) -> PointArrays:
+        """Leitura única: geometria + subconjunto de atributos."""
+        request = QgsFeatureRequest()
+        if names:
+            request.setSubsetOfAttributes(names, layer.fields())
+        else:
+            request.setNoAttributes()
+        indexes = [layer.fields().indexFromName(name) for name in names]
+
+        xs, ys, fids = [], [], []
+        values = [[] for _ in names]
+        for feature in layer.getFeatures(request):
+            geom = feature.geometry()
+            if geom is None or geom.isEmpty():
+                continue
+            points = geom.asMultiPoint() if geom.isMultipart() else [geom.asPoint()]
+            attrs = feature.attributes() if names else ()
+            fid = feature.id()
+            for pt in points:
+                xs.append(pt.x())
+                ys.append(pt.y())
+                fids.append(fid)
+                for column, index in zip(values, indexes):
+                    column.append(_plain(attrs[index]) if index >= 0 else None)
+
+        arrays = PointArrays(
+            xs=np.asarray(xs, dtype=np.float64),
+            ys=np.asarray(ys, dtype=np.float64),
+            fids=np.asarray(fids, dtype=np.int64),
+        )
+        for name, column in zip(names, values):
+            arrays.attributes[name] = PointArrayService._column(column)
+        return arrays
+
+    @staticmethod
+    def _read_attributes(layer, names, point_fids):
+        """Lê só atributos (sem geometria) e alinha aos pontos já em cache."""
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(names, layer.fields())
+        indexes = [layer.fields().indexFromName(name) for name in names]
+
+        fids = []
+        values = [[] for _ in names]
+        for feature in layer.getFeatures(request):
+            attrs = feature.attributes()
+            fids.append(feature.id())
+            for column, index in zip(values, indexes):
+                column.append(_plain(attrs[index]) if index >= 0 else None)
+        fids = np.asarray(fids, dtype=np.int64)
+        return {name: PointArrayService._align(fids, column, point_fids)
+                for name, column in zip(names, values)}
+
+    @staticmethod
+    def _align(fids, values, point_fids) -> np.ndarray:
+        """
+        Reordena valores por feição para a ordem dos pontos (via fid)
+
+        Ponto cujo fid não veio na leitura recebe nulo (NaN/None), nunca o
+        valor da feição vizinha.
+        """
+        column = PointArrayService._column(values)
+        if fids.size == 0:
+            return column[:0] if point_fids.size == 0 else np.full(point_fids.size, None, dtype=object)
+        order = np.argsort(fids, kind="stable")
+        sorted_fids = fids[order]
+        pos = np.clip(np.searchsorted(sorted_fids, point_fids), 0, fids.size - 1)
+        aligned = column[order][pos]
+        missing = sorted_fids[pos] != point_fids
+        if missing.any():
+            aligned[missing] = np.nan if aligned.dtype.kind == "f" else None
+        return aligned
+
+    @staticmethod
+    def _column(values) -> np.ndarray:
+        """Coluna numérica vira float64 (nulo = NaN); o resto fica como object."""
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values if v is not None):
+            return np.asarray([np.nan if v is None else v for v in values], dtype=np.float64)
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
@@ -0,0 +1,253 @@
+"""
+Cache em disco dos arrays de pontos (mapeados em memória)
+
+Ideia central:
+- Fontes grandes (Shapefile, GeoPackage...) levam mais tempo para ler via OGR
+  do que para calcular a densidade; a leitura é guardada como arquivos .npy.
+- A chave combina URI da fonte, carimbo de modificação dos arquivos
+  (mtime/tamanho) e o subset do provedor: qualquer mudança gera outra entrada.
+- Ao reabrir o projeto os arrays voltam por `np.load(mmap_mode="r")`, em
+  milissegundos; só as páginas usadas são lidas do disco.
+- Tamanho limitado com despejo LRU (mtime do manifesto = último uso).
+
+Nada é gravado com pickle (o diretório vem do QSettings e pode ser
+compartilhado: carregar pickle dali executaria código de quem escreve nele).
+Colunas de texto vão como unicode de largura fixa ('U') mais a máscara de
+nulos e voltam inteiras como object; datas e outros tipos não são guardados e
+são relidos da camada (só atributos). Camadas sem carimbo confiável (memória,
+em edição) não entram.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+from qgis.core import QgsApplication
+from qgis.PyQt.QtCore import QSettings
+
+from .result_cache_service import HeatmapResultCache
+
+SETTINGS_ENABLED = "CTCO/point_cache/enabled"
+SETTINGS_DIR = "CTCO/point_cache/dir"
+SETTINGS_MAX_MB = "CTCO/point_cache/max_mb"
+DEFAULT_MAX_MB = 4096
+# Abaixo disso reler a fonte é rápido; não vale ocupar disco
+MIN_POINTS = 50000
+
+_MANIFEST = "manifest.json"
+# Texto mais longo que isso não vale o unicode de largura fixa (relido da camada)
+MAX_TEXT_CHARS = 256
+
+
+class PointDiskCache:
+    """Persistência dos PointArrays por fonte/carimbo/subset."""
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return str(QSettings().value(SETTINGS_ENABLED, "true")).lower() in ("1", "true", "yes")
+
+    @staticmethod
+    def cache_dir() -> str:
+        """Diretório do cache (configurável em QSettings `CTCO/point_cache/dir`)."""
+        default = os.path.join(QgsApplication.qgisSettingsDirPath(), "ctco_cache", "points")
+        folder = str(QSettings().value(SETTINGS_DIR, "") or default)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @staticmethod
+    def max_bytes() -> int:
+        try:
+            max_mb = float(QSettings().value(SETTINGS_MAX_MB, DEFAULT_MAX_MB))
+        except (TypeError, ValueError):
+            max_mb = DEFAULT_MAX_MB
+        return int(max_mb * 1024 * 1024)
+
+    @staticmethod
+    def make_key(layer):
+        """Chave da leitura da camada (None se a fonte não tiver carimbo confiável)."""
+        stamp = HeatmapResultCache.source_stamp(layer)
+        if stamp is None:
+            return None
+        try:
+            subset = layer.subsetString() or ""
+        except Exception:
+            subset = ""
+        payload = {'source': layer.source(), 'stamp': stamp, 'subset': subset}
+        raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    @staticmethod
+    def _entry_dir(key: str) -> str:
+        return os.path.join(PointDiskCache.cache_dir(), key)
+
+    @staticmethod
+    def _read_manifest(folder):
+        try:
+            with open(os.path.join(folder, _MANIFEST), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def load(key):
+        """
+        Mapeia a entrada em memória
+
+        Returns:
+            tuple: (xs, ys, fids, {atributo: array}) somente leitura, ou None
+        """
+        if not key:
+            return None
+        folder = PointDiskCache._entry_dir(key)
+        manifest = PointDiskCache._read_manifest(folder)
+        if manifest is None:
+            return None
+        try:
+            # asarray: visão ndarray comum sobre o mapeamento (sem a subclasse memmap)
+            columns = {name: np.asarray(np.load(os.path.join(folder, name + ".npy"), mmap_mode="r"))
+                       for name in ("xs", "ys", "fids")}
+            attributes = {}
+            for name, info in manifest.get("attributes", {}).items():
+                path = os.path.join(folder, info["file"])
+                if info.get("pickled"):
+                    # Entrada antiga com pickle: não é carregada (coluna relida da camada)
+                    continue
+                if info.get("kind") == "text":
+                    column = np.load(path).astype(object)
+                    column[np.load(os.path.join(folder, info["nulls"]))] = None
+                    attributes[name] = column
+                else:
+                    attributes[name] = np.asarray(np.load(path, mmap_mode="r"))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[CTCO] Cache de pontos ilegível, relendo a camada: {e}")
+            return None
+        try:
+            os.utime(os.path.join(folder, _MANIFEST), None)
+        except OSError:
+            pass
+        print(f"[CTCO] Pontos mapeados do cache em disco: {columns['xs'].size} ({folder})")
+        return columns["xs"], columns["ys"], columns["fids"], attributes
+
+    @staticmethod
+    def store(key, xs, ys, fids, attributes=None):
+        """Grava os arrays de uma leitura completa (substitui a entrada anterior)."""
+        if not key or xs.size < MIN_POINTS:
+            return
+        folder = PointDiskCache._entry_dir(key)
+        tmp = f"{folder}.{uuid.uuid4().hex}.part"
+        try:
+            os.makedirs(tmp)
+            for name, array in (("xs", xs), ("ys", ys), ("fids", fids)):
+                np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+            manifest = {'created': time.time(), 'count': int(xs.size), 'attributes': {}}
+            PointDiskCache._write_attributes(tmp, manifest, attributes or {})
+            if os.path.isdir(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+            os.replace(tmp, folder)
+        except OSError as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            print(f"[CTCO] Não foi possível guardar pontos no cache em disco: {e}")
+            return
+        PointDiskCache.evict(keep=folder)
+
+    @staticmethod
+    def add_attributes(key, attributes):
+        """Acrescenta colunas de atributos a uma entrada existente."""
+        if not key or not attributes:
+            return
+        folder = PointDiskCache._entry_dir(key)
+        manifest = PointDiskCache._read_manifest(folder)
+        if manifest is None:
+            return
+        try:
+            PointDiskCache._write_attributes(folder, manifest, attributes)
+        except OSError as e:
+            print(f"[CTCO] Não foi possível guardar atributos no cache em disco: {e}")
+
+    @staticmethod
+    def _write_attributes(folder, manifest, attributes):
+        """Grava as colunas (nomes de arquivo neutros; o manifesto guarda o nome do campo)."""
+        known = manifest.setdefault("attributes", {})
+        for name, array in attributes.items():
+            if name in known:
+                if not known[name].get("pickled"):
+                    continue
+                # Coluna antiga gravada com pickle: substituída pelo formato seguro
+                try:
+                    os.remove(os.path.join(folder, known.pop(name)["file"]))
+                except OSError:
+                    pass
+            stem = f"attr_{uuid.uuid4().hex[:12]}"
+            array = np.asarray(array)
+            if array.dtype != object:
+                np.save(os.path.join(folder, stem + ".npy"), array, allow_pickle=False)
+                known[name] = {'file': stem + ".npy"}
+                continue
+            text = PointDiskCache._text_arrays(array)
+            if text is None:
+                continue
+            values, nulls = text
+            np.save(os.path.join(folder, stem + ".npy"), values, allow_pickle=False)
+            np.save(os.path.join(folder, stem + "_nulls.npy"), nulls, allow_pickle=False)
+            known[name] = {'file': stem + ".npy", 'kind': "text", 'nulls': stem + "_nulls.npy"}
+        tmp_manifest = os.path.join(folder, _MANIFEST + ".part")
+        with open(tmp_manifest, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=2)
+        os.replace(tmp_manifest, os.path.join(folder, _MANIFEST))
+
+    @staticmethod
+    def _text_arrays(column):
+        """
+        Coluna object só com texto/nulo como (unicode 'U', máscara de nulos)
+
+        Returns:
+            tuple: (valores, nulos) ou None se houver outro tipo ou texto longo demais
+        """
+        nulls = np.array([v is None for v in column], dtype=bool)
+        present = column[~nulls]
+        if not all(isinstance(v, str) for v in present):
+            return None
+        width = max((len(v) for v in present), default=0)
+        if width > MAX_TEXT_CHARS:
+            return None
+        values = np.where(nulls, "", column).astype(f"U{max(1, width)}")
+        return values, nulls
+
+    @staticmethod
+    def evict(keep=None):
+        """Remove as entradas menos usadas até o cache caber no limite."""
+        root = PointDiskCache.cache_dir()
+        entries = []
+        total = 0
+        for name in os.listdir(root):
+            folder = os.path.join(root, name)
+            manifest = os.path.join(folder, _MANIFEST)
+            if not os.path.isfile(manifest):
+                continue
+            size = 0
+            for file_name in os.listdir(folder):
+                try:
+                    size += os.path.getsize(os.path.join(folder, file_name))
+                except OSError:
+                    pass
+            entries.append((os.path.getmtime(manifest), size, folder))
+            total += size
+
+        limit = PointDiskCache.max_bytes()
+        for _, size, folder in sorted(entries):
+            if total <= limit:
+                break
+            if keep and os.path.abspath(folder) == os.path.abspath(keep):
+                continue
+            try:
+                shutil.rmtree(folder)
+                total -= size
+                print(f"[CTCO] Cache de pontos: removido {os.path.basename(folder)}")
+            except OSError:
+                # Arquivos ainda mapeados (Windows): tenta na próxima vez
+                continue
@@ -0,0 +1,51 @@
+"""
+CRS métrico local para camadas em graus
+
+Em CRS geográfico o raio em metros virava graus por uma aproximação no centro
+da camada (kernel elíptico e distorcido longe do centro). Aqui os pontos são
+projetados de uma vez (NumPy) para uma LAEA centrada nos próprios dados, no
+mesmo datum da camada, e a densidade é calculada em metros de verdade.
+"""
+
+from ..kde.projection import LambertAzimuthal
+
+# Onde calcular a densidade de camadas geográficas
+REPROJECT_OFF = "off"      # graus, com a conversão aproximada de HeatmapParameters
+REPROJECT_LOCAL = "local"  # metros; GeoTIFF gravado no CRS local
+REPROJECT_WARP = "warp"    # metros; GeoTIFF reprojetado de volta para o CRS da camada
+
+
+class ProjectionService:
+    """Projeção dos arrays de pontos para um CRS local em metros."""
+
+    @staticmethod
+    def needs_projection(layer, parameters) -> bool:
+        try:
+            return parameters.reproject != REPROJECT_OFF and layer.crs().isGeographic()
+        except Exception:
+            return False
+
+    @staticmethod
+    def to_local_metric(layer, xs, ys):
+        """
+        Projeta os pontos (graus da camada) para LAEA centrada na extensão deles
+
+        Returns:
+            tuple: (x em metros, y em metros, WKT do CRS local)
+        """
+        from osgeo import osr
+
+        source = osr.SpatialReference()
+        source.ImportFromWkt(layer.crs().toWkt())
+        projection = LambertAzimuthal.for_points(xs, ys, source.GetSemiMajor(), source.GetInvFlattening())
+
+        # Mesmo datum/elipsoide da camada: sem transformação de datum na exibição
+        local = osr.SpatialReference()
+        local.CopyGeogCSFrom(source)
+        local.SetProjCS(f"CTCO LAEA {projection.lat0:.4f} {projection.lon0:.4f}")
+        local.SetLAEA(projection.lat0, projection.lon0, 0.0, 0.0)
+        local.SetLinearUnits(osr.SRS_UL_METER, 1.0)
+
+        px, py = projection.forward(xs, ys)
+        print(f"[CTCO] Pontos projetados para CRS local: {projection.proj4()}")
+        return px, py, local.ExportToWkt()
@@ -0,0 +1,225 @@
+"""
+Escrita de grades de densidade em GeoTIFF (via GDAL, distribuído com o QGIS)
+"""
+
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+# Mesmo NoData usado pelo algoritmo de heatmap do Processing
+NODATA = -9999.0
+
+
+def temporary_output_path(prefix: str = "heatmap") -> str:
+    """Gera caminho único de GeoTIFF temporário (equivalente ao TEMPORARY_OUTPUT)."""
+    folder = os.path.join(tempfile.gettempdir(), "ctco")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{prefix}_{uuid.uuid4().hex}.tif")
+
+
+def write_geotiff(path: str, array, grid, crs_wkt: str = "", nodata: float = NODATA,
+                  compress: bool = True) -> str:
+    """
+    Grava a grade em GeoTIFF Float32 de uma banda
+
+    Pixels com densidade 0 (fora do raio de qualquer ponto) viram NoData, como
+    no Processing, para ficarem transparentes no mapa.
+
+    Args:
+        path: Caminho do arquivo de saída
+        array: Densidade (rows, cols)
+        grid: KdeGrid com origem e pixel
+        crs_wkt: CRS em WKT
+        nodata: Valor de NoData
+        compress: LZW; desligue para arquivos reescritos no lugar (modo ao vivo)
+
+    Returns:
+        str: Caminho gravado
+    """
+    from osgeo import gdal
+
+    driver = gdal.GetDriverByName("GTiff")
+    options = ["COMPRESS=LZW", "TILED=YES"] if compress else ["TILED=YES"]
+    ds = driver.Create(path, grid.cols, grid.rows, 1, gdal.GDT_Float32, options)
+    if ds is None:
+        raise IOError(f"Não foi possível criar o raster: {path}")
+    try:
+        ds.SetGeoTransform(grid.geotransform())
+        if crs_wkt:
+            ds.SetProjection(crs_wkt)
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(nodata)
+        data = np.asarray(array, dtype=np.float32)
+        band.WriteArray(np.where(data == 0, np.float32(nodata), data))
+        ds.FlushCache()
+    finally:
+        ds = None
+    return path
+
+
+def write_multiband_geotiff(path: str, bands, grid, crs_wkt: str = "", descriptions=(),
+                            metadata=None, band_metadata=(), nodata: float = NODATA) -> str:
+    """
+    Grava uma pilha de grades em GeoTIFF Float32 com várias bandas
+
+    Args:
+        path: Caminho do arquivo de saída
+        bands: Densidades (n_bandas, rows, cols), uma grade por banda
+        grid: KdeGrid comum às bandas
+        crs_wkt: CRS em WKT
+        descriptions: Descrição de cada banda (nome exibido pelo QGIS)
+        metadata: Metadados do arquivo (dict de texto)
+        band_metadata: dict de metadados por banda (mesma ordem de `bands`)
+        nodata: Valor de NoData
+
+    Returns:
+        str: Caminho gravado
+    """
+    descriptions = list(descriptions)
+    band_metadata = list(band_metadata)
+    with MultiBandGeoTiffWriter(path, grid, len(bands), crs_wkt, metadata, nodata) as writer:
+        for i in range(len(bands)):
+            writer.write_band(i + 1, bands[i],
+                              descriptions[i] if i < len(descriptions) else None,
+                              band_metadata[i] if i < len(band_metadata) else None)
+    return path
+
+
+class MultiBandGeoTiffWriter:
+    """Grava um GeoTIFF multibanda banda a banda (quadros de uma série, categorias).
+
+    Uso:
+        with MultiBandGeoTiffWriter(path, grid, n_bands, crs_wkt) as writer:
+            writer.write_band(1, density, "descrição", {"CHAVE": "valor"})
+    """
+
+    def __init__(self, path: str, grid, n_bands: int, crs_wkt: str = "", metadata=None,
+                 nodata: float = NODATA):
+        from osgeo import gdal
+
+        self.path = path
+        self.nodata = nodata
+        driver = gdal.GetDriverByName("GTiff")
+        self._ds = driver.Create(path, grid.cols, grid.rows, int(n_bands), gdal.GDT_Float32,
+                                 ["COMPRESS=LZW", "TILED=YES", "BIGTIFF=IF_SAFER", "INTERLEAVE=BAND"])
+        if self._ds is None:
+            raise IOError(f"Não foi possível criar o raster: {path}")
+        self._ds.SetGeoTransform(grid.geotransform())
+        if crs_wkt:
+            self._ds.SetProjection(crs_wkt)
+        if metadata:
+            self._ds.SetMetadata({str(k): str(v) for k, v in metadata.items()})
+
+    def write_band(self, index: int, array, description=None, metadata=None):
+        """Grava a banda `index` (1..n); densidade 0 vira NoData."""
+        band = self._ds.GetRasterBand(int(index))
+        band.SetNoDataValue(self.nodata)
+        if description is not None:
+            band.SetDescription(str(description))
+        if metadata:
+            band.SetMetadata({str(k): str(v) for k, v in metadata.items()})
+        data = np.asarray(array, dtype=np.float32)
+        band.WriteArray(np.where(data == 0, np.float32(self.nodata), data))
+
+    def set_metadata(self, metadata):
+        """Metadados do arquivo (podem ser definidos depois das bandas)."""
+        self._ds.SetMetadata({str(k): str(v) for k, v in metadata.items()})
+
+    def close(self):
+        if self._ds is not None:
+            self._ds.FlushCache()
+            self._ds = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def update_window(path: str, block, row_off: int, col_off: int, nodata: float = NODATA):
+    """Reescreve somente a janela indicada de um GeoTIFF existente (sem compressão)."""
+    from osgeo import gdal
+
+    ds = gdal.Open(path, gdal.GA_Update)
+    if ds is None:
+        raise IOError(f"Não foi possível abrir o raster para atualização: {path}")
+    try:
+        data = np.asarray(block, dtype=np.float32)
+        ds.GetRasterBand(1).WriteArray(np.where(data == 0, np.float32(nodata), data), int(col_off), int(row_off))
+        ds.FlushCache()
+    finally:
+        ds = None
+
+
+class TiledGeoTiffWriter:
+    """Grava blocos de densidade direto em um GeoTIFF tileado, sem montar a grade inteira.
+
+    Uso:
+        with TiledGeoTiffWriter(path, grid, crs_wkt) as writer:
+            writer.write_block(block, row_off, col_off)
+    """
+
+    def __init__(self, path: str, grid, crs_wkt: str = "", nodata: float = NODATA,
+                 block_size: int = 256):
+        from osgeo import gdal
+
+        self.path = path
+        self.nodata = nodata
+        driver = gdal.GetDriverByName("GTiff")
+        self._ds = driver.Create(
+            path, grid.cols, grid.rows, 1, gdal.GDT_Float32,
+            ["COMPRESS=LZW", "TILED=YES", "BIGTIFF=IF_SAFER",
+             f"BLOCKXSIZE={block_size}", f"BLOCKYSIZE={block_size}"]
+        )
+        if self._ds is None:
+            raise IOError(f"Não foi possível criar o raster: {path}")
+        self._ds.SetGeoTransform(grid.geotransform())
+        if crs_wkt:
+            self._ds.SetProjection(crs_wkt)
+        self._band = self._ds.GetRasterBand(1)
+        self._band.SetNoDataValue(nodata)
+
+    def write_block(self, block, row_off: int, col_off: int):
+        """Grava um bloco (densidade 0 vira NoData) na posição indicada."""
+        data = np.asarray(block, dtype=np.float32)
+        self._band.WriteArray(np.where(data == 0, np.float32(self.nodata), data), int(col_off), int(row_off))
+
+    def close(self):
+        if self._ds is not None:
+            self._ds.FlushCache()
+            self._band = None
+            self._ds = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def warp_geotiff(src_path: str, dst_path: str, dst_wkt: str, nodata: float = NODATA) -> str:
+    """
+    Reprojeta um GeoTIFF de densidade para outro CRS (bilinear, mesmo NoData)
+
+    Returns:
+        str: Caminho gravado
+    """
+    from osgeo import gdal
+
+    options = gdal.WarpOptions(
+        dstSRS=dst_wkt,
+        srcNodata=nodata,
+        dstNodata=nodata,
+        resampleAlg="bilinear",
+        creationOptions=["COMPRESS=LZW", "TILED=YES"],
+    )
+    ds = gdal.Warp(dst_path, src_path, options=options)
+    if ds is None:
+        raise IOError(f"Não foi possível reprojetar o raster: {dst_path}")
+    ds = None
+    return dst_path
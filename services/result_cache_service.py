@@ -0,0 +1,265 @@
+"""
+Cache de resultados de heatmap (GeoTIFF) endereçado por conteúdo
+
+Ideia central:
+- A chave é um hash de tudo que determina o raster: fonte da camada, carimbo de
+  modificação do provedor (mtime/tamanho dos arquivos), subset/filtro, todos os
+  campos de `HeatmapParameters` e o CRS. O motor na chave é o que de fato
+  calculou o raster (a FFT difere do carimbo exato); um pedido "auto" aceita
+  a entrada de qualquer motor nativo.
+- Os GeoTIFFs ficam em um diretório persistente (sobrevive a reinícios do QGIS),
+  com limite de tamanho e despejo LRU (mtime do arquivo = último uso).
+- Camadas sem carimbo confiável (memória, edição pendente, bancos sem arquivo)
+  não são cacheadas: melhor recalcular do que devolver um raster desatualizado.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import asdict, replace
+
+from qgis.core import QgsApplication, QgsProject
+from qgis.PyQt.QtCore import QSettings
+
+SETTINGS_ENABLED = "CTCO/result_cache/enabled"
+SETTINGS_DIR = "CTCO/result_cache/dir"
+SETTINGS_MAX_MB = "CTCO/result_cache/max_mb"
+DEFAULT_MAX_MB = 2048
+
+# Arquivos auxiliares (shapefile) que também mudam quando os dados mudam
+_SIDECAR_EXTENSIONS = (".shx", ".dbf")
+
+
+class HeatmapResultCache:
+    """Persistência e busca de heatmaps já calculados."""
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return str(QSettings().value(SETTINGS_ENABLED, "true")).lower() in ("1", "true", "yes")
+
+    @staticmethod
+    def cache_dir() -> str:
+        """Diretório do cache (configurável em QSettings `CTCO/result_cache/dir`)."""
+        default = os.path.join(QgsApplication.qgisSettingsDirPath(), "ctco_cache", "results")
+        folder = str(QSettings().value(SETTINGS_DIR, "") or default)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @staticmethod
+    def max_bytes() -> int:
+        try:
+            max_mb = float(QSettings().value(SETTINGS_MAX_MB, DEFAULT_MAX_MB))
+        except (TypeError, ValueError):
+            max_mb = DEFAULT_MAX_MB
+        return int(max_mb * 1024 * 1024)
+
+    @staticmethod
+    def source_path(layer) -> str:
+        """Caminho do arquivo de dados da camada (sem `|layername=...`), ou ''."""
+        try:
+            source = layer.dataProvider().dataSourceUri()
+        except Exception:
+            source = layer.source() if hasattr(layer, 'source') else ""
+        path = str(source).split("|")[0]
+        return path if os.path.isfile(path) else ""
+
+    @staticmethod
+    def source_stamp(layer):
+        """
+        Carimbo de modificação dos dados da camada
+
+        Returns:
+            list: [(arquivo, mtime_ns, tamanho), ...] ou None se não houver carimbo confiável
+        """
+        try:
+            if layer.isEditable() or layer.isModified():
+                return None
+        except Exception:
+            pass
+        path = HeatmapResultCache.source_path(layer)
+        if not path:
+            return None
+        stem, _ = os.path.splitext(path)
+        files = {path}
+        # Sidecars do shapefile e WAL do GeoPackage/SQLite (escritas ainda não consolidadas)
+        for candidate in [stem + ext for ext in _SIDECAR_EXTENSIONS] + [path + "-wal"]:
+            if os.path.isfile(candidate):
+                files.add(candidate)
+        stamp = []
+        for name in sorted(files):
+            st = os.stat(name)
+            stamp.append((os.path.basename(name), st.st_mtime_ns, st.st_size))
+        return stamp
+
+    @staticmethod
+    def make_key(layer, parameters, filter_expr=None, engine=None):
+        """
+        Calcula a chave de conteúdo do heatmap
+
+        Args:
+            layer: Camada de pontos (com subset já aplicado, se houver)
+            parameters: HeatmapParameters finais (inclui raio estimado)
+            filter_expr: Expressão de filtro usada
+            engine: Motor que calcula o raster (padrão: parameters.engine)
+
+        Returns:
+            str: Hash sha256 ou None se a camada não puder ser cacheada
+        """
+        stamp = HeatmapResultCache.source_stamp(layer)
+        if stamp is None:
+            return None
+        try:
+            subset = layer.subsetString() if hasattr(layer, 'subsetString') else ""
+        except Exception:
+            subset = ""
+        try:
+            crs = layer.crs().toWkt()
+        except Exception:
+            crs = ""
+        if engine:
+            parameters = replace(parameters, engine=engine)
+        payload = {
+            'source': layer.source(),
+            'stamp': stamp,
+            'subset': subset or "",
+            'filter': str(filter_expr or ""),
+            'parameters': asdict(parameters),
+            'crs': crs,
+        }
+        raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    @staticmethod
+    def engine_keys(layer, parameters, filter_expr=None) -> dict:
+        """
+        Chaves do heatmap para cada motor cujo resultado atende ao pedido
+
+        Com "auto", o motor só é escolhido no cálculo: qualquer motor nativo
+        serve, com os exatos (carimbo) antes da FFT na ordem da busca.
+
+        Returns:
+            dict: {motor: chave}, vazio se a camada não puder ser cacheada
+        """
+        from ..kde.engine import ENGINE_FFT, ENGINE_NATIVE, ENGINE_PARALLEL, ENGINE_TILED
+        from ..kde.planner import ENGINE_AUTO
+
+        engines = (parameters.engine,)
+        if parameters.engine == ENGINE_AUTO:
+            engines = (ENGINE_NATIVE, ENGINE_TILED, ENGINE_PARALLEL, ENGINE_FFT)
+        keys = {}
+        for engine in engines:
+            key = HeatmapResultCache.make_key(layer, parameters, filter_expr, engine)
+            if key is None:
+                return {}
+            keys[engine] = key
+        return keys
+
+    @staticmethod
+    def _entry_path(key: str) -> str:
+        return os.path.join(HeatmapResultCache.cache_dir(), f"{key}.tif")
+
+    @staticmethod
+    def lookup(key):
+        """Retorna o GeoTIFF em cache (marcando uso recente) ou None."""
+        if not key:
+            return None
+        path = HeatmapResultCache._entry_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        print(f"[CTCO] Heatmap encontrado no cache: {path}")
+        return path
+
+    @staticmethod
+    def store(key, raster_path, metadata=None):
+        """
+        Copia o GeoTIFF calculado para o cache e aplica o despejo LRU
+
+        Returns:
+            str: Caminho no cache ou None se não foi possível guardar
+        """
+        if not key or not raster_path or not os.path.isfile(str(raster_path)):
+            return None
+        path = HeatmapResultCache._entry_path(key)
+        try:
+            if os.path.abspath(str(raster_path)) != os.path.abspath(path):
+                tmp_path = path + ".part"
+                shutil.copyfile(str(raster_path), tmp_path)
+                os.replace(tmp_path, path)
+            with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as fh:
+                json.dump(dict(metadata or {}, created=time.time()), fh, default=str, indent=2)
+        except OSError as e:
+            print(f"[CTCO] Não foi possível guardar heatmap no cache: {e}")
+            return None
+        HeatmapResultCache.evict(keep=path)
+        return path
+
+    @staticmethod
+    def _loaded_paths() -> set:
+        """Arquivos do projeto abertos como camada (caminhos normalizados)."""
+        paths = set()
+        try:
+            for layer in QgsProject.instance().mapLayers().values():
+                source = str(layer.source() or "").split("|")[0]
+                if source:
+                    paths.add(os.path.normcase(os.path.abspath(source)))
+        except Exception as e:
+            print(f"[CTCO] Camadas abertas indisponíveis para o despejo do cache: {e}")
+        return paths
+
+    @staticmethod
+    def evict(keep=None):
+        """
+        Remove os GeoTIFFs menos usados até o cache caber no limite
+
+        Entradas abertas como camada no projeto nunca são removidas: o heatmap
+        carregado aponta para o próprio arquivo do cache.
+        """
+        folder = HeatmapResultCache.cache_dir()
+        entries = []
+        total = 0
+        for name in os.listdir(folder):
+            if not name.endswith(".tif"):
+                continue
+            full = os.path.join(folder, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, full))
+            total += st.st_size
+
+        limit = HeatmapResultCache.max_bytes()
+        if total <= limit:
+            return
+        protected = HeatmapResultCache._loaded_paths()
+        if keep:
+            protected.add(os.path.normcase(os.path.abspath(keep)))
+        for _, size, full in sorted(entries):
+            if total <= limit:
+                break
+            if os.path.normcase(os.path.abspath(full)) in protected:
+                continue
+            try:
+                os.remove(full)
+                meta = os.path.splitext(full)[0] + ".json"
+                if os.path.exists(meta):
+                    os.remove(meta)
+                total -= size
+                print(f"[CTCO] Cache de heatmaps: removido {os.path.basename(full)}")
+            except OSError:
+                # Arquivo em uso por uma camada aberta (Windows): tenta na próxima vez
+                continue
+
+    @staticmethod
+    def materialize(cached_path, output_path=None) -> str:
+        """Entrega o resultado em cache no destino pedido (ou o próprio arquivo do cache)."""
+        if not output_path:
+            return cached_path
+        shutil.copyfile(cached_path, output_path)
+        return output_path
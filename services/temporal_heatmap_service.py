@@ -0,0 +1,340 @@
+"""
+Série temporal de heatmaps (janela deslizante) para o controlador temporal
+
+Ideia central:
+- O campo de data/hora é convertido uma vez para segundos (coluna derivada nos
+  arrays em cache do PointArrayService) e passa pelo mesmo filtro e política
+  de pesos do heatmap comum.
+- `kde.temporal.sliding_window_density` ordena os pontos pelo tempo uma vez e
+  atualiza a grade quadro a quadro (soma quem entra, subtrai quem sai).
+- Cada quadro vira uma banda do GeoTIFF, gravada assim que fica pronta
+  (memória de uma grade); início/fim ficam nos metadados da banda.
+- Modo STKDE (`kde.stkde`): cubo de voxels com kernel separável espaço x
+  tempo; cada banda é uma fatia centrada num instante, calculada em blocos de
+  fatias dentro do orçamento de memória.
+- No QGIS 3.38+ a camada recebe um intervalo por banda (FixedRangePerBand) e o
+  controlador temporal escolhe a banda; antes disso, o plugin troca a banda
+  exibida ao mudar o intervalo do controlador.
+"""
+
+import datetime
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+# Modos da série: janela deslizante ou cubo de densidade espaço-tempo
+TEMPORAL_WINDOW = "window"
+TEMPORAL_STKDE = "stkde"
+
+# Prefixo da coluna derivada (segundos desde a época) nos arrays em cache
+EPOCH_PREFIX = "\x00epoch:"
+
+
+def _seconds(value) -> float:
+    """Segundos desde a época (UTC) de um valor de data/hora; NaN se nulo/inválido."""
+    if value is None:
+        return float("nan")
+    try:
+        if hasattr(value, "toMSecsSinceEpoch"):
+            # QDateTime
+            return value.toMSecsSinceEpoch() / 1000.0 if value.isValid() else float("nan")
+        if hasattr(value, "toJulianDay"):
+            # QDate: meia-noite UTC
+            return float((value.toJulianDay() - 2440588) * 86400) if value.isValid() else float("nan")
+        if isinstance(value, datetime.datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=datetime.timezone.utc)
+            return value.timestamp()
+        if isinstance(value, datetime.date):
+            return float((value - datetime.date(1970, 1, 1)).days * 86400)
+        if isinstance(value, str):
+            return _seconds(datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00")))
+        return float(value)
+    except (TypeError, ValueError, OverflowError):
+        return float("nan")
+
+
+def time_values(values) -> np.ndarray:
+    """
+    Coluna de data/hora como segundos desde a época (float64, NaN onde inválido)
+
+    Aceita QDateTime/QDate do PyQGIS, datetime/date, texto ISO 8601 e números
+    (já em segundos).
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "fiu":
+        return values.astype(np.float64)
+    if values.dtype.kind == "M":
+        seconds = values.astype("datetime64[ms]").astype(np.float64) / 1000.0
+        seconds[np.isnat(values)] = np.nan
+        return seconds
+    return np.fromiter((_seconds(v) for v in values), dtype=np.float64, count=values.size)
+
+
+def iso(seconds: float) -> str:
+    """Segundos desde a época -> texto ISO 8601 (UTC)."""
+    return datetime.datetime.fromtimestamp(float(seconds), tz=datetime.timezone.utc).isoformat()
+
+
+@dataclass
+class TemporalJob:
+    """Pontos, tempos e grade de uma série já lidos da camada (seguros para outra thread)."""
+
+    parameters: object
+    temporal: object
+    xs: object
+    ys: object
+    ts: object
+    weights: object
+    grid: object
+    radius: float
+    kernel: int
+    crs_wkt: str
+    starts: object
+    read_s: float = 0.0
+    # TEMPORAL_WINDOW: starts = início de cada janela; TEMPORAL_STKDE: instante de cada fatia
+    mode: str = TEMPORAL_WINDOW
+
+
+class TemporalHeatmapService:
+    """Heatmaps por janela deslizante gravados como GeoTIFF multibanda."""
+
+    # id da camada raster -> (controlador, callback) no modo de troca de banda
+    _bindings = {}
+
+    @staticmethod
+    def epoch_column(layer, time_field: str) -> str:
+        """Nome da coluna derivada (segundos) nos arrays em cache; convertida uma vez por leitura."""
+        from .point_array_service import PointArrayService
+
+        arrays = PointArrayService.get(layer, [time_field])
+        key = EPOCH_PREFIX + time_field
+        if key not in arrays.attributes:
+            arrays.attributes[key] = time_values(arrays.attributes[time_field])
+        return key
+
+    @staticmethod
+    def run(layer, parameters, temporal, output_path=None, filter_expr=None, progress=None,
+            mode: str = TEMPORAL_WINDOW) -> dict:
+        """
+        Calcula a série e grava um quadro por banda
+
+        Args:
+            layer: Camada de pontos
+            parameters: HeatmapParameters (parte espacial)
+            temporal: TemporalParameters (campo, largura e passo)
+            output_path: GeoTIFF de destino (None = arquivo temporário)
+            filter_expr: Filtro aplicado antes da série
+            progress: Chamado como progress(fração) por quadro; pode lançar KdeCancelled
+            mode: TEMPORAL_WINDOW (janela deslizante) ou TEMPORAL_STKDE (cubo de voxels)
+
+        Returns:
+            dict: {'OUTPUT': caminho, 'frames': [{'band', 'start', 'end', 'points'}, ...], 'max': pico}
+        """
+        job = TemporalHeatmapService.prepare(layer, parameters, temporal, filter_expr, mode)
+        return TemporalHeatmapService.execute(job, output_path, progress)
+
+    @staticmethod
+    def prepare(layer, parameters, temporal, filter_expr=None, mode: str = TEMPORAL_WINDOW) -> TemporalJob:
+        """Lê pontos e tempos e fixa grade e quadros (thread da interface)."""
+        from ..kde.engine import KdeEngine
+        from ..kde.kernels import normalize_kernel
+        from ..kde.stkde import slice_times
+        from ..kde.temporal import frame_starts
+        from .native_heatmap_service import NativeHeatmapService
+        from .projection_service import ProjectionService
+
+        start = time.perf_counter()
+        if parameters.engine not in ("native", "fft", "auto") or parameters.adaptive_k:
+            print("[CTCO] Aviso: série temporal usa o motor nativo com raio fixo")
+        radius_mu, pixel_mu = parameters.to_map_units(layer)
+        column = TemporalHeatmapService.epoch_column(layer, temporal.time_field)
+        xs, ys, weights, ts = NativeHeatmapService.read_points(
+            layer, parameters, filter_expr=filter_expr, attributes=[column]
+        )
+        dated = np.isfinite(ts)
+        if not dated.any():
+            raise ValueError(f"Nenhum ponto com data/hora válida em '{temporal.time_field}'")
+        if not dated.all():
+            print(f"[CTCO] Série temporal: {int((~dated).sum())} pontos sem data ignorados")
+            xs, ys, ts = xs[dated], ys[dated], ts[dated]
+            weights = None if weights is None else weights[dated]
+        crs_wkt = layer.crs().toWkt()
+        if ProjectionService.needs_projection(layer, parameters):
+            xs, ys, crs_wkt = ProjectionService.to_local_metric(layer, xs, ys)
+            radius_mu, pixel_mu = float(parameters.radius), float(parameters.pixel_size)
+
+        # Grade e quadros fixados antes: a série inteira compartilha origem e pixel
+        t_first = float(ts.min()) if temporal.start_s is None else float(temporal.start_s)
+        t_last = float(ts.max()) if temporal.end_s is None else float(temporal.end_s)
+        if mode == TEMPORAL_STKDE:
+            starts = slice_times(t_first, t_last, temporal.step_s)
+        else:
+            starts = frame_starts(t_first, t_last, temporal.window_s, temporal.step_s)
+        return TemporalJob(
+            parameters=parameters,
+            temporal=temporal,
+            xs=xs,
+            ys=ys,
+            ts=ts,
+            weights=weights,
+            grid=KdeEngine.grid_for_points(xs, ys, radius_mu, pixel_mu),
+            radius=radius_mu,
+            kernel=normalize_kernel(parameters.kernel),
+            crs_wkt=crs_wkt,
+            starts=starts,
+            read_s=time.perf_counter() - start,
+            mode=mode,
+        )
+
+    @staticmethod
+    def execute(job: TemporalJob, output_path=None, progress=None) -> dict:
+        """Calcula os quadros e grava cada um numa banda (sem acessar a camada)."""
+        from ..kde.temporal import sliding_window_density
+        from .raster_writer import temporary_output_path, MultiBandGeoTiffWriter
+
+        if job.mode == TEMPORAL_STKDE:
+            return TemporalHeatmapService._execute_cube(job, output_path, progress)
+        start = time.perf_counter()
+        parameters, temporal = job.parameters, job.temporal
+        out_path = output_path or temporary_output_path("heatmap_serie")
+        frames = []
+        peak = 0.0
+        with MultiBandGeoTiffWriter(out_path, job.grid, len(job.starts), job.crs_wkt) as writer:
+            for index, t0, t1, count, density in sliding_window_density(
+                    job.xs, job.ys, job.ts, job.grid, job.radius, temporal.window_s, temporal.step_s,
+                    job.kernel, job.weights, parameters.output_value, parameters.decay,
+                    starts=job.starts, progress=progress):
+                writer.write_band(index + 1, density, f"{iso(t0)} / {iso(t1)}",
+                                  {'CTCO_START': iso(t0), 'CTCO_END': iso(t1), 'CTCO_POINTS': count})
+                frames.append({'band': index + 1, 'start': t0, 'end': t1, 'points': int(count)})
+                if density.size:
+                    peak = max(peak, float(density.max()))
+            writer.set_metadata({
+                'CTCO_TIME_FIELD': temporal.time_field,
+                'CTCO_WINDOW_S': temporal.window_s,
+                'CTCO_STEP_S': temporal.step_s,
+                'CTCO_MAX': peak,
+            })
+        print(f"[CTCO] Série temporal '{temporal.time_field}': {len(frames)} quadros, "
+              f"{job.xs.size} pontos, grade {job.grid.cols}x{job.grid.rows}, leitura {job.read_s:.2f}s, "
+              f"cálculo {time.perf_counter() - start:.2f}s")
+        return {'OUTPUT': out_path, 'frames': frames, 'max': peak}
+
+    @staticmethod
+    def _execute_cube(job: TemporalJob, output_path=None, progress=None) -> dict:
+        """Cubo STKDE: uma fatia por banda, intervalo [instante - passo/2, instante + passo/2)."""
+        from ..kde.stkde import space_time_density
+        from .raster_writer import temporary_output_path, MultiBandGeoTiffWriter
+
+        start = time.perf_counter()
+        parameters, temporal = job.parameters, job.temporal
+        bandwidth = temporal.temporal_bandwidth_s
+        half = temporal.step_s / 2.0
+        out_path = output_path or temporary_output_path("heatmap_stkde")
+        frames = []
+        peak = 0.0
+        with MultiBandGeoTiffWriter(out_path, job.grid, len(job.starts), job.crs_wkt) as writer:
+            for index, t, count, density in space_time_density(
+                    job.xs, job.ys, job.ts, job.grid, job.radius, bandwidth, job.starts,
+                    job.kernel, job.weights, parameters.output_value, parameters.decay,
+                    time_scale=temporal.unit_s, memory_budget_mb=parameters.memory_budget_mb,
+                    progress=progress):
+                writer.write_band(index + 1, density, iso(t),
+                                  {'CTCO_TIME': iso(t), 'CTCO_START': iso(t - half),
+                                   'CTCO_END': iso(t + half), 'CTCO_POINTS': count})
+                frames.append({'band': index + 1, 'start': t - half, 'end': t + half, 'points': count})
+                if density.size:
+                    peak = max(peak, float(density.max()))
+            writer.set_metadata({
+                'CTCO_TIME_FIELD': temporal.time_field,
+                'CTCO_MODE': TEMPORAL_STKDE,
+                'CTCO_BANDWIDTH_S': bandwidth,
+                'CTCO_STEP_S': temporal.step_s,
+                'CTCO_UNIT_S': temporal.unit_s,
+                'CTCO_MAX': peak,
+            })
+        print(f"[CTCO] STKDE '{temporal.time_field}': {len(frames)} fatias, {job.xs.size} pontos, "
+              f"grade {job.grid.cols}x{job.grid.rows}, banda temporal {bandwidth:g}s, "
+              f"leitura {job.read_s:.2f}s, cálculo {time.perf_counter() - start:.2f}s")
+        return {'OUTPUT': out_path, 'frames': frames, 'max': peak}
+
+    @staticmethod
+    def bind_temporal(raster_layer, frames) -> bool:
+        """
+        Liga as bandas da série ao controlador temporal do QGIS
+
+        Returns:
+            bool: True se a camada usa intervalo por banda (QGIS 3.38+); False no
+            modo de troca de banda pelo plugin
+        """
+        from qgis.core import Qgis, QgsDateTimeRange, QgsRasterLayerTemporalProperties
+        from qgis.PyQt.QtCore import QDateTime, Qt
+
+        def qdt(seconds):
+            return QDateTime.fromMSecsSinceEpoch(int(round(seconds * 1000)), Qt.UTC)
+
+        ranges = {int(f['band']): QgsDateTimeRange(qdt(f['start']), qdt(f['end']), True, False)
+                  for f in frames}
+        props = raster_layer.temporalProperties()
+        per_band = getattr(getattr(Qgis, "RasterTemporalMode", None), "FixedRangePerBand", None)
+        if per_band is not None and hasattr(props, "setFixedRangePerBand"):
+            props.setMode(per_band)
+            props.setFixedRangePerBand(ranges)
+            props.setIsActive(True)
+            return True
+
+        # Versões anteriores: intervalo da série inteira + troca da banda exibida
+        props.setMode(QgsRasterLayerTemporalProperties.ModeFixedTemporalRange)
+        props.setFixedTemporalRange(QgsDateTimeRange(qdt(frames[0]['start']), qdt(frames[-1]['end'])))
+        props.setIsActive(True)
+        TemporalHeatmapService._follow_controller(raster_layer, frames)
+        return False
+
+    @staticmethod
+    def band_at(frames, seconds: float):
+        """Banda do quadro que contém o instante (o último que começa antes dele)."""
+        starts = np.array([f['start'] for f in frames], dtype=np.float64)
+        index = int(np.searchsorted(starts, float(seconds), side="right")) - 1
+        if index < 0 or seconds >= frames[index]['end']:
+            return None
+        return int(frames[index]['band'])
+
+    @staticmethod
+    def _follow_controller(raster_layer, frames):
+        """Troca a banda exibida conforme o intervalo do controlador temporal."""
+        from qgis.utils import iface
+        from .color_service import ColorService
+
+        controller = iface.mapCanvas().temporalController()
+        layer_id = raster_layer.id()
+
+        def on_range(time_range):
+            try:
+                band = TemporalHeatmapService.band_at(frames, time_range.begin().toMSecsSinceEpoch() / 1000.0)
+                if band is not None and band != ColorService.active_band(raster_layer):
+                    ColorService.show_band(raster_layer, band)
+            except RuntimeError:
+                # Camada já removida do projeto
+                TemporalHeatmapService.unbind(layer_id)
+
+        controller.updateTemporalRange.connect(on_range)
+        TemporalHeatmapService._bindings[layer_id] = (controller, on_range)
+        raster_layer.willBeDeleted.connect(lambda: TemporalHeatmapService.unbind(layer_id))
+
+    @staticmethod
+    def unbind(layer_id):
+        binding = TemporalHeatmapService._bindings.pop(layer_id, None)
+        if binding is None:
+            return
+        controller, callback = binding
+        try:
+            controller.updateTemporalRange.disconnect(callback)
+        except (TypeError, RuntimeError):
+            pass
+
+    @staticmethod
+    def unbind_all():
+        for layer_id in list(TemporalHeatmapService._bindings):
+            TemporalHeatmapService.unbind(layer_id)
@@ -0,0 +1,217 @@
+"""
+Heatmap de exploração calculado só para a área visível do mapa
+
+Ideia central:
+- Os pontos são lidos uma vez (ordenados por x) e ficam em memória.
+- A cada pan/zoom (com atraso para agrupar movimentos seguidos) a densidade é
+  calculada apenas para a extensão do canvas, na resolução da tela.
+- O custo depende do tamanho da tela, não da extensão dos dados: o pixel nunca
+  fica menor que raio / MAX_FOOTPRINT_PX, o que limita o carimbo de cada ponto.
+
+O raster fica no CRS da camada de pontos (o QGIS reprojeta na exibição) e é
+regravado em um arquivo novo a cada atualização; a escala de cores acompanha
+o intervalo de densidade da área visível.
+"""
+
+import os
+
+import numpy as np
+
+from qgis.core import QgsCoordinateTransform, QgsProject, QgsRasterLayer
+from qgis.PyQt.QtCore import QObject, QTimer
+
+from .color_service import ColorService
+from .native_heatmap_service import NativeHeatmapService
+from .raster_writer import temporary_output_path, write_geotiff
+
+# Atraso (ms) após o último pan/zoom antes de recalcular
+DEBOUNCE_MS = 250
+# Maior raio do kernel em pixels da grade de exibição
+MAX_FOOTPRINT_PX = 256
+
+
+class ViewportHeatmap(QObject):
+    """Sessão que mantém um heatmap da área visível do canvas."""
+
+    def __init__(self, canvas, layer, parameters, config=None, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.layer = layer
+        self.parameters = parameters
+        self.config = config or {}
+        self.raster_layer = None
+        self._radius = None
+        self._kernel = 0
+        self._xs = self._ys = self._ws = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(DEBOUNCE_MS)
+        self._timer.timeout.connect(self.refresh)
+        self._connected = False
+
+    def start(self):
+        """Lê os pontos, calcula a primeira vista e passa a ouvir o canvas."""
+        from ..kde.kernels import normalize_kernel
+
+        self._radius, _ = self.parameters.to_map_units(self.layer)
+        self._kernel = normalize_kernel(self.parameters.kernel)
+        xs, ys, ws = NativeHeatmapService.read_points(
+            self.layer, self.parameters, filter_expr=self.config.get("filter_expr")
+        )
+        # Ordenados por x: a faixa visível sai por busca binária
+        order = np.argsort(xs, kind="stable")
+        self._xs, self._ys = xs[order], ys[order]
+        self._ws = None if ws is None else ws[order]
+        self.refresh()
+        self.canvas.extentsChanged.connect(self._schedule)
+        self._connected = True
+
+    def _schedule(self):
+        self._timer.start()
+
+    def view_grid(self):
+        """
+        Grade da área visível no CRS da camada
+
+        Returns:
+            KdeGrid: Origem no canto superior esquerdo da vista, pixel da tela
+            (limitado por raio / MAX_FOOTPRINT_PX)
+        """
+        from ..kde.grid import KdeGrid
+
+        extent = self.canvas.extent()
+        canvas_crs = self.canvas.mapSettings().destinationCrs()
+        layer_crs = self.layer.crs()
+        if canvas_crs.isValid() and layer_crs.isValid() and canvas_crs != layer_crs:
+            transform = QgsCoordinateTransform(canvas_crs, layer_crs, QgsProject.instance())
+            extent = transform.transformBoundingBox(extent)
+        width_px = max(1, int(self.canvas.width()))
+        height_px = max(1, int(self.canvas.height()))
+        pixel = max(extent.width() / width_px, extent.height() / height_px,
+                    float(self._radius) / MAX_FOOTPRINT_PX)
+        return KdeGrid(
+            x_min=extent.xMinimum(),
+            y_max=extent.yMaximum(),
+            pixel_size=pixel,
+            rows=max(1, int(np.ceil(extent.height() / pixel))),
+            cols=max(1, int(np.ceil(extent.width() / pixel))),
+        )
+
+    def compute(self, grid):
+        """Densidade da grade com os pontos que alcançam a vista."""
+        from ..kde.engine import ENGINE_FFT, ENGINE_NATIVE, KdeEngine
+        from ..kde.planner import plan_features
+        from .engine_planner_service import EnginePlanner
+
+        margin = float(self._radius) + grid.pixel_size
+        lo = np.searchsorted(self._xs, grid.x_min - margin, side="left")
+        hi = np.searchsorted(self._xs, grid.x_max + margin, side="right")
+        band_ys = self._ys[lo:hi]
+        mask = (band_ys >= grid.y_min - margin) & (band_ys <= grid.y_max + margin)
+        xs, ys = self._xs[lo:hi][mask], band_ys[mask]
+        weights = None if self._ws is None else self._ws[lo:hi][mask]
+
+        # Carimbos ou FFT pelo modelo de custo (FFT custa só o tamanho da tela)
+        features = plan_features(xs.size, grid.rows, grid.cols, self._radius, grid.pixel_size,
+                                 memory_budget_mb=self.parameters.memory_budget_mb)
+        engine = EnginePlanner.model().plan(features, (ENGINE_NATIVE, ENGINE_FFT)).engine
+        density = KdeEngine.compute(
+            xs, ys, grid, self._radius, kernel=self._kernel, weights=weights,
+            output_value=self.parameters.output_value, decay=self.parameters.decay, engine=engine,
+        )
+        return density, int(xs.size), engine
+
+    def refresh(self):
+        """Recalcula a vista atual e troca o arquivo da camada raster."""
+        import time
+
+        try:
+            start = time.perf_counter()
+            grid = self.view_grid()
+            density, n_points, engine = self.compute(grid)
+            path = write_geotiff(temporary_output_path("heatmap_view"), density, grid,
+                                 self.layer.crs().toWkt(), compress=False)
+            self._show(path)
+            print(f"[CTCO] Vista: {n_points} pontos, grade {grid.cols}x{grid.rows} ({engine}), "
+                  f"{time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"[CTCO] Falha ao atualizar heatmap da vista: {e}")
+
+    def _show(self, path):
+        """Carrega (ou troca a fonte de) a camada da vista e reaplica a paleta."""
+        name = f"Heatmap {self.layer.name()} (vista)"
+        old_path = None
+        if self.raster_layer is None:
+            self.raster_layer = QgsRasterLayer(path, name)
+            if not self.raster_layer.isValid():
+                self.raster_layer = None
+                return
+            QgsProject.instance().addMapLayer(self.raster_layer)
+            self.raster_layer.willBeDeleted.connect(self.detach)
+        else:
+            old_path = self.raster_layer.source()
+            self.raster_layer.setDataSource(path, name, "gdal")
+        try:
+            ColorService.apply_colormap(self.raster_layer,
+                                        name=self.config.get("palette", "BCYR"),
+                                        scale_mode=self.config.get("scale", "linear"))
+            self.raster_layer.setOpacity(max(0.0, min(100.0, float(self.config.get("transparent", 60)))) / 100.0)
+        except Exception as e:
+            print(f"Falha ao aplicar paleta na vista: {e}")
+        self.raster_layer.triggerRepaint()
+        if old_path and old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def detach(self):
+        """Para de acompanhar o canvas (a última vista permanece no projeto)."""
+        self._timer.stop()
+        if self._connected:
+            try:
+                self.canvas.extentsChanged.disconnect(self._schedule)
+            except Exception:
+                pass
+            self._connected = False
+        self.raster_layer = None
+        ViewportHeatmapService.forget(self)
+
+
+class ViewportHeatmapService:
+    """Registro das sessões de vista ativas (uma por camada de pontos)."""
+
+    _sessions = []
+
+    @staticmethod
+    def attach(layer, parameters, config=None):
+        """
+        Liga o heatmap da área visível para a camada
+
+        Returns:
+            ViewportHeatmap: Sessão criada (None se não houver canvas)
+        """
+        from qgis.utils import iface
+
+        if iface is None or not hasattr(iface, 'mapCanvas'):
+            return None
+        for session in list(ViewportHeatmapService._sessions):
+            if session.layer is layer:
+                session.detach()
+        session = ViewportHeatmap(iface.mapCanvas(), layer, parameters, config)
+        session.start()
+        ViewportHeatmapService._sessions.append(session)
+        print(f"[CTCO] Heatmap da vista ligado à camada '{layer.name()}'")
+        return session
+
+    @staticmethod
+    def forget(session):
+        try:
+            ViewportHeatmapService._sessions.remove(session)
+        except ValueError:
+            pass
+
+    @staticmethod
+    def detach_all():
+        for session in list(ViewportHeatmapService._sessions):
+            session.detach()
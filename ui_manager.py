@@ -144,6 +144,28 @@ class UIManager:
     
     def cleanup_ui(self):
         """Remove a interface do usuário"""
+        # Desligar heatmaps ao vivo (evita slots apontando para o plugin descarregado)
+        try:
+            from .services.live_heatmap_service import LiveHeatmapService
+            LiveHeatmapService.detach_all()
+        except Exception:
+            pass
+        try:
+            from .services.viewport_heatmap_service import ViewportHeatmapService
+            ViewportHeatmapService.detach_all()
+        except Exception:
+            pass
+        # Heatmaps em segundo plano: cancelar antes de o código do plugin sair da memória
+        try:
+            from .services.heatmap_task_service import HeatmapTaskService
+            HeatmapTaskService.cancel_all()
+        except Exception:
+            pass
+        try:
+            from .services.temporal_heatmap_service import TemporalHeatmapService
+            TemporalHeatmapService.unbind_all()
+        except Exception:
+            pass
         if self.toolbar_widget_action:
             try:
                 self.iface.removeToolBarIcon(self.toolbar_widget_action)